@@ -0,0 +1,148 @@
+##################################################################################
+# Runs bandwidthTest --htod on every GPU of the node, in parallel where the GPUs
+# do not share a PCIe link.
+# GPUs are grouped by the PCIe switch (or root port) above them, or by NUMA node:
+# the GPUs of a group are tested one after another, the groups run at the same
+# time. Each test runs on the CPUs of the NUMA node of its GPU, so the pinned host
+# buffer is allocated next to the GPU.
+# The topology comes from /proc/driver/nvidia/gpus and sysfs. When it cannot be
+# read, all the GPUs are tested one after another, as in the serial mode.
+# The sum of the durations of the tests is reported with the wall time, it is the
+# time the serial run would take.
+##################################################################################
+import os
+import re
+import subprocess
+import threading
+import time
+
+PROG = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bandwidthTest')
+NVIDIA_GPUS = '/proc/driver/nvidia/gpus'
+PCI_DEVICES = '/sys/bus/pci/devices'
+NUMA_NODES = '/sys/devices/system/node'
+
+SERIAL = 'serial'
+NUMA = 'numa'
+SWITCH = 'switch'
+MODES = (SERIAL, NUMA, SWITCH)
+
+# bandwidthTest --csv: "bandwidthTest-H2D-Pinned, Bandwidth = 24.6 GB/s, Time = 0.00136 s, ..."
+BANDWIDTH = re.compile(r'Bandwidth = ([\d.]+) GB/s')
+
+ALLOWED_CPUS = os.sched_getaffinity(0)
+
+
+class GPU:
+    def __init__(self, index, bus_id):
+        self.index = index
+        self.bus_id = bus_id
+        self.numa_node = -1
+        self.switch = ''
+        self.cpus = None
+        if bus_id == '':
+            return
+        device = os.path.join(PCI_DEVICES, bus_id)
+        try:
+            with open(os.path.join(device, 'numa_node')) as f:
+                self.numa_node = int(f.read())
+            # .../<switch upstream port>/<switch downstream port>/<gpu>, or the root complex when there is no switch
+            self.switch = os.path.dirname(os.path.dirname(os.path.realpath(device)))
+        except (OSError, ValueError):
+            pass
+        if self.numa_node >= 0:
+            self.cpus = numa_cpus(self.numa_node)
+
+
+def numa_cpus(node):
+    # cpulist is e.g. "0-23,48-71"
+    try:
+        with open(os.path.join(NUMA_NODES, 'node' + str(node), 'cpulist')) as f:
+            cpulist = f.read().strip()
+    except OSError:
+        return None
+    cpus = set()
+    for part in cpulist.split(','):
+        if '-' in part:
+            first, last = part.split('-')
+            cpus.update(range(int(first), int(last) + 1))
+        elif part:
+            cpus.add(int(part))
+    return cpus or None
+
+
+def list_gpus():
+    '''
+    Returns the GPUs in PCI bus order, which is the order of the CUDA devices with
+    CUDA_DEVICE_ORDER=PCI_BUS_ID. When the driver does not list them, the /dev/nvidiaN
+    devices are counted and the GPUs have no topology.
+    '''
+    try:
+        bus_ids = sorted(os.listdir(NVIDIA_GPUS))
+        return [GPU(index, bus_id.lower()) for index, bus_id in enumerate(bus_ids)]
+    except OSError:
+        pass
+    try:
+        count = len([d for d in os.listdir('/dev') if re.fullmatch(r'nvidia\d+', d)])
+    except OSError:
+        count = 0
+    return [GPU(index, '') for index in range(count)]
+
+
+def group_gpus(gpus, mode):
+    if mode == SERIAL:
+        return [gpus]
+    groups = {}
+    for gpu in gpus:
+        key = gpu.numa_node if mode == NUMA else gpu.switch
+        groups.setdefault(key, []).append(gpu)
+    # without topology every GPU has the same key, i.e. serial
+    return list(groups.values())
+
+
+def run_test(gpu, prog=PROG):
+    '''
+    Runs bandwidthTest on one GPU. Returns the bandwidth in GB/s (None when it is not
+    in the output), the output and the duration of the test in seconds.
+    '''
+    env = dict(os.environ, CUDA_DEVICE_ORDER='PCI_BUS_ID')
+    # only the calling thread is pinned, and the test inherits its affinity.
+    # The CPUs of the node may not all be in the cpuset of the container
+    cpus = (gpu.cpus or set()) & ALLOWED_CPUS
+    os.sched_setaffinity(0, cpus or ALLOWED_CPUS)
+
+    start = time.time()
+    try:
+        proc = subprocess.run([prog, '--htod', '--memory=pinned', '--device=' + str(gpu.index), '--csv'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env, text=True)
+        output = proc.stdout
+    except OSError as e:
+        output = 'error: ' + str(e)
+    duration = time.time() - start
+    match = BANDWIDTH.search(output)
+    return (float(match.group(1)) if match else None), output, duration
+
+
+def run_tests(gpus, mode=SWITCH, prog=PROG):
+    '''
+    Runs the test of every GPU, the groups of GPUs in parallel.
+
+    Returns a dict with, by GPU index, the bandwidth, output and duration of its test,
+    the groups (lists of GPU indexes) and the wall time of the whole run.
+    '''
+    results = {}
+    groups = group_gpus(gpus, mode)
+
+    def run_group(group):
+        for gpu in group:
+            results[gpu.index] = run_test(gpu, prog)
+
+    start = time.time()
+    threads = [threading.Thread(target=run_group, args=(group,)) for group in groups]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {
+        'results': dict(sorted(results.items())),
+        'groups': [[gpu.index for gpu in group] for group in groups],
+        'wall_time': time.time() - start,
+    }
@@ -1,40 +1,71 @@
 import argparse
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+from checkresult import CheckResult, SUCCESS, FAIL, ABORT
+from preflight import briefings
+from bandwidth_runner import list_gpus, run_tests, MODES, SWITCH
 
 
 def main():
     
     parser = argparse.ArgumentParser()
     parser.add_argument('-t', '--threshold', type=str, default='4')
+    parser.add_argument('-m', '--mode', type=str, default=SWITCH, choices=MODES, help='GPUs tested at the same time: one per PCIe switch, one per NUMA node, or one at a time (serial). Default is switch.')
+    parser.add_argument('--json', action='store_true', help='Print a single JSON result record instead of free text.')
     args = parser.parse_args()
-    output = os.popen('bash ./utils/briefings.sh')
-    result = output.read()
+    res = CheckResult('pciebw', unit='GB/s')
+    with res.capture(args.json):
+        run_check(args, res)
+
+
+def run_check(args, res):
+    result = briefings()
     # print(result)
 
     if "ABORT" not in result:
         print("[[ PCIEBW ]] Briefings completed. Continue with PCIe Bandwidth evaluation.")
-        output = os.popen('./gpu-bw/gpuLocalBandwidthTest.sh -t ' + args.threshold)
-        result = output.read()
+        print("Threshold: " + args.threshold)
+        gpus = list_gpus()
+        if not gpus:
+            print("No NVIDIA GPU detected. Skipping the bandwidth test.")
+            print("[[ PCIEBW ]] ABORT")
+            res.set_status(ABORT, "PCIe bandwidth test cannot be run")
+            exit()
+        print("Detected NVIDIA GPU: " + " ".join(str(gpu.index) for gpu in gpus) + " Total: " + str(len(gpus)))
 
-        if "ABORT" in result or "SKIP" in result:
+        run = run_tests(gpus, args.mode)
+        outputs = "\n".join(output for _, output, _ in run['results'].values())
+        if "802" in outputs or "error" in outputs.lower():
+            print("CRITICAL ERROR WITH GPUs")
             print("[[ PCIEBW ]] ABORT")
-            print(result)
+            print(outputs)
+            res.set_status(ABORT, "PCIe bandwidth test cannot be run")
             exit()
 
         print("SUCCESS")
         print("Host ", os.getenv("NODE_NAME"))
-        splitres = result.split("\n")
         bws = ""
-        for line in splitres:
-            if "Bandwidth =" in line:
-                x = line.split("= ", 2)
-                y = x[1].split(" GB/s")
-                bws += y[0] + " "
+        for index, (bw, _, _) in run['results'].items():
+            if bw is None:
+                continue
+            bws += str(bw) + " "
+            res.add_value(index, bw)
         print(bws.strip())
+        serial = sum(duration for _, _, duration in run['results'].values())
+        print("GPU groups (" + args.mode + "): " + " ".join(",".join(str(i) for i in group) for group in run['groups']))
+        print("Wall time: %.2fs, serial (sum of the tests): %.2fs" % (run['wall_time'], serial))
+        low = [v['device'] for v in res.values if v['value'] < float(args.threshold)]
+        if low:
+            res.set_status(FAIL, "Bandwidth below " + args.threshold + " GB/s on GPU(s) " + ",".join(low))
+        else:
+            res.set_status(SUCCESS)
     else:
         print("[[ PCIEBW ]] ABORT")
         print(result)
+        res.set_status(ABORT, "Briefings failed")
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -4,65 +4,56 @@ import os
 import argparse
 import re
 import datetime
-from kubernetes import client, config
-from kubernetes.client.rest import ApiException
+import sys
+from typing import List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+from checkresult import CheckResult, SUCCESS, FAIL, ABORT, ERR
+from preflight import briefings
 
-config.load_incluster_config()
-v1 = client.CoreV1Api()
 nodename = os.getenv("NODE_NAME")
 
 parser = argparse.ArgumentParser()
 parser.add_argument('-r', '--run', type=str, default='1')
 parser.add_argument('-l', '--label_node', action='store_true')
 parser.add_argument('-v', '--verbose', action='store_true')
-args = parser.parse_args()
+parser.add_argument('--json', action='store_true', help='Print a single JSON result record instead of free text.')
 
 def main():
-    output = os.popen('bash ./utils/briefings.sh')
-    result = output.read()
+    res = CheckResult('dcgm')
+    with res.capture(args.json):
+        run_check(res)
+
+def run_check(res):
+    result = briefings()
     print(result)
     
     if "ABORT" not in result:
         print("[[ DCGM ]] Briefings completed. Continue with dcgm evaluation.")
         command = ['dcgmi', 'diag', '-j', '-r', args.run]
-        try_dcgm(command,args.run)
+        try_dcgm(command,args.run,res)
     else:
         print("[[ DCGM ]] ABORT")
         print(result)
+        res.set_status(ABORT, "Briefings failed")
 
 
 # translate key-strings into lowercase and strip spaces
-def unify_string_format(key: str) -> str:
-    to_lower = key.strip().lower()
-    res, _ = re.subn('[\/|\s]', '_', to_lower)
-    return res
+_SEPARATORS = re.compile(r'[/|\s]')
+DCGM_TOP_LEVEL = 'dcgm_gpu_diagnostic'
 
-def parse_all_results(result: str):
-    dcgm_dict = json.loads(result)
-    tests_dict = dcgm_dict['DCGM GPU Diagnostic']['test_categories']
-    success = True
-    output = ""
-    for category in tests_dict:
-        for test in category['tests']:
-            test_failing=False
-            for result in test['results']:
-                if result['status'] == 'Fail':
-                    success = False
-                    if test_failing is False:
-                        output += f'{unify_string_format(test["name"])}'
-                        test_failing = True
-                    output += f'{"." + str(result["gpu_id"]) if "gpu_id" in result else "NoGPUid"}'
-    return success, output
+def unify_string_format(key) -> str:
+    return _SEPARATORS.sub('_', str(key).strip().lower())
 
 
 # parsing the json result string based on a comma-separated list of paths (levels separated by '.')
-def parse_selected_results(result: str, testpaths: str):
+def compile_paths(testpaths: str):
     '''
-    follow the list of selected paths down the dcgm json tree
+    compile the list of selected paths into a lookup table, once per run
 
     the specification of the paths: <top_level>.<category>.<name>
 
-    to walk down this example json snippet below your path should be:
+    to select the test of the example json snippet below your path should be:
 
        'DCGM GPU Diagnostic.Hardware.GPU Memory'
 
@@ -85,112 +76,108 @@ def parse_selected_results(result: str, testpaths: str):
 
     The paths need to be specified in env variable AUTOPILOT_DCGM_RESULT_PATHS as a comma-separated list
     If the variable is not set, then the regular scan is performed
+
+    returns the list of (path, key) in the order of the paths and the set of keys, a key
+    being (category, name) in the unified format, or None for a path that cannot match any test
+    '''
+    paths = []
+    for path in testpaths.split(','):
+        levels = [unify_string_format(p) for p in path.split('.')]
+        key = tuple(levels[1:]) if len(levels) == 3 and levels[0] == DCGM_TOP_LEVEL else None
+        paths.append((path, key))
+    return paths, {key for _, key in paths if key}
+
+def dcgm_categories(result: str):
+    dcgm_dict = json.loads(result)
+    # the top level key is unified as well, for the paths
+    for key, val in dcgm_dict.items():
+        if unify_string_format(key) == DCGM_TOP_LEVEL:
+            return val['test_categories']
+    raise KeyError('DCGM GPU Diagnostic')
+
+
+# browses the result section of a single test and extracts info
+def parse_single_test_result(data) -> Tuple[bool, list]:
+    if not data:
+        return False, [("No Data",)]
+    if not isinstance(data, list):
+        data = [data]
+
+    success = True
+    output = []
+    for entry in data:
+        if "status" in entry:
+            good = (unify_string_format(entry['status']) == 'pass')
+            success &= good
+            if not good:
+                output.append( (
+                    entry["gpu_id"] if "gpu_id" in entry else "NoGPU_ID",
+                    entry["info"] if "info" in entry else "NoInfo"
+                ))
+        else:
+            success &= False
+            output.append( ("No Status",) )
+    return success,output
+
+
+# create output from the parsed results (can be adjusted to whatever)
+def build_output(output_list: List[Tuple[str, list]]) -> str:
+    output = ""
+    for test,result in output_list:
+        if len(output):
+            output += ";"
+        output += f'{unify_string_format(test)}:'
+        for result_data in result:
+            for r in result_data:
+                output += f'{unify_string_format(r)},'
+    return output
+
+
+def parse_results(result: str, compiled=None):
+    '''
+    single pass over the dcgm json tree, each test result is visited at most once
+
+    without compiled paths, every failing result is reported as <test>.<gpu_id>
+    with the paths of compile_paths, only the selected tests are checked, and the first
+    test matching each path is reported as <path>:<gpu_id>,<info>,... when it fails
     '''
-    _dcgm_json_levels = [
-        ("top_level","dcgm_gpu_diagnostic"),
-        ("category","tests"),
-        ("name","results")
-    ]
-
-
-    # scan the dictionary and recursively transform all keys using key_update
-    def normalize_json_keys(data) -> dict:
-        ndata = {}
-        if not isinstance(data, dict) and not isinstance(data, list):
-            return data
-        for key,val in data.items():
-            key_n = unify_string_format(key)
-
-            if isinstance(val, dict):
-                val_n = normalize_json_keys(data[key])
-            elif isinstance(val, list):
-                val_n = [ normalize_json_keys(v) for v in val ]
-            else:
-                val_n = data[key]
-
-            ndata[ key_n ] = val_n
-
-        # unfortunately, the top level of dcgm dict is structured differently from the rest,
-        # adjusting by inserting/moving it's sub-dict into top-level and rename
-        if _dcgm_json_levels[0][1] in ndata:
-            ndata[_dcgm_json_levels[0][0]] = _dcgm_json_levels[0][1] # replace old dcgm_gpu_diagnostics with  'top_level' as a name
-            ndata[_dcgm_json_levels[0][1]] = ndata[_dcgm_json_levels[0][1]].pop("test_categories") # move test_categories entry to new 'top_level'
-        return ndata
-
-
-    # recursively dive into the json tree by following a given path
-    def dive_to_test(data, jpath: list[str], depth: int):
-        assert( 3-len(jpath) == depth )
-        assert( depth < 3 )
-
-        jlevel_spec = _dcgm_json_levels[depth]
-
-        if not isinstance(data, list):
-            data = [data]
-        for entry in data:
-            if jlevel_spec[0] in entry and jpath[0] == unify_string_format( entry[jlevel_spec[0]] ):
-                if depth == 2:
-                    return entry[ jlevel_spec[1] ]
-                else:
-                    return dive_to_test( entry[ jlevel_spec[1] ], jpath[1:], depth+1 )
-        return
-
-    # browses the result section of a single test and extracts info
-    def parse_single_test_result(data) -> tuple[bool, str]:
-        if not data:
-            return False, "No Data"
-        if not isinstance(data, list):
-            data = [data]
-
-        success = True
-        output = []
-        for entry in data:
-            if "status" in entry:
-                good = (unify_string_format(entry['status']) == 'pass')
-                success &= good
-                if not good:
-                    output.append( (
-                        entry["gpu_id"] if "gpu_id" in entry else "NoGPU_ID",
-                        entry["info"] if "info" in entry else "NoInfo"
-                    ))
-            else:
-                success &= False
-                output.append( ("No Status") )
-        return success,output
-
-    # create output from the parsed results (can be adjusted to whatever)
-    def build_output(output_list: tuple[str, str]) -> str:
-        print(output_list)
-        output = ""
-        for test,result in output_list:
-            if len(output):
-                output += ";"
-            output += f'{unify_string_format(test)}:'
-            for result_data in result:
-                for r in result_data:
-                    output += f'{unify_string_format(r)},'
-        return output
-
-    jdata = json.load(result)
-    norm_d = normalize_json_keys(jdata)
+    success = True
+    output = ""
+    selected = {}
+    for category in dcgm_categories(result):
+        category_name = unify_string_format(category.get('category', '')) if compiled else None
+        for test in category.get('tests', []):
+            if compiled:
+                key = (category_name, unify_string_format(test.get('name', '')))
+                if key in compiled[1] and key not in selected:
+                    selected[key] = test.get('results')
+                continue
+            test_failing = False
+            for entry in test['results']:
+                if entry['status'] == 'Fail':
+                    success = False
+                    if test_failing is False:
+                        output += f'{unify_string_format(test["name"])}'
+                        test_failing = True
+                    output += f'{"." + str(entry["gpu_id"]) if "gpu_id" in entry else "NoGPUid"}'
+    if not compiled:
+        return success, output
 
     result_list = []
-    overall_success = True
-    for path in testpaths.split(','):
-        single_test_result = dive_to_test( norm_d, [ unify_string_format(p) for p in path.split('.') ], 0 )
-        test_success,output = parse_single_test_result(single_test_result)
-        overall_success &= test_success
+    for path, key in compiled[0]:
+        test_success, test_output = parse_single_test_result(selected.get(key))
+        success &= test_success
         if not test_success:
-            result_list.append( (path, output) )
-    return overall_success, build_output(result_list)
-
+            result_list.append( (path, test_output) )
+    return success, build_output(result_list)
 
 
-def try_dcgm(command,run_level):
+def try_dcgm(command,run_level,res):
     result = subprocess.run(command, text=True, capture_output=True)
     return_code = result.returncode  # 0 for success
     if return_code != 0:
         print("[[ DCGM ]] DCGM process terminated with errors. Other processes might be running on GPUs. ABORT")
+        res.set_status(ABORT, "dcgmi diag terminated with errors")
         command = ['nvidia-smi', '--query-gpu=utilization.gpu', '--format=csv']
         try:
             proc = subprocess.run(command, check=True, text=True, capture_output=True)
@@ -203,22 +190,41 @@ def try_dcgm(command,run_level):
     if result.stderr:
        print(result.stderr)
        print("[[ DCGM ]] exited with error: " + result.stderr + " ERR")
+       if res.status != ABORT:
+           res.add_value('', 1.0)
+           res.set_status(ERR, result.stderr.strip())
     else:
         testpaths = os.getenv("AUTOPILOT_DCGM_RESULT_PATHS")
         if args.verbose:
             print(result.stdout)
-        if testpaths == None:
-            success, output = parse_all_results(result.stdout)
+        try:
+            success, output = parse_results(result.stdout, compile_paths(testpaths) if testpaths else None)
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            print("[[ DCGM ]] Cannot parse the dcgmi diag output: " + repr(e) + " ERR")
+            if res.status != ABORT:
+                res.add_value('', 1.0)
+                res.set_status(ERR, "Cannot parse the dcgmi diag output")
+            return
         if success:
             print("[[ DCGM ]] SUCCESS")
         else:
             print("Host", nodename)
+            print(output)
             print("[[ DCGM ]] FAIL")
+        if res.status != ABORT:
+            res.add_value('', 0.0 if success else 1.0)
+            res.set_status(SUCCESS if success else FAIL, output)
         if args.label_node:
             patch_node(success, output,run_level)
 
 
 def patch_node(success, output,run_level):
+    # the kubernetes client is only needed to label the node
+    from kubernetes import client, config
+    from kubernetes.client.rest import ApiException
+    config.load_incluster_config()
+    v1 = client.CoreV1Api()
+
     now = datetime.datetime.now(datetime.timezone.utc)
     timestamp = now.strftime("%Y-%m-%d_%H.%M.%SUTC")
     result = ""
@@ -264,4 +270,6 @@ def patch_node(success, output,run_level):
         exit()
 
 if __name__ == '__main__':
+    # parsed here, so that hack/bench_dcgm_parser.py can import the parser
+    args = parser.parse_args()
     main()
@@ -1,8 +1,21 @@
+import argparse
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+from checkresult import CheckResult, SUCCESS, FAIL
+from preflight import briefings
 
 def main():
-    output = os.popen('bash ./utils/briefings.sh')
-    result = output.read()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--json', action='store_true', help='Print a single JSON result record instead of free text.')
+    args = parser.parse_args()
+    res = CheckResult('gpumem')
+    with res.capture(args.json):
+        run_check(res)
+
+def run_check(res):
+    result = briefings()
 
     if "ABORT" not in result:
         print("[[ GPU-MEM ]] Briefings completed. Continue with memory evaluation.")
@@ -10,11 +23,15 @@ def main():
         result = output.read()
         if "NONE" in result:
             print("[[ GPU-MEM ]] Health Check successful")
+            res.add_value(0, 0.0)
+            res.set_status(SUCCESS)
             exit()
 
     print("[[ GPU-MEM ]] Health Check unsuccessful. FAIL.")
     print(result)
+    res.add_value(0, 1.0)
+    res.set_status(FAIL, "DGEMM/DAXPY check unsuccessful")
     exit()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,72 @@
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+from checkresult import CheckResult, SUCCESS, FAIL, ABORT, ERR
+from preflight import briefings
+from gpuinfo import collect
+from gpusampler import window_since_last
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--json', action='store_true', help='Print a single JSON result record instead of free text.')
+    parser.add_argument('--periodic', action='store_true', help='Periodic run: the next run reports the GPU samples taken from now on.')
+    args = parser.parse_args()
+    res = CheckResult('gpupower')
+    with res.capture(args.json):
+        run_check(res, args.periodic)
+
+
+def run_check(res, periodic):
+    result = briefings()
+    if "ABORT" in result:
+        print(result.strip())
+        print("[[GPU POWER]] ABORT")
+        res.set_status(ABORT, "Briefings failed")
+        return
+    print("[[GPU POWER]] Briefings completed. Continue with power cap evaluation.")
+
+    try:
+        gpus = collect()
+    except RuntimeError as e:
+        print("[GPU POWER] ERR", e)
+        res.set_status(ERR, str(e))
+        return
+    if not gpus:
+        print("[GPU POWER] No NVIDIA GPU detected. Skipping the Power Throttle check.")
+        print("ABORT")
+        res.set_status(ABORT, "No NVIDIA GPU detected")
+        return
+    print("[GPU POWER] Detected NVIDIA GPU: " + " ".join(str(gpu['index']) for gpu in gpus) + " Total: " + str(len(gpus)))
+
+    # samples of the GPU sampler since the previous periodic run, empty when it is not running
+    window = window_since_last('gpupower', periodic)
+
+    # one 0/1 flag per GPU, 1 when the hardware slows the clocks down (HW slowdown), now or since the previous periodic run
+    for n, gpu in enumerate(gpus):
+        stats = {reason: float(active) for reason, active in gpu['throttle'].items() if active is not None}
+        for k, v in gpu['power'].items():
+            if v is not None:
+                stats['power_' + k] = float(v)
+        sampled = window.get(n, {})
+        stats.update({'window_' + k: v for k, v in sampled.items() if not k.startswith('ecc_') and not k.startswith('remapped_')})
+        slowdown = gpu['throttle']['hw_slowdown'] or sampled.get('hw_slowdown_seconds', 0) > 0
+        res.add_value(gpu['index'], 1.0 if slowdown else 0.0, stats)
+        print("[GPU POWER] GPU %s: power draw %s W, limit %s W, active throttle reasons: %s" % (gpu['index'], gpu['power']['draw'], gpu['power']['limit'], ",".join(r for r, active in gpu['throttle'].items() if active) or "none"))
+        if sampled:
+            print("[GPU POWER] GPU %s since the previous periodic run (%d samples): max power %.1f W, HW slowdown %.1f s (longest %.1f s)" % (gpu['index'], sampled['samples'], sampled.get('power_max', float('nan')), sampled['hw_slowdown_seconds'], sampled['hw_slowdown_max_seconds']))
+
+    slowdown = [v['device'] for v in res.values if v['value'] > 0]
+    if slowdown:
+        print("[GPU POWER] FAIL")
+        res.set_status(FAIL, "HW slowdown active or sampled since the previous periodic run on GPU(s) " + ",".join(slowdown))
+    else:
+        print("[GPU POWER] SUCCESS")
+        res.set_status(SUCCESS)
+    print(" ".join(str(int(v['value'])) for v in res.values))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,27 +1,67 @@
+import argparse
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+from checkresult import CheckResult, SUCCESS, FAIL, ABORT, SKIP, ERR
+from preflight import briefings
+from gpuinfo import collect
+from gpusampler import window_since_last
 
 
 def main():
-    output = os.popen('bash ./utils/briefings.sh')
-    result = output.read()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--json', action='store_true', help='Print a single JSON result record instead of free text.')
+    parser.add_argument('--periodic', action='store_true', help='Periodic run: the next run reports the GPU samples taken from now on.')
+    args = parser.parse_args()
+    res = CheckResult('remapped')
+    with res.capture(args.json):
+        run_check(res, args.periodic)
+
+
+def run_check(res, periodic):
+    result = briefings()
     print(result)
 
     if "ABORT" not in result:
         print("[[ REMAPPED ROWS ]] Briefings completed. Continue with remapped rows evaluation.")
-        output = os.popen('./gpu-remapped/remapped-rows.sh')
-        result = output.read()
-        if "FAIL" not in result:
+        try:
+            gpus = collect()
+        except RuntimeError as e:
+            print("[[ REMAPPED ROWS ]] ERR", e)
+            res.set_status(ERR, str(e))
+            return
+        if not gpus:
+            print("No NVIDIA GPU detected. Skipping the Remapped Rows check.")
+            res.set_status(SKIP, "No NVIDIA GPU detected")
+            return
+        print("Detected NVIDIA GPU: " + " ".join(str(gpu['index']) for gpu in gpus) + " Total: " + str(len(gpus)))
+        # samples of the GPU sampler since the previous periodic run, empty when it is not running
+        window = window_since_last('remapped', periodic)
+        # one 0/1 flag per GPU, 1 when a row remapping is pending
+        for n, gpu in enumerate(gpus):
+            remapped = gpu['remapped']
+            stats = {k: float(v) for k, v in remapped.items() if k != 'pending' and v is not None}
+            stats.update({'ecc_' + k: float(v) for k, v in gpu['ecc'].items() if v is not None})
+            sampled = window.get(n, {})
+            stats.update({'window_' + k: v for k, v in sampled.items() if k == 'samples' or k.startswith('ecc_') or k.startswith('remapped_')})
+            res.add_value(gpu['index'], 1.0 if remapped['pending'] else 0.0, stats)
+            if sampled.get('ecc_uncorrected_delta') or sampled.get('remapped_uncorrectable_delta'):
+                print("GPU %s since the previous periodic run: %d uncorrected ECC errors, %d new uncorrectable remapped rows" % (gpu['index'], sampled.get('ecc_uncorrected_delta', 0), sampled.get('remapped_uncorrectable_delta', 0)))
+        flags = " ".join(str(int(v['value'])) for v in res.values)
+        pending = [v['device'] for v in res.values if v['value'] > 0]
+        if not pending:
             print("[[ REMAPPED ROWS ]] SUCCESS")
+            res.set_status(SUCCESS)
         else:
             print("[[ REMAPPED ROWS ]] FAIL")
-            print("Host ", os.getenv("NODE_NAME"))
-            print(result.strip())
-            return 0
+            res.set_status(FAIL, "Remapped rows pending on GPU(s) " + ",".join(pending))
         print("Host ", os.getenv("NODE_NAME"))
-        print(result.strip())
+        print(flags)
     else:
         print("[[ REMAPPED ROWS ]] ABORT")
         print(result.strip())
+        res.set_status(ABORT, "Briefings failed")
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,78 @@
+##################################################################################
+# Benchmark for utils/checkworker.py.
+# Runs the same entrypoint N times as a new python3 process (cold exec, the previous
+# behavior of the daemon) and N times through a running worker (warm dispatch), and
+# reports the mean, p50 and max latency of both.
+# The default entrypoint only imports the modules preloaded by the worker, so the
+# numbers isolate interpreter and import startup from the cost of a real check.
+# Usage (from autopilot-daemon/): python3 hack/bench_check_worker.py --runs 20
+##################################################################################
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+import checkworker
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--runs', type=int, default=20, help='Number of runs in each mode. Default is 20.')
+parser.add_argument('--script', type=str, default='', help='Entrypoint to run. Default is a stub importing the preloaded modules.')
+parser.add_argument('--args', type=str, default='', help='Space separated arguments for the entrypoint.')
+args = vars(parser.parse_args())
+
+STUB_ENTRYPOINT = '''
+import importlib
+for module in %r:
+    try:
+        importlib.import_module(module)
+    except ImportError:
+        pass
+print("[[ STUB ]] SUCCESS")
+''' % (checkworker.PRELOAD_MODULES,)
+
+
+def cold(script, script_args):
+    start = time.perf_counter()
+    subprocess.run(['python3', script] + script_args, capture_output=True, check=False)
+    return time.perf_counter() - start
+
+
+def warm(socket_path, script, script_args):
+    start = time.perf_counter()
+    checkworker.dispatch(socket_path, script, script_args)
+    return time.perf_counter() - start
+
+
+def report(name, samples):
+    ms = sorted(s * 1000 for s in samples)
+    print(f"{name:<16} mean: {statistics.mean(ms):9.1f} ms   p50: {statistics.median(ms):9.1f} ms   max: {ms[-1]:9.1f} ms")
+    return statistics.mean(ms)
+
+
+if __name__ == "__main__":
+    tmpdir = tempfile.mkdtemp()
+    script = args['script']
+    if script == '':
+        script = os.path.join(tmpdir, 'stub_entrypoint.py')
+        with open(script, 'w') as f:
+            f.write(STUB_ENTRYPOINT)
+    script_args = args['args'].split()
+    socket_path = os.path.join(tmpdir, 'worker.sock')
+
+    start = time.perf_counter()
+    worker = subprocess.Popen(['python3', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils', 'checkworker.py'), '--socket', socket_path], stderr=subprocess.DEVNULL)
+    while not os.path.exists(socket_path):
+        time.sleep(0.01)
+    print(f"Worker startup (one time): {(time.perf_counter() - start) * 1000:.1f} ms\n")
+
+    try:
+        cold_mean = report('cold exec', [cold(script, script_args) for _ in range(args['runs'])])
+        warm_mean = report('warm dispatch', [warm(socket_path, script, script_args) for _ in range(args['runs'])])
+        print(f"\nSpeedup: {cold_mean / warm_mean:.1f}x")
+    finally:
+        worker.terminate()
+        worker.wait()
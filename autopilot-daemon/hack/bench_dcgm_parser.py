@@ -0,0 +1,183 @@
+##################################################################################
+# Benchmark for the dcgmi diag result parser of gpu-dcgm/entrypoint.py.
+# Builds a synthetic `dcgmi diag -j` report of the given run level and number of
+# GPUs, with a few failing results, and parses it with the previous parser (full
+# normalized copy of the tree, then one walk per selected path) and with the
+# single-pass parser, in both modes: all the results, and the paths selected with
+# AUTOPILOT_DCGM_RESULT_PATHS. Reports the mean time of both and checks that they
+# agree on the verdict and on the output.
+# Usage (from autopilot-daemon/): python3 hack/bench_dcgm_parser.py --gpus 8 64 512 --level 4
+##################################################################################
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'gpu-dcgm'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+import entrypoint
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--gpus', type=int, nargs='+', default=[8, 64, 512], help='Numbers of GPUs in the reports. Default is 8 64 512.')
+parser.add_argument('--level', type=int, default=4, choices=[3, 4], help='dcgmi diag run level of the reports. Default is 4.')
+parser.add_argument('--runs', type=int, default=20, help='Number of parses of each report. Default is 20.')
+parser.add_argument('--failures', type=int, default=3, help='Number of failing results in each report. Default is 3.')
+args = vars(parser.parse_args())
+
+CATEGORIES = [
+    ('Deployment', ['Denylist', 'NVML Library', 'CUDA Main Library', 'Permissions and OS Blocks', 'Persistence Mode', 'Environment Variables', 'Page Retirement/Row Remap', 'Graphics Processes', 'Inforom']),
+    ('Integration', ['PCIe']),
+    ('Hardware', ['GPU Memory', 'Diagnostic']),
+    ('Stress', ['SM Stress', 'Targeted Stress', 'Targeted Power', 'Memory Bandwidth']),
+]
+LEVEL4_TESTS = ['Memtest', 'Pulse Test', 'EUD']
+
+PATHS = 'DCGM GPU Diagnostic.Hardware.GPU Memory,dcgm_gpu_diagnostic.integration.pcie,DCGM GPU Diagnostic.Stress.Targeted Power,DCGM GPU Diagnostic.Stress.Memtest'
+
+
+def report(gpus, level, failures):
+    random.seed(gpus)
+    categories = [(c, list(t)) for c, t in CATEGORIES]
+    if level == 4:
+        categories[3][1].extend(LEVEL4_TESTS)
+    tests = [(c, t) for c, names in categories for t in names]
+    failing = {(random.choice(tests), random.randrange(gpus)) for _ in range(failures)}
+    dcgm = {'DCGM GPU Diagnostic': {'test_categories': []}, 'Driver Version Detected': '550.54.15', 'version': '3.3.5'}
+    for category, names in categories:
+        entry = {'category': category, 'tests': []}
+        for name in names:
+            results = []
+            for gpu in range(gpus):
+                if ((category, name), gpu) in failing:
+                    results.append({'gpu_id': str(gpu), 'status': 'Fail', 'info': 'GPU %d: %s failed, check the logs at /var/log/nvidia-dcgm' % (gpu, name),
+                                    'warnings': [{'error_category': 2, 'error_id': 40, 'error_severity': 1, 'warning': 'Error during %s on GPU %d' % (name, gpu)}]})
+                else:
+                    results.append({'gpu_id': str(gpu), 'status': 'Pass', 'info': 'GPU %d: %s completed successfully' % (gpu, name)})
+            entry['tests'].append({'name': name, 'results': results})
+        dcgm['DCGM GPU Diagnostic']['test_categories'].append(entry)
+    return json.dumps(dcgm, indent=3)
+
+
+#### Previous parser, for comparison
+
+def unify_string_format(key: str) -> str:
+    to_lower = key.strip().lower()
+    res, _ = re.subn(r'[\/|\s]', '_', to_lower)
+    return res
+
+
+def previous_parse_all_results(result: str):
+    dcgm_dict = json.loads(result)
+    tests_dict = dcgm_dict['DCGM GPU Diagnostic']['test_categories']
+    success = True
+    output = ""
+    for category in tests_dict:
+        for test in category['tests']:
+            test_failing = False
+            for result in test['results']:
+                if result['status'] == 'Fail':
+                    success = False
+                    if test_failing is False:
+                        output += f'{unify_string_format(test["name"])}'
+                        test_failing = True
+                    output += f'{"." + str(result["gpu_id"]) if "gpu_id" in result else "NoGPUid"}'
+    return success, output
+
+
+def previous_parse_selected_results(result: str, testpaths: str):
+    _dcgm_json_levels = [("top_level", "dcgm_gpu_diagnostic"), ("category", "tests"), ("name", "results")]
+
+    def normalize_json_keys(data) -> dict:
+        ndata = {}
+        if not isinstance(data, dict) and not isinstance(data, list):
+            return data
+        for key, val in data.items():
+            key_n = unify_string_format(key)
+            if isinstance(val, dict):
+                val_n = normalize_json_keys(data[key])
+            elif isinstance(val, list):
+                val_n = [normalize_json_keys(v) for v in val]
+            else:
+                val_n = data[key]
+            ndata[key_n] = val_n
+        if _dcgm_json_levels[0][1] in ndata:
+            ndata[_dcgm_json_levels[0][0]] = _dcgm_json_levels[0][1]
+            ndata[_dcgm_json_levels[0][1]] = ndata[_dcgm_json_levels[0][1]].pop("test_categories")
+        return ndata
+
+    def dive_to_test(data, jpath, depth):
+        jlevel_spec = _dcgm_json_levels[depth]
+        if not isinstance(data, list):
+            data = [data]
+        for entry in data:
+            if jlevel_spec[0] in entry and jpath[0] == unify_string_format(entry[jlevel_spec[0]]):
+                if depth == 2:
+                    return entry[jlevel_spec[1]]
+                return dive_to_test(entry[jlevel_spec[1]], jpath[1:], depth + 1)
+        return
+
+    # "No Data" as a tuple, the previous code listed its characters
+    def parse_single_test_result(data):
+        if not data:
+            return False, [("No Data",)]
+        success = True
+        output = []
+        for entry in data:
+            good = (unify_string_format(entry['status']) == 'pass')
+            success &= good
+            if not good:
+                output.append((entry.get("gpu_id", "NoGPU_ID"), entry.get("info", "NoInfo")))
+        return success, output
+
+    def build_output(output_list):
+        output = ""
+        for test, result in output_list:
+            if len(output):
+                output += ";"
+            output += f'{unify_string_format(test)}:'
+            for result_data in result:
+                for r in result_data:
+                    output += f'{unify_string_format(r)},'
+        return output
+
+    # json.loads, the previous code called json.load on the string
+    norm_d = normalize_json_keys(json.loads(result))
+    result_list = []
+    overall_success = True
+    for path in testpaths.split(','):
+        single_test_result = dive_to_test(norm_d, [unify_string_format(p) for p in path.split('.')], 0)
+        test_success, output = parse_single_test_result(single_test_result)
+        overall_success &= test_success
+        if not test_success:
+            result_list.append((path, output))
+    return overall_success, build_output(result_list)
+
+
+def timed(fn, runs):
+    start = time.perf_counter()
+    for _ in range(runs):
+        out = fn()
+    return (time.perf_counter() - start) / runs * 1000, out
+
+
+if __name__ == "__main__":
+    failed = False
+    print(f"{'gpus':>6} {'size':>9} {'mode':<9} {'previous':>12} {'single pass':>12} {'speedup':>8}")
+    for gpus in args['gpus']:
+        result = report(gpus, args['level'], args['failures'])
+        compiled = entrypoint.compile_paths(PATHS)
+        modes = [
+            ('all', lambda: previous_parse_all_results(result), lambda: entrypoint.parse_results(result)),
+            ('selected', lambda: previous_parse_selected_results(result, PATHS), lambda: entrypoint.parse_results(result, compiled)),
+        ]
+        for mode, previous, single in modes:
+            t_prev, out_prev = timed(previous, args['runs'])
+            t_new, out_new = timed(single, args['runs'])
+            if out_prev != out_new:
+                print(f"{gpus:>6} {mode:<9} MISMATCH: previous {out_prev}, single pass {out_new}")
+                failed = True
+            print(f"{gpus:>6} {len(result) // 1024:>6} KB {mode:<9} {t_prev:>9.2f} ms {t_new:>9.2f} ms {t_prev / t_new:>7.1f}x")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,140 @@
+##################################################################################
+# Benchmark for the HTTP fan-out used by utils/runHealthchecks.py.
+# A local stub server mimics the autopilot /status handler. Each simulated node has
+# its own address (127.0.0.0/8 is routed to the loopback interface), as each node
+# has its own endpoint IP in the cluster, so no connection is reused across nodes.
+# The same set of requests is sent with one aiohttp session per node in lock-step
+# batches (previous behavior), and with the pooled session and sliding window of
+# utils/fanout.py, with the settings used by runHealthchecks.
+# The stub delay can vary per node (--jitter), which is where the sliding window
+# differs from the batches: a slow node only holds its own slot.
+# Usage: python3 hack/bench_healthchecks_fanout.py --nodes 1000 --batchSize 64
+##################################################################################
+import argparse
+import asyncio
+import os
+import random
+import sys
+import threading
+import time
+from itertools import islice
+
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+from fanout import sliding_window
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--nodes', type=int, default=1000, help='Number of simulated autopilot endpoints to query, one loopback address each. Default is 1000.')
+parser.add_argument('--batchSize', type=int, default=64, help='Number of nodes queried in parallel. Default is 64.')
+parser.add_argument('--delay', type=float, default=0.01, help='Simulated health check duration on the stub, in seconds. Default is 0.01.')
+parser.add_argument('--jitter', type=float, default=0.0, help='Extra random duration of each simulated check, up to this many seconds. Default is 0.')
+parser.add_argument('--port', type=int, default=18333, help='Port of the stub server, on all the loopback addresses. Default is 18333.')
+args = vars(parser.parse_args())
+
+STATUS_REPLY = "[[ PCIEBW ]] Briefings completed. Continue with PCIe Bandwidth evaluation.\nSUCCESS\nHost  stub\n12.1 12.0 12.3 12.3 11.9 11.5 12.1 12.1\n"
+
+# same simulated duration for a node in both modes
+random.seed(0)
+NODE_DELAY = {'node' + str(n): args['delay'] + random.uniform(0, args['jitter']) for n in range(args['nodes'])}
+
+
+async def status(request):
+    await asyncio.sleep(NODE_DELAY[request.query['host']])
+    return web.Response(text=STATUS_REPLY)
+
+
+def stub_server_main(ready, stop):
+    # the stub runs in its own thread and event loop, so that the per-node mode can create
+    # and destroy one loop per batch exactly like the previous implementation
+    async def wait_for_stop():
+        stop['event'] = asyncio.Event()
+        stop['loop'] = asyncio.get_running_loop()
+        ready.set()
+        await stop['event'].wait()
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    app = web.Application()
+    app.router.add_get('/status', status)
+    runner = web.AppRunner(app, access_log=None)
+    loop.run_until_complete(runner.setup())
+    # one listening socket for all the loopback addresses of the nodes
+    loop.run_until_complete(web.TCPSite(runner, '0.0.0.0', args['port']).start())
+    loop.run_until_complete(wait_for_stop())
+    loop.run_until_complete(runner.cleanup())
+    loop.close()
+
+
+def node_address(n):
+    # 127.0.1.0 and up, one per node
+    n += 256
+    return '127.%d.%d.%d' % (n >> 16 & 255, n >> 8 & 255, n & 255)
+
+
+def node_urls():
+    return ['http://' + node_address(n) + ':' + str(args['port']) + '/status?host=node' + str(n) + '&check=pciebw' for n in range(args['nodes'])]
+
+
+def batches(urls, batch_size):
+    it = iter(urls)
+    while True:
+        batch = list(islice(it, batch_size))
+        if not batch:
+            break
+        yield batch
+
+
+async def per_node_request(url):
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=60)) as session:
+        async with session.get(url) as resp:
+            return await resp.text()
+
+
+async def per_node_batch(batch):
+    return await asyncio.gather(*(per_node_request(url) for url in batch))
+
+
+def run_per_node(urls):
+    replies = []
+    for b in batches(urls, args['batchSize']):
+        replies.extend(asyncio.run(per_node_batch(b)))
+    return replies
+
+
+async def pooled_request(session, url):
+    async with session.get(url) as resp:
+        return await resp.text()
+
+
+def run_pooled(urls):
+    replies = []
+    asyncio.run(sliding_window(urls, args['batchSize'], pooled_request, replies.append))
+    return replies
+
+
+def measure(name, fn, urls):
+    start = time.perf_counter()
+    replies = fn(urls)
+    elapsed = time.perf_counter() - start
+    failed = sum(1 for r in replies if 'SUCCESS' not in r)
+    print(f"{name:<28} requests: {len(replies):<8} failed: {failed:<6} wall time: {elapsed:8.3f} s   req/s: {len(replies) / elapsed:10.1f}")
+    return elapsed
+
+
+if __name__ == "__main__":
+    ready = threading.Event()
+    stop = {}
+    stub = threading.Thread(target=stub_server_main, args=(ready, stop), daemon=True)
+    stub.start()
+    ready.wait()
+
+    urls = node_urls()
+    print(f"Nodes: {args['nodes']} (one address each)  Batch size: {args['batchSize']}  Simulated check: {args['delay']} s + up to {args['jitter']} s\n")
+    per_node = measure('per-node sessions, batches', run_per_node, urls)
+    pooled = measure('pooled session, window', run_pooled, urls)
+    print(f"\nSpeedup: {per_node / pooled:.2f}x")
+
+    stop['loop'].call_soon_threadsafe(stop['event'].set)
+    stub.join()
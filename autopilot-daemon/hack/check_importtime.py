@@ -0,0 +1,84 @@
+##################################################################################
+# Import-time budget check for the health check entrypoints.
+# Each entrypoint is loaded (not run) under "python3 -X importtime", the cumulative
+# time of its top-level imports is compared with the same measure for an empty
+# script, and the difference must stay within the entrypoint's budget.
+# Exits with status 1 when an entrypoint goes over budget, so it can be used as a
+# regression gate in CI.
+# Usage (from autopilot-daemon/): python3 hack/check_importtime.py [--runs 5]
+##################################################################################
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--runs', type=int, default=5, help='Number of measurements for each entrypoint, the median is used. Default is 5.')
+parser.add_argument('--scale', type=float, default=1.0, help='Multiplier applied to all budgets, for slower machines. Default is 1.0.')
+args = vars(parser.parse_args())
+
+# milliseconds of imports on top of the interpreter startup
+BUDGET_MS = {
+    './gpu-bw/entrypoint.py': 50,
+    './gpu-remapped/entrypoint.py': 50,
+    './gpu-mem/entrypoint.py': 50,
+    './gpu-dcgm/entrypoint.py': 50,
+    './gpu-power/entrypoint.py': 50,
+    './network/iperf3_stop_servers.py': 50,
+    './network/iperf3_start_clients.py': 100,
+    './network/iperf3_start_servers.py': 50,
+    './network/ping-entrypoint.py': 1500,
+    './network/iperf3_entrypoint.py': 1500,
+}
+
+# loads the entrypoint with a run_name other than __main__, so only its module-level code runs
+LOADER = '''
+import os, runpy, sys
+script = sys.argv[1]
+sys.argv = [script]
+sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+runpy.run_path(script, run_name='importtime')
+'''
+
+
+def top_level_imports_us(script):
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', LOADER, script], capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'exit status ' + str(proc.returncode))
+    total = 0
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package, nested imports are indented
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) == 3 and not fields[2].startswith('  '):
+            total += int(fields[1])
+    return total
+
+
+def median_ms(script):
+    return statistics.median(top_level_imports_us(script) for _ in range(args['runs'])) / 1000
+
+
+if __name__ == "__main__":
+    with tempfile.NamedTemporaryFile('w', suffix='.py', delete=False) as f:
+        empty = f.name
+    baseline = median_ms(empty)
+    os.unlink(empty)
+    print(f"Baseline (empty script): {baseline:.1f} ms\n")
+
+    over_budget = False
+    for script, budget in BUDGET_MS.items():
+        budget *= args['scale']
+        try:
+            cost = median_ms(script) - baseline
+        except RuntimeError as e:
+            print(f"{script:<40} cannot be loaded: {e}")
+            over_budget = True
+            continue
+        verdict = 'OK' if cost <= budget else 'OVER BUDGET'
+        over_budget = over_budget or cost > budget
+        print(f"{script:<40} {cost:8.1f} ms   budget: {budget:8.1f} ms   {verdict}")
+    sys.exit(1 if over_budget else 0)
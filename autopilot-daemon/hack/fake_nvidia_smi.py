@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+##################################################################################
+# Fake nvidia-smi for CPU-only machines, used by hack/run_gpu_checks_fake.py.
+# Answers the calls made by utils/briefings.sh and utils/gpuinfo.py:
+#   nvidia-smi
+#   nvidia-smi --query-gpu=<fields> --format=csv[,noheader][,nounits]
+# The GPUs are configured with environment variables:
+#   FAKE_GPUS                number of GPUs (default 8, 0 for "No devices were found")
+#   FAKE_REMAPPED_PENDING    comma separated indexes of the GPUs with pending row remappings
+#   FAKE_HW_SLOWDOWN         comma separated indexes of the GPUs in HW slowdown
+#   FAKE_ECC_UNCORRECTED     comma separated index:count of the volatile uncorrected ECC errors
+#   FAKE_OLD_DRIVER          1 to reject the clocks_event_reasons.* fields, as drivers older than 535
+#   FAKE_NVIDIA_SMI_LOG      file where every invocation is appended
+##################################################################################
+import os
+import sys
+
+
+def indexes(name):
+    return {int(i) for i in os.getenv(name, '').split(',') if i.strip()}
+
+
+def ecc_uncorrected():
+    counts = {}
+    for entry in os.getenv('FAKE_ECC_UNCORRECTED', '').split(','):
+        if ':' in entry:
+            gpu, count = entry.split(':')
+            counts[int(gpu)] = int(count)
+    return counts
+
+
+def value(field, gpu, nounits):
+    pending = gpu in indexes('FAKE_REMAPPED_PENDING')
+    slowdown = gpu in indexes('FAKE_HW_SLOWDOWN')
+    reason = field.split('.', 1)[1] if field.startswith('clocks_') else ''
+    values = {
+        'index': str(gpu),
+        'pci.bus_id': '00000000:%02X:00.0' % (0x1b + gpu),
+        'mig.mode.current': 'Disabled',
+        'remapped_rows.pending': 'Yes' if pending else 'No',
+        'remapped_rows.failure': 'No',
+        'remapped_rows.correctable': '0',
+        'remapped_rows.uncorrectable': '2' if pending else '0',
+        'power.draw': '71.52' if nounits else '71.52 W',
+        'power.limit': '400.00' if nounits else '400.00 W',
+        'ecc.errors.corrected.volatile.total': '0',
+        'ecc.errors.uncorrected.volatile.total': str(ecc_uncorrected().get(gpu, 0)),
+    }
+    if reason == 'hw_slowdown':
+        return 'Active' if slowdown else 'Not Active'
+    if reason:
+        return 'Not Active'
+    return values.get(field, '[N/A]')
+
+
+def main():
+    log = os.getenv('FAKE_NVIDIA_SMI_LOG')
+    if log:
+        with open(log, 'a') as f:
+            f.write(' '.join(sys.argv[1:]) + '\n')
+
+    count = int(os.getenv('FAKE_GPUS', '8'))
+    if count == 0:
+        print('No devices were found')
+        sys.exit(6)
+
+    query = [a.split('=', 1)[1] for a in sys.argv[1:] if a.startswith('--query-gpu=')]
+    if not query:
+        print('| NVIDIA-SMI 550.54.15    Driver Version: 550.54.15    CUDA Version: 12.4 |')
+        for gpu in range(count):
+            print('| %d  Fake GPU  On  | %s Off |' % (gpu, value('pci.bus_id', gpu, True)))
+        return
+
+    fields = query[0].split(',')
+    if os.getenv('FAKE_OLD_DRIVER') == '1':
+        for field in fields:
+            if field.startswith('clocks_event_reasons.'):
+                print('Field "%s" is not a valid field to query.' % field)
+                sys.exit(2)
+    fmt = [a.split('=', 1)[1] for a in sys.argv[1:] if a.startswith('--format=')]
+    options = fmt[0].split(',') if fmt else []
+    if 'noheader' not in options:
+        print(', '.join(fields))
+    for gpu in range(count):
+        print(', '.join(value(field, gpu, 'nounits' in options) for field in fields))
+
+
+if __name__ == '__main__':
+    main()
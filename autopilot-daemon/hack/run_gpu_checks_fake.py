@@ -0,0 +1,158 @@
+##################################################################################
+# Runs the remapped rows and power throttle checks against hack/fake_nvidia_smi.py,
+# so they can be tested on CPU-only machines.
+# Each scenario configures the fake GPUs, runs both entrypoints with --json and
+# compares the status, the per-GPU values and some stats of the result records with
+# the expected ones. The number of nvidia-smi invocations of each check is reported.
+# The GPU sampler is tested too: aggregate() on hand-written rows, then a sequence
+# of on-demand and periodic runs of the checks reading a ring buffer written in a
+# temporary file (GPU_SAMPLER_FILE), checking the window stats, the verdicts and that
+# only the periodic runs move the window.
+# Exits with status 1 when a scenario does not match.
+# Usage (from autopilot-daemon/): python3 hack/run_gpu_checks_fake.py
+##################################################################################
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+HACK = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HACK, '..', 'utils'))
+from gpusampler import RingBuffer, FIELDS, THROTTLE, aggregate
+
+INTERVAL = 30.0
+
+# name, fake GPU environment, expected (status, values, stats) of the remapped and power checks
+# stats are {device: {stat: value}}, None for a stat that must not be reported
+SCENARIOS = [
+    ('healthy', {}, ('SUCCESS', [0] * 8, {}), ('SUCCESS', [0] * 8, {'0': {'window_samples': None}})),
+    ('pending remaps', {'FAKE_REMAPPED_PENDING': '1,6'}, ('FAIL', [0, 1, 0, 0, 0, 0, 1, 0], {'1': {'uncorrectable': 2.0}}), ('SUCCESS', [0] * 8, {})),
+    ('hw slowdown', {'FAKE_HW_SLOWDOWN': '3'}, ('SUCCESS', [0] * 8, {}), ('FAIL', [0, 0, 0, 1, 0, 0, 0, 0], {'3': {'hw_slowdown': 1.0}})),
+    ('ecc uncorrected', {'FAKE_ECC_UNCORRECTED': '2:5'}, ('SUCCESS', [0] * 8, {'2': {'ecc_uncorrected': 5.0}, '3': {'ecc_uncorrected': 0.0}}), ('SUCCESS', [0] * 8, {})),
+    ('old driver', {'FAKE_OLD_DRIVER': '1', 'FAKE_GPUS': '4', 'FAKE_HW_SLOWDOWN': '0'}, ('SUCCESS', [0] * 4, {}), ('FAIL', [1, 0, 0, 0], {})),
+    ('no gpu', {'FAKE_GPUS': '0'}, ('SKIP', [], {}), ('ABORT', [], {})),
+]
+
+CHECKS = {'remapped': './gpu-remapped/entrypoint.py', 'gpupower': './gpu-power/entrypoint.py'}
+
+# sampler window: 4 fake GPUs, none in HW slowdown or with ECC errors now, but the buffer holds
+# 3 samples with HW slowdown on GPU 2 and 4 uncorrected ECC errors appearing on GPU 1
+WINDOW_GPUS = 4
+WINDOW_SAMPLES = 3
+# check, periodic run, expected (status, values, stats), expected window marker of the check after the run
+WINDOW_RUNS = [
+    ('gpupower', False, ('FAIL', [0, 0, 1, 0], {'2': {'window_samples': 3.0, 'window_hw_slowdown_seconds': 90.0, 'window_hw_slowdown_max_seconds': 90.0}}), False),
+    ('remapped', False, ('SUCCESS', [0] * 4, {'1': {'window_ecc_uncorrected_delta': 4.0}}), False),
+    ('gpupower', True, ('FAIL', [0, 0, 1, 0], {'2': {'window_hw_slowdown_seconds': 90.0}}), True),
+    # nothing sampled since the previous periodic run
+    ('gpupower', True, ('SUCCESS', [0] * 4, {'2': {'window_samples': None}}), True),
+    ('gpupower', False, ('SUCCESS', [0] * 4, {'2': {'window_samples': None}}), True),
+    # each check has its own window
+    ('remapped', True, ('SUCCESS', [0] * 4, {'1': {'window_ecc_uncorrected_delta': 4.0}}), True),
+]
+
+
+def run(script, env, log, periodic=False):
+    open(log, 'w').close()
+    proc = subprocess.run([sys.executable, script, '--json'] + (['--periodic'] if periodic else []), capture_output=True, text=True, env=env)
+    try:
+        result = json.loads(proc.stdout)
+    except ValueError:
+        return None, proc.stdout + proc.stderr, 0
+    with open(log) as f:
+        calls = len(f.readlines())
+    return result, '', calls
+
+
+def stats_mismatch(result, stats):
+    by_device = {v['device']: v.get('stats', {}) for v in result['values']}
+    wrong = []
+    for device, expected in stats.items():
+        for stat, value in expected.items():
+            if by_device.get(device, {}).get(stat) != value:
+                wrong.append(f"GPU {device} {stat}={by_device.get(device, {}).get(stat)}, expected {value}")
+    return wrong
+
+
+def check_result(label, result, error, calls, expected):
+    status, values, stats = expected
+    if result is None:
+        print(f"{label:<32} cannot decode the result: {error.strip()}")
+        return False
+    got = [v['value'] for v in result['values']]
+    wrong = stats_mismatch(result, stats)
+    ok = result['status'] == status and got == values and not wrong
+    print(f"{label:<32} {result['status']:<8} {' '.join(str(int(v)) for v in got):<16} nvidia-smi calls: {calls}   {'OK' if ok else 'MISMATCH, expected ' + status + ' ' + str(values) + ' ' + '; '.join(wrong)}")
+    return ok
+
+
+def sample(gpus, **fields):
+    # one row of values, the given fields set to {gpu: value} and the others to 0
+    values = []
+    for gpu in range(gpus):
+        values += [float(fields.get(field, {}).get(gpu, 0.0)) for field in FIELDS]
+    return values
+
+
+def check_aggregate():
+    # GPU 0 in HW slowdown for 3 samples, a missing sample, then 1 more: 4 samples in total, longest
+    # episode 3. Its uncorrected ECC counter goes 0, 3, then reset by a driver reload and 1: 4 errors.
+    # GPU 1 has no power draw (NaN) and a pending remapping once.
+    rows = [
+        (0.0, sample(2, hw_slowdown={0: 1}, ecc_uncorrected={0: 0}, power_draw={0: 100, 1: math.nan})),
+        (30.0, sample(2, hw_slowdown={0: 1}, ecc_uncorrected={0: 3}, power_draw={0: 300, 1: math.nan})),
+        (60.0, sample(2, hw_slowdown={0: 1}, ecc_uncorrected={0: 0}, power_draw={0: 200, 1: math.nan}, remapped_pending={1: 1})),
+        (120.0, sample(2, hw_slowdown={0: 1}, ecc_uncorrected={0: 1}, power_draw={0: 200, 1: math.nan})),
+    ]
+    stats = aggregate(rows, 2, INTERVAL)
+    expected = {
+        0: {'samples': 4.0, 'hw_slowdown_seconds': 120.0, 'hw_slowdown_max_seconds': 90.0, 'sw_power_cap_seconds': 0.0,
+            'power_max': 300.0, 'power_mean': 200.0, 'ecc_uncorrected_delta': 4.0, 'remapped_pending_seen': 0.0},
+        1: {'samples': 4.0, 'hw_slowdown_seconds': 0.0, 'hw_slowdown_max_seconds': 0.0, 'power_max': None, 'remapped_pending_seen': 1.0},
+    }
+    ok = True
+    for gpu, values in expected.items():
+        wrong = [f"{k}={stats[gpu].get(k)}, expected {v}" for k, v in values.items() if stats[gpu].get(k) != v]
+        ok = ok and not wrong
+        print(f"{'aggregate GPU ' + str(gpu):<32} {'OK' if not wrong else 'MISMATCH ' + '; '.join(wrong)}")
+    return ok
+
+
+def check_window(env, log, tmpdir):
+    path = os.path.join(tmpdir, 'samples.bin')
+    buffer = RingBuffer(path, 16, WINDOW_GPUS, INTERVAL)
+    now = time.time()
+    for n in range(WINDOW_SAMPLES):
+        buffer.append(now - (WINDOW_SAMPLES - n) * INTERVAL, sample(WINDOW_GPUS, hw_slowdown={2: 1}, ecc_uncorrected={1: 4 if n == WINDOW_SAMPLES - 1 else 0}))
+    env = dict(env, GPU_SAMPLER_FILE=path, FAKE_GPUS=str(WINDOW_GPUS))
+    ok = True
+    for check, periodic, expected, marker in WINDOW_RUNS:
+        label = f"window {check} {'periodic' if periodic else 'on demand'}"
+        result, error, calls = run(CHECKS[check], env, log, periodic)
+        ok = check_result(label, result, error, calls, expected) and ok
+        if os.path.exists(path + '.' + check + '.last') != marker:
+            print(f"{label:<32} MISMATCH, window marker {'not ' if marker else ''}written")
+            ok = False
+    return ok
+
+
+if __name__ == "__main__":
+    tmpdir = tempfile.mkdtemp()
+    os.symlink(os.path.join(HACK, 'fake_nvidia_smi.py'), os.path.join(tmpdir, 'nvidia-smi'))
+    log = os.path.join(tmpdir, 'calls')
+    # the scenarios do not read the sampler of the machine
+    base = dict(os.environ, PATH=tmpdir + os.pathsep + os.environ['PATH'], PREFLIGHT_TTL='0', FAKE_NVIDIA_SMI_LOG=log, NODE_NAME='fake-node',
+                GPU_SAMPLER_FILE=os.path.join(tmpdir, 'no-sampler.bin'))
+
+    failed = False
+    for name, fake, *expected in SCENARIOS:
+        env = dict(base, **fake)
+        for check, expected_check in zip(CHECKS, expected):
+            result, error, calls = run(CHECKS[check], env, log)
+            failed = not check_result(f"{name} {check}", result, error, calls, expected_check) or failed
+    failed = not check_aggregate() or failed
+    failed = not check_window(base, log, tmpdir) or failed
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,294 @@
+import csv
+import json
+import warnings
+
+import numpy as np
+
+#
+# Results of a bandwidth workload as a [iface, src, dst] matrix, in Gb/s as received by the
+# destination. Pairs that were not measured are NaN, failed pairs count as 0 Gb/s (as in the
+# averages printed before) and are flagged in "failed".
+# All the statistics are computed on the whole array at once, so they stay cheap with thousands
+# of nodes, and the matrix is exported in a compact format instead of being printed.
+#
+
+UNITS = "Gb/s"
+EXPORT_FORMATS = (".csv", ".npz", ".json")
+
+# A node is degraded as a sender (receiver) on an interface when the median bandwidth of its row
+# (column) is an outlier among all the rows (columns) of that interface: robust z-score, i.e.
+# 0.6745 * (x - median) / MAD (Iglewicz and Hoaglin), below -ROBUST_Z_THRESHOLD, and at least
+# MIN_DROP below the median, so that tiny differences in a very uniform cluster are not flagged.
+ROBUST_Z_THRESHOLD = 3.5
+MIN_DROP = 0.1
+OK = "ok"
+DEGRADED_SENDER = "degraded-sender"
+DEGRADED_RECEIVER = "degraded-receiver"
+DEGRADED = "degraded"
+UNKNOWN = "unknown"
+
+
+class BandwidthMatrix:
+    def __init__(self, nodes, netifaces_count, labels=None):
+        """
+        Args:
+            nodes (list): The node names, in the order of the rows and columns.
+            netifaces_count (int): The number of interfaces of each node.
+            labels (list): Names printed and exported for the nodes, defaults to the node names.
+        """
+        self.nodes = list(nodes)
+        self.labels = list(labels) if labels is not None else self.nodes
+        self.index = {node: i for i, node in enumerate(self.nodes)}
+        self.ifaces = [f"net1-{i}" for i in range(netifaces_count)]
+        shape = (netifaces_count, len(self.nodes), len(self.nodes))
+        self.bitrate = np.full(shape, np.nan)
+        self.retransmits = np.zeros(shape, dtype=np.int64)
+        self.failed = np.zeros(shape, dtype=bool)
+
+    def add(self, iface, src, dst, data):
+        """
+        Records the reply of the iperf3 clients of src to dst on iface.
+        An empty reply is a failure.
+        """
+        cell = (iface, self.index[src], self.index[dst])
+        if not data:
+            self.bitrate[cell] = 0.0
+            self.failed[cell] = True
+            return
+        # the clients report bits/s
+        self.bitrate[cell] = data["receiver"]["aggregate"]["bitrate"] / 1e9
+        self.retransmits[cell] = data.get("retransmits", 0)
+
+    def measured(self):
+        return ~np.isnan(self.bitrate)
+
+    def stats(self):
+        """
+        Returns:
+            dict: Per interface, per source (row) and per destination (column) statistics, as arrays
+            indexed by interface (and node), and the z-score of every link against its interface.
+        """
+        # rows, columns or interfaces without any measure are NaN, not a warning
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            mean = np.nanmean(self.bitrate, axis=(1, 2))
+            std = np.nanstd(self.bitrate, axis=(1, 2))
+            stats = {
+                "iface": {
+                    "mean": mean,
+                    "min": np.nanmin(self.bitrate, axis=(1, 2)),
+                    "max": np.nanmax(self.bitrate, axis=(1, 2)),
+                    "std": std,
+                    "links": self.measured().sum(axis=(1, 2)),
+                    "failed": self.failed.sum(axis=(1, 2)),
+                    "retransmits": self.retransmits.sum(axis=(1, 2)),
+                },
+                "src": {
+                    "mean": np.nanmean(self.bitrate, axis=2),
+                    "min": np.nanmin(self.bitrate, axis=2),
+                },
+                "dst": {
+                    "mean": np.nanmean(self.bitrate, axis=1),
+                    "min": np.nanmin(self.bitrate, axis=1),
+                },
+            }
+        stats["zscore"] = self.zscore(mean, std)
+        return stats
+
+    def zscore(self, mean=None, std=None):
+        """Distance of every link from the mean of its interface, in standard deviations."""
+        if mean is None:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)
+                mean = np.nanmean(self.bitrate, axis=(1, 2))
+                std = np.nanstd(self.bitrate, axis=(1, 2))
+        scale = np.where(std > 0, std, np.inf)[:, None, None]
+        return (self.bitrate - mean[:, None, None]) / scale
+
+    def verdicts(self, threshold=ROBUST_Z_THRESHOLD, min_drop=MIN_DROP):
+        """
+        Compares the median bandwidth sent (row) and received (column) by every node on every
+        interface with the other nodes, so that a single slow NIC is identified even when the
+        average of the interface looks fine.
+        A slow receiver also lowers the rows of the nodes sending to it (and a slow sender the
+        columns of its destinations), so the outliers are resolved one at a time: the most extreme
+        one of each interface is flagged, its row or column is taken out, and the medians are
+        computed again until no outlier is left.
+
+        Returns:
+            list: One entry per node and interface, with the medians, their robust z-scores (once the
+            degraded rows and columns are taken out, when the node was flagged for flagged nodes) and
+            the verdict: ok, degraded-sender, degraded-receiver, degraded (both) or unknown (not measured).
+        """
+        bitrate = self.bitrate.copy()
+        sender_low = np.zeros(bitrate.shape[:2], dtype=bool)
+        receiver_low = np.zeros(bitrate.shape[:2], dtype=bool)
+        while True:
+            sender, receiver = _medians(bitrate)
+            sender_z, sender_out = _robust_outliers(sender, threshold, min_drop)
+            receiver_z, receiver_out = _robust_outliers(receiver, threshold, min_drop)
+            if not sender_out.any() and not receiver_out.any():
+                break
+            if not sender_low.any() and not receiver_low.any():
+                # z-scores against the whole interface, before any row or column is taken out
+                first_sender_z, first_receiver_z = sender_z, receiver_z
+            worst_sender = np.where(sender_out, sender_z, np.inf)
+            worst_receiver = np.where(receiver_out, receiver_z, np.inf)
+            for iface in range(bitrate.shape[0]):
+                if worst_sender[iface].min() <= worst_receiver[iface].min():
+                    if np.isfinite(worst_sender[iface].min()):
+                        node = worst_sender[iface].argmin()
+                        sender_low[iface, node] = True
+                        bitrate[iface, node, :] = np.nan
+                elif np.isfinite(worst_receiver[iface].min()):
+                    node = worst_receiver[iface].argmin()
+                    receiver_low[iface, node] = True
+                    bitrate[iface, :, node] = np.nan
+        if sender_low.any() or receiver_low.any():
+            sender_z = np.where(sender_low, first_sender_z, sender_z)
+            receiver_z = np.where(receiver_low, first_receiver_z, receiver_z)
+        sender, receiver = _medians(self.bitrate)
+
+        verdict = np.full(sender.shape, OK, dtype=object)
+        verdict[sender_low] = DEGRADED_SENDER
+        verdict[receiver_low] = DEGRADED_RECEIVER
+        verdict[sender_low & receiver_low] = DEGRADED
+        verdict[np.isnan(sender) & np.isnan(receiver)] = UNKNOWN
+
+        verdicts = []
+        for iface, node in np.ndindex(sender.shape):
+            verdicts.append(
+                {
+                    "node": self.nodes[node],
+                    "label": self.labels[node],
+                    "iface": self.ifaces[iface],
+                    "verdict": verdict[iface, node],
+                    "sender": _number(sender[iface, node]),
+                    "receiver": _number(receiver[iface, node]),
+                    "sender_z": _number(sender_z[iface, node]),
+                    "receiver_z": _number(receiver_z[iface, node]),
+                }
+            )
+        return verdicts
+
+    def worst_links(self, k):
+        """
+        Returns:
+            list: The k measured links with the lowest bandwidth, lowest first.
+        """
+        flat = np.where(self.measured(), self.bitrate, np.inf).ravel()
+        k = min(k, int(self.measured().sum()))
+        if k <= 0:
+            return []
+        # only the k lowest are sorted
+        idx = np.argpartition(flat, k - 1)[:k]
+        idx = idx[np.argsort(flat[idx], kind="stable")]
+        zscore = self.zscore().ravel()
+        links = []
+        for cell, (iface, src, dst) in zip(idx, zip(*np.unravel_index(idx, self.bitrate.shape))):
+            links.append(
+                {
+                    "iface": self.ifaces[iface],
+                    "src": self.labels[src],
+                    "dst": self.labels[dst],
+                    "bitrate": round(float(flat[cell]), 2),
+                    "zscore": round(float(zscore[cell]), 2),
+                    "retransmits": int(self.retransmits.ravel()[cell]),
+                    "failed": bool(self.failed.ravel()[cell]),
+                }
+            )
+        return links
+
+    def export(self, path, topk=10):
+        """
+        Writes the matrix to path, in the format given by its extension:
+            .csv   one line per measured link: iface,src,dst,bitrate,retransmits,failed
+            .npz   the bitrate, retransmits and failed arrays, with the node and interface names
+            .json  the measured links as [iface, src, dst, bitrate, retransmits, failed], with indexes into
+                   "ifaces" and "nodes", the interface statistics and the worst links
+        """
+        iface, src, dst = np.nonzero(self.measured())
+        if path.endswith(".csv"):
+            with open(path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["iface", "src", "dst", f"bitrate_{UNITS}", "retransmits", "failed"])
+                writer.writerows(
+                    zip(
+                        np.array(self.ifaces)[iface],
+                        np.array(self.labels)[src],
+                        np.array(self.labels)[dst],
+                        np.round(self.bitrate[iface, src, dst], 3),
+                        self.retransmits[iface, src, dst],
+                        self.failed[iface, src, dst].astype(int),
+                    )
+                )
+        elif path.endswith(".npz"):
+            np.savez_compressed(
+                path,
+                bitrate=self.bitrate,
+                retransmits=self.retransmits,
+                failed=self.failed,
+                nodes=np.array(self.labels),
+                ifaces=np.array(self.ifaces),
+            )
+        elif path.endswith(".json"):
+            stats = self.stats()["iface"]
+            with open(path, "w") as f:
+                json.dump(
+                    {
+                        "units": UNITS,
+                        "nodes": self.labels,
+                        "ifaces": self.ifaces,
+                        "links": list(
+                            zip(
+                                iface.tolist(),
+                                src.tolist(),
+                                dst.tolist(),
+                                np.round(self.bitrate[iface, src, dst], 3).tolist(),
+                                self.retransmits[iface, src, dst].tolist(),
+                                self.failed[iface, src, dst].tolist(),
+                            )
+                        ),
+                        "stats": {
+                            iface: {name: _number(values[i]) for name, values in stats.items()}
+                            for i, iface in enumerate(self.ifaces)
+                        },
+                        "worst": self.worst_links(topk),
+                    },
+                    f,
+                )
+        else:
+            raise ValueError(f"Unsupported export format {path}, use one of {', '.join(EXPORT_FORMATS)}")
+
+
+def _medians(bitrate):
+    # median bandwidth sent (rows) and received (columns) by each node, [iface, node]
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return np.nanmedian(bitrate, axis=2), np.nanmedian(bitrate, axis=1)
+
+
+def _robust_outliers(values, threshold, min_drop):
+    """
+    Robust z-scores of values [iface, node] against the other nodes of the same interface, and
+    the mask of the low outliers. NaN (not measured) values are ignored.
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        median = np.nanmedian(values, axis=1, keepdims=True)
+        deviation = np.abs(values - median)
+        mad = np.nanmedian(deviation, axis=1, keepdims=True) / 0.6745
+        # more than half of the nodes have the same value: fall back to the mean absolute deviation
+        meanad = np.nanmean(deviation, axis=1, keepdims=True) * 1.2533
+    scale = np.where(mad > 0, mad, np.where(meanad > 0, meanad, np.inf))
+    zscore = (values - median) / scale
+    low = (zscore < -threshold) & (values < (1 - min_drop) * median)
+    return zscore, low
+
+
+def _number(value):
+    # JSON has no NaN
+    value = value.item() if isinstance(value, np.generic) else value
+    if isinstance(value, float):
+        return None if np.isnan(value) else round(value, 3)
+    return value
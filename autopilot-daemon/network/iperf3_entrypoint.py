@@ -1,5 +1,11 @@
 from iperf3_utils import *
-from network_workload import NetworkWorkload
+from network_workload import NetworkWorkload, SupportedWorkload
+from bandwidth_matrix import BandwidthMatrix, EXPORT_FORMATS, UNITS, OK, UNKNOWN
+from checkresult import CheckResult, SUCCESS, FAIL, ABORT
+import asyncio
+import aiohttp
+import time
+import numpy as np
 
 parser = argparse.ArgumentParser()
 
@@ -7,7 +13,27 @@ parser.add_argument(
     "--workload",
     type=str,
     default="ring",
-    help=('The type of network workload. Supported workload values: "ring"'),
+    help=(
+        'The type of network workload. Supported workload values: "ring", "bisection", "random" (random permutations) '
+        'and "hierarchical" (ring inside each leaf, then across leaves on the same rail, see --leaflabel).'
+    ),
+)
+
+parser.add_argument(
+    "--steps",
+    type=int,
+    default=0,
+    help=(
+        "The maximum number of workload steps to run, to fit the test into a time budget. "
+        'Default is 0, all the steps, except for the "random" workload that runs 8.'
+    ),
+)
+
+parser.add_argument(
+    "--leaflabel",
+    type=str,
+    default="",
+    help='The node label holding the leaf (or rail group) of each node, for the "hierarchical" workload.',
 )
 
 parser.add_argument(
@@ -32,183 +58,396 @@ parser.add_argument(
     ),
 )
 
+parser.add_argument(
+    "--parallelifaces",
+    action="store_true",
+    help=(
+        "When provided, the interfaces are assumed to be on independent NICs and are measured at the same time. "
+        "By default the interfaces of a node take turns."
+    ),
+)
+
+parser.add_argument(
+    "--adaptive",
+    action="store_true",
+    help=(
+        "When provided, each iperf3 client stops as soon as its throughput is stable, and runs longer "
+        "(up to 10 seconds) on unstable links, instead of a fixed 5 seconds."
+    ),
+)
+
+parser.add_argument(
+    "--startmargin",
+    type=float,
+    default=2.0,
+    help=(
+        "Seconds between sending the requests of a time slot and the start of its iperf3 clients, all the clients "
+        "of the slot start at the same time on every node. Default is 2.0."
+    ),
+)
+
+parser.add_argument(
+    "--maxconnections",
+    type=int,
+    default=64,
+    help=(
+        "The maximum number of nodes contacted at the same time when starting and stopping the iperf3 servers. "
+        "Default is 64."
+    ),
+)
+
+parser.add_argument(
+    "--topk",
+    type=int,
+    default=10,
+    help="The number of links with the lowest bandwidth to report. Default is 10.",
+)
+
+parser.add_argument(
+    "--output",
+    type=str,
+    action="append",
+    help=(
+        "Write the whole bandwidth matrix to this file, can be repeated. The format is given by the extension: "
+        + ", ".join(EXPORT_FORMATS)
+        + "."
+    ),
+)
+
 parser.add_argument(
     "--cleanup",
     action="store_true",
     help=("When provided, this will kill ALL iperf servers on every node."),
 )
 
+parser.add_argument(
+    "--json",
+    action="store_true",
+    help="Print a single JSON result record, with the verdict of every node and interface, instead of free text.",
+)
+
 args = vars(parser.parse_args())
 
+result = CheckResult("iperf", UNITS)
+
+
+# connection pool settings for the requests sent to the autopilot endpoints: the connections opened
+# when starting the servers are kept alive and reused by every step of the workload
+CONNECTIONS_PER_HOST = 2
+KEEPALIVE_TIMEOUT = 60  # seconds
+DNS_CACHE_TTL = 300  # seconds
+REQUEST_TIMEOUT = 60 * 10  # seconds
+RETRIES = 3
+BACKOFF = 1.0  # seconds, doubled at every retry
+# above that the grid is not printed, it is in the --output files
+GRID_MAX_NODES = 16
+LATE_START = 0.1  # seconds, clients starting later than that got the request after the start time
+
 
-async def make_server_connection(event, address, handle):
+def create_session():
+    connector = aiohttp.TCPConnector(
+        limit=0,
+        limit_per_host=CONNECTIONS_PER_HOST,
+        ttl_dns_cache=DNS_CACHE_TTL,
+        keepalive_timeout=KEEPALIVE_TIMEOUT,
+    )
+    return aiohttp.ClientSession(
+        connector=connector, timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+    )
+
+
+async def autopilot_get(session, address, handle, retry_on):
     """
-    Handles connections to the target autopilot pod on a different worker-node.
-    Attempts to ensure synchronization via asyncio events...
+    Sends a request to an autopilot pod, retrying with exponential backoff on the given errors.
 
     Args:
+        session (aiohttp.ClientSession): The pooled session.
         address (str): The address of the autopilot pod.
         handle (str): The endpoint handle for the connection.
+        retry_on (tuple): The exceptions after which the request is sent again.
 
+    Returns:
+        str: The body of the reply. Raises the last error once the retries are exhausted.
     """
-    try:
-        if event != None:
-            await event.wait()
-        url = f"http://{address}:{AUTOPILOT_PORT}{handle}"
-        total_timeout = aiohttp.ClientTimeout(total=60 * 10)
-        async with aiohttp.ClientSession(timeout=total_timeout) as session:
+    url = f"http://{address}:{AUTOPILOT_PORT}{handle}"
+    delay = BACKOFF
+    for attempt in range(RETRIES + 1):
+        try:
             async with session.get(url) as resp:
-                reply = await resp.text()
-    except Exception as e:
-        # If we can't create servers we'll need to exit...something has gone wrong
-        # with the network.
-        log.error(f"Error when creating server on {address} at {handle}: {e}")
-        sys.exit(1)
+                resp.raise_for_status()
+                return await resp.text()
+        except retry_on as e:
+            if attempt == RETRIES:
+                raise
+            log.warning(
+                f"Request to {address} at {handle} failed: {e!r}. Retrying in {delay}s"
+            )
+        await asyncio.sleep(delay)
+        delay *= 2
+
+
+async def make_server_connection(session, semaphore, address, handle):
+    """
+    Handles connections to the target autopilot pod on a different worker-node, at most
+    as many at the same time as the semaphore allows. Any error is retried.
+
+    Args:
+        session (aiohttp.ClientSession): The pooled session.
+        semaphore (asyncio.Semaphore): Bounds the number of requests in flight.
+        address (str): The address of the autopilot pod.
+        handle (str): The endpoint handle for the connection.
 
+    Returns:
+        dict: The JSON reply, {} if it is not JSON, None if the pod could not be reached.
+    """
+    async with semaphore:
+        try:
+            reply = await autopilot_get(
+                session, address, handle, (aiohttp.ClientError, asyncio.TimeoutError)
+            )
+        except Exception as e:
+            log.error(f"Error when calling {address} at {handle}: {e!r}")
+            return None
+    try:
+        return json.loads(reply)
+    except json.JSONDecodeError:
+        return {}
 
-async def make_client_connection(event, iface, src, dst, address, handle):
+
+async def make_client_connection(session, event, iface, src, dst, address, handle):
     # Task waits for the event to be set before starting its work.
+    # Only connection failures are retried: a request that reached the pod may have run the test already.
     try:
         if event != None:
             await event.wait()
-        url = f"http://{address}:{AUTOPILOT_PORT}{handle}"
-        total_timeout = aiohttp.ClientTimeout(total=60 * 10)
-        async with aiohttp.ClientSession(timeout=total_timeout) as session:
-            async with session.get(url) as resp:
-                reply = await resp.text()
-                reply = "".join(reply.split())
-                try:
-                    json_reply = json.loads(reply)
-                except json.JSONDecodeError as e:
-                    log.error(
-                        f"Failed to decode JSON from response: {e}. Response: {reply}"
-                    )
-                    return {"src": src, "dst": dst, "iface": iface, "data": {}}
-
-                return {"src": src, "dst": dst, "iface": iface, "data": json_reply}
+        reply = await autopilot_get(
+            session, address, handle, (aiohttp.ClientConnectorError,)
+        )
+        reply = "".join(reply.split())
+        try:
+            json_reply = json.loads(reply)
+        except json.JSONDecodeError as e:
+            log.error(
+                f"Failed to decode JSON from response: {e}. Response: {reply}"
+            )
+            return {"src": src, "dst": dst, "iface": iface, "data": {}}
+
+        return {"src": src, "dst": dst, "iface": iface, "data": json_reply}
     except Exception as e:
-        log.error(f"Error during client connection to {address} at {handle}: {e}")
+        log.error(f"Error during client connection to {address} at {handle}: {e!r}")
         log.error(f"Failure occured with from src {src} to dst {dst} on iface {iface}")
         return {"src": src, "dst": dst, "iface": iface, "data": {}}
 
 
-async def iperf_start_servers(node_map, num_servers, port_start):
+async def iperf_start_servers(session, semaphore, node_map, num_servers, port_start, owner):
     """
     Starts iperf3 servers on each node by sending requests to the corresponding endpoints
     derived in the node_map. Each server will be launched from the corresponding autopilot
     pod that the endpoint represents on the worker-node.
 
+    The nodes where the servers cannot be started are logged and removed from node_map, so that
+    the workload runs on the other nodes.
+
     Args:
+        session (aiohttp.ClientSession): The pooled session.
+        semaphore (asyncio.Semaphore): Bounds the number of requests in flight.
         node_map (dict): A dictionary mapping worker-nodes to representation data.
         num_servers (str): The number of iperf3 servers to start on each node.
         port_start (str) The port to start launching servers from on each node.
+        owner (str): The workload leasing the servers. Ports leased by other workloads are skipped,
+            so the first port of each node is saved in node_map[node]["port"].
     """
     tasks = [
         make_server_connection(
-            None,
+            session,
+            semaphore,
             node_map[node]["endpoint"],
-            f"/iperfservers?numservers={num_servers}&startport={port_start}",
+            f"/iperfservers?numservers={num_servers}&startport={port_start}&owner={owner}",
         )
         for node in node_map
     ]
-    await asyncio.gather(*tasks)
+    replies = await asyncio.gather(*tasks)
+    for node, reply in list(zip(node_map, replies)):
+        if reply is None:
+            log.error(f"iperf3 servers not available on {node}, the node is skipped")
+            del node_map[node]
+            continue
+        node_map[node]["port"] = reply.get("startport", port_start)
+
+
+def log_start_skew(slot, replies):
+    """
+    Logs how far apart the iperf3 clients of a time slot started, as reported by each node
+    against the requested start time.
+    """
+    skews = {}
+    for (_, source, _), reply in zip(slot, replies):
+        start = reply["data"].get("start")
+        if start and start["skew"]:
+            skews[source] = start["max_skew"]
+    if not skews:
+        return
+    latest = max(skews, key=skews.get)
+    log.info(
+        f"Clients start skew: max {max(skews.values()) * 1000:.1f} ms ({latest}), min {min(skews.values()) * 1000:.1f} ms"
+    )
+    if skews[latest] > LATE_START:
+        log.warning(
+            f"Clients on {latest} started {skews[latest]:.3f}s late, consider a larger --startmargin"
+        )
 
 
-async def run_workload(workload_type, nodemap, workload, num_clients, port_start):
+def print_results(matrix, topk):
+    """
+    Prints the average bandwidth of each interface and the worst links. The full grid is only
+    printed for small clusters, use --output for the whole matrix.
+    """
+    stats = matrix.stats()["iface"]
+    if len(matrix.nodes) <= GRID_MAX_NODES:
+        for i, iface in enumerate(matrix.ifaces):
+            print(f"Network Throughput {iface}:")
+            print(f"{'src/dst':<40}" + "".join(f"{dst:<40}" for dst in matrix.labels))
+            for src, row in zip(matrix.labels, matrix.bitrate[i]):
+                cells = ["N/A" if np.isnan(bitrate) else round(float(bitrate), 2) for bitrate in row]
+                print(f"{src:<40}" + "".join(f"{cell:<40}" for cell in cells))
+            print()
+
+    print(f"Worst {topk} links ({UNITS}):")
+    for link in matrix.worst_links(topk):
+        print(
+            f"{link['iface']} {link['src']} -> {link['dst']}: {link['bitrate']} (z-score {link['zscore']}, retransmits {link['retransmits']}"
+            + (", FAILED)" if link["failed"] else ")")
+        )
+    print()
+
+    print("Overall Network Interface Average Bandwidth:")
+    for i, iface in enumerate(matrix.ifaces):
+        avg = 0.0 if np.isnan(stats["mean"][i]) else round(float(stats["mean"][i]), 2)
+        print(
+            f"{iface} Average Bandwidth Gb/s: {avg}, Retransmits: {stats['retransmits'][i]}, "
+            f"Failed links: {stats['failed'][i]}/{stats['links'][i]}"
+        )
+
+
+def report_verdicts(matrix):
+    """
+    Records the verdict of every node and interface, 1 when its NIC is degraded as a sender or a
+    receiver, with the median bandwidths and their robust z-scores as stats, and prints the
+    degraded ones.
+    """
+    degraded = 0
+    print("Network Interface Verdicts:")
+    for verdict in matrix.verdicts():
+        value = 0 if verdict["verdict"] in (OK, UNKNOWN) else 1
+        stats = {
+            stat: verdict[stat]
+            for stat in ("sender", "receiver", "sender_z", "receiver_z")
+            if verdict[stat] is not None
+        }
+        result.add_value(
+            verdict["node"], value, stats, iface=verdict["iface"], verdict=verdict["verdict"]
+        )
+        if value == 1:
+            degraded += 1
+            print(
+                f"{verdict['iface']} {verdict['label']}: {verdict['verdict']} "
+                f"(sent {verdict['sender']} {UNITS}, z-score {verdict['sender_z']}; "
+                f"received {verdict['receiver']} {UNITS}, z-score {verdict['receiver_z']})"
+            )
+    if degraded == 0:
+        print("No degraded interface")
+        result.set_status(SUCCESS)
+    else:
+        result.set_status(FAIL, f"{degraded} degraded interface(s)")
+
+
+async def run_workload(session, workload_type, nodemap, workload, num_clients, port_start, parallel_ifaces=False):
     """
     Starts network tests according to the specified workload.
 
     Args:
+        session (aiohttp.ClientSession): The pooled session.
         workload_type (str): A workload type to run.
         node_map (dict): A dictionary mapping node names to their endpoints, pods, and network interfaces.
         workload (dict): A dictionary specifying the workload and steps for the network tests.
         num_clients (str): The number of parallel clients to test against the server (used to also increase port val.)
         port_start (str): A port associated to the server,
+        parallel_ifaces (bool): Whether the interfaces are on independent NICs and can be measured at the same time.
+
+    Returns:
+        BandwidthMatrix: The results of the workload.
     """
-    if SupportedWorkload.RING.value == workload_type:
+    if workload_type in (workload.value for workload in SupportedWorkload):
         event = asyncio.Event()
         # All the nodes "should have" the same amount of interfaces...let's just get the first node and check how many there are...
         # This is also assuming that the ordering of the ifaces in this list are accurate...i.e., starting with net1-0 and so forth
         netifaces_count = len(nodemap[next(iter(nodemap))]["netifaces"])
-        results = []
-        for iface in range(netifaces_count):
-            interface_results = []
-            log.info(f"Running Interface net1-{iface}")
-            for step in workload:
-                tasks = []
-                for pair in workload[step]:
-                    for source, target in pair.items():
-                        task = make_client_connection(
-                            event,
-                            f"net1-{iface}",
-                            f"{nodemap[source]['pod']}_on_{source}",
-                            f"{nodemap[target]['pod']}_on_{target}",
-                            nodemap[source]["endpoint"],
-                            f"/iperfclients?dstip={nodemap[target]['netifaces'][iface]}&dstport={port_start}&numclients={num_clients}",
-                        )
-                        tasks.append(task)
-                await asyncio.sleep(1)
-                event.set()
-                res = await asyncio.gather(*tasks)
-                interface_results.append(res)
-            results.append(interface_results)
-
-        grids = []
-        summary_avg = []
-        for i, el in enumerate(results):
-            grid = {}
-            total_bitrate = 0
-            count = 0
-            for l in el:
-                for host in l:
-                    src = host["src"]
-                    dst = host["dst"]
-                    if host["data"] == {}:
-                        # Failure had occured resulting in a 0.0 bitrate.
-                        bitrate = 0.0
-                    else:
-                        bitrate = float(
-                            host["data"]["receiver"]["aggregate"]["bitrate"]
-                        )
-                    count = count + 1
-                    total_bitrate = total_bitrate + bitrate
-                    if src not in grid:
-                        grid[src] = {}
-                    grid[src][dst] = bitrate
-            avg = str(round(Decimal(total_bitrate / count), 2))
-            summary_avg.append(f"net1-{i} Average Bandwidth Gb/s: {avg}")
-            grids.append(grid)
-
-        for i, grid in enumerate(grids):
-            print(f"Network Throughput net1-{i}:")
-            pods = sorted(grid.keys())
-            print(f"{'src/dst':<40}" + "".join(f"{dst:<40}" for pod in pods))
-            for src_pod in pods:
-                row = [f"{grid[src_pod].get(dst_pod, 'N/A'):<40}" for dst_pod in pods]
-                print(f"{src_pod:<40}" + "".join(row))
-            print()
-
-        print("Overall Network Interface Average Bandwidth:")
-        for i in summary_avg:
-            print(i)
+        slots = NetworkWorkload().schedule_link_disjoint(
+            workload, netifaces_count, parallel_ifaces
+        )
+        log.info(
+            f"Running {sum(len(slot) for slot in slots)} pairs on {netifaces_count} interface(s) in {len(slots)} time slots"
+        )
+        matrix = BandwidthMatrix(
+            nodemap.keys(),
+            netifaces_count,
+            [f"{nodemap[node]['pod']}_on_{node}" for node in nodemap],
+        )
+        for index, slot in enumerate(slots):
+            log.info(f"Running time slot {index + 1}/{len(slots)}")
+            # the clients of all the pairs of the slot wait for the same wall clock time
+            startat = time.time() + args["startmargin"]
+            tasks = []
+            for iface, source, target in slot:
+                task = make_client_connection(
+                    session,
+                    event,
+                    f"net1-{iface}",
+                    f"{nodemap[source]['pod']}_on_{source}",
+                    f"{nodemap[target]['pod']}_on_{target}",
+                    nodemap[source]["endpoint"],
+                    f"/iperfclients?dstip={nodemap[target]['netifaces'][iface]}&dstport={nodemap[target].get('port', port_start)}&numclients={num_clients}&startat={startat:.3f}"
+                    + ("&adaptive" if args["adaptive"] else ""),
+                )
+                tasks.append(task)
+            event.set()
+            res = await asyncio.gather(*tasks)
+            log_start_skew(slot, res)
+            for (iface, source, target), host in zip(slot, res):
+                matrix.add(iface, source, target, host["data"])
+
+        print_results(matrix, args["topk"])
+        for path in args["output"] or []:
+            try:
+                matrix.export(path, args["topk"])
+                log.info(f"Bandwidth matrix written to {path}")
+            except (OSError, ValueError) as e:
+                log.error(f"Cannot write the bandwidth matrix to {path}: {e}")
+        return matrix
 
     else:
         log.error("Unsupported Workload Attempted")
         sys.exit(1)
 
 
-async def cleanup_iperf_servers(node_map):
+async def cleanup_iperf_servers(session, semaphore, node_map, owner=""):
     """
-    Removes all started iperf servers across all nodes.
+    Removes all started iperf servers across all nodes, or with owner only releases the
+    servers leased by that workload, keeping them warm for the next run.
 
     Args:
+    session (aiohttp.ClientSession): The pooled session.
+    semaphore (asyncio.Semaphore): Bounds the number of requests in flight.
     node_map (dict): A dictionary mapping worker-nodes to representation data.
+    owner (str): The workload whose servers are released.
     """
+    handle = f"/iperfstopservers?owner={owner}" if owner else "/iperfstopservers"
     tasks = [
         make_server_connection(
-            None,
+            session,
+            semaphore,
             node_map[node]["endpoint"],
-            f"/iperfstopservers",
+            handle,
         )
         for node in node_map
     ]
@@ -220,37 +459,47 @@ async def main():
     num_parallel_clients = args["pclients"]
     port_start = args["startport"]
     cleanup_iperf = args["cleanup"]
+    owner = f"{CURR_POD_NAME}-{os.getpid()}-{int(time.time())}"
 
     wl = NetworkWorkload()
     autopilot_node_map = wl.gen_autopilot_node_map_json()
-    if type_of_workload in (workload.value for workload in SupportedWorkload):
-        if SupportedWorkload.RING.value == type_of_workload:
-            ring_workload = wl.generate_ring_topology_json(autopilot_node_map)
-            await iperf_start_servers(
-                autopilot_node_map, num_parallel_clients, port_start
-            )
-            await run_workload(
-                type_of_workload,
-                autopilot_node_map,
-                ring_workload,
-                num_parallel_clients,
-                port_start,
-            )
-
-        else:
-            #
-            # TODO: Build other workloads...
-            #
-            log.error("Unsupported Workload Attempted")
-            sys.exit(1)
-    else:
+    if type_of_workload not in (workload.value for workload in SupportedWorkload):
         log.error("Unsupported Workload Attempted")
-        sys.exit(1)
-
-    if cleanup_iperf:
-        await cleanup_iperf_servers(autopilot_node_map)
+        result.set_status(ABORT, f"Unsupported workload {args['workload']}")
+        # exit status 0, the daemon drops the record of a failed process
+        return
+
+    async with create_session() as session:
+        semaphore = asyncio.Semaphore(args["maxconnections"])
+        await iperf_start_servers(
+            session, semaphore, autopilot_node_map, num_parallel_clients, port_start, owner
+        )
+        if len(autopilot_node_map) < 2:
+            log.error("iperf3 servers are available on less than 2 nodes. ABORT")
+            result.set_status(ABORT, "iperf3 servers are available on less than 2 nodes")
+            await cleanup_iperf_servers(session, semaphore, autopilot_node_map, "" if cleanup_iperf else owner)
+            return
+        generator = wl.workload_generator(
+            type_of_workload, autopilot_node_map, args["steps"], args["leaflabel"]
+        )
+        log.info(generator.describe())
+        matrix = await run_workload(
+            session,
+            type_of_workload,
+            autopilot_node_map,
+            generator.generate(),
+            num_parallel_clients,
+            port_start,
+            args["parallelifaces"],
+        )
+        report_verdicts(matrix)
 
+        if cleanup_iperf:
+            await cleanup_iperf_servers(session, semaphore, autopilot_node_map)
+        else:
+            await cleanup_iperf_servers(session, semaphore, autopilot_node_map, owner)
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    with result.capture(args["json"]):
+        asyncio.run(main())
 
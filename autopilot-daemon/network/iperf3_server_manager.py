@@ -0,0 +1,206 @@
+from iperf3_utils import *
+import fcntl
+import time
+
+#
+# Tracks the iperf3 servers of this pod by PID, so that they can be reused across bandwidth runs
+# instead of being started and killed every time.
+#
+# The state lives in a JSON file guarded by an flock, since the start/stop scripts of concurrent
+# workloads run as separate processes:
+#   servers: "ip:port" -> {"ip", "port", "iface", "pid", "started", "last_used"}
+#   leases:  owner -> {"ports": [...], "expires"}
+#
+# Each workload (owner) leases a block of ports. A block leased by another owner is never handed
+# out again until it is released or expires, so concurrent workloads do not share servers.
+# Servers are started in their own session (process group), checked by PID and by their listening
+# socket, and stopped with killpg. Servers that are not leased for IDLE_TIMEOUT are stopped.
+#
+
+STATE_FILE = "/tmp/autopilot-iperf3-servers.json"
+LOCK_FILE = STATE_FILE + ".lock"
+LEASE_TTL = 3600  # seconds, a lease not released by its workload (e.g. aborted run) expires after that
+IDLE_TIMEOUT = 3600  # seconds, warm servers not leased for that long are stopped
+STARTUP_TIMEOUT = 5  # seconds for a new server to listen
+MAX_PORT = 65535
+
+
+def process_alive(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # pid (comm) state ...
+            state = f.read().rsplit(")", 1)[1].split()[0]
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            cmdline = f.read()
+    except (OSError, IndexError):
+        return False
+    # the PID may have been reused by something else
+    return state != "Z" and b"iperf3" in cmdline
+
+
+def listening_ports():
+    ports = set()
+    for table in ("/proc/net/tcp", "/proc/net/tcp6"):
+        try:
+            with open(table) as f:
+                next(f)
+                for line in f:
+                    fields = line.split()
+                    # local_address is ip:port in hex, state 0A is LISTEN
+                    if fields[3] == "0A":
+                        ports.add(int(fields[1].rsplit(":", 1)[1], 16))
+        except OSError:
+            continue
+    return ports
+
+
+class ServerManager:
+    def __init__(self, state_file=STATE_FILE, lock_file=LOCK_FILE):
+        self.state_file = state_file
+        self.lock_file = lock_file
+        self.state = {"servers": {}, "leases": {}}
+
+    def __enter__(self):
+        self.lock = open(self.lock_file, "w")
+        fcntl.flock(self.lock, fcntl.LOCK_EX)
+        try:
+            with open(self.state_file) as f:
+                self.state = json.load(f)
+        except (OSError, ValueError):
+            self.state = {"servers": {}, "leases": {}}
+        self.reap()
+        return self
+
+    def __exit__(self, *exc):
+        tmp = self.state_file + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp, self.state_file)
+        fcntl.flock(self.lock, fcntl.LOCK_UN)
+        self.lock.close()
+        return False
+
+    def reap(self):
+        """
+        Forgets the servers that died, drops the expired leases and stops the servers idle for too long.
+        """
+        now = time.time()
+        servers, leases = self.state["servers"], self.state["leases"]
+        for owner in [o for o, lease in leases.items() if lease["expires"] < now]:
+            log.info(f"Lease of {owner} expired")
+            del leases[owner]
+        leased = {port for lease in leases.values() for port in lease["ports"]}
+        for key, server in list(servers.items()):
+            if not process_alive(server["pid"]):
+                del servers[key]
+            elif server["port"] not in leased and now - server["last_used"] > IDLE_TIMEOUT:
+                self.stop(server)
+                del servers[key]
+
+    def leased_by_others(self, owner):
+        return {
+            port
+            for o, lease in self.state["leases"].items()
+            if o != owner
+            for port in lease["ports"]
+        }
+
+    def acquire(self, interfaces, numservers, startport, owner, ttl=LEASE_TTL):
+        """
+        Leases numservers ports, from startport or the next free block, and makes sure a server
+        listens on each of them on every interface, reusing the ones already running.
+
+        Args:
+            interfaces (list): (iface, ip) tuples to bind the servers to.
+            numservers (int): The number of ports to lease.
+            startport (int): The first port of the preferred block.
+            owner (str): The workload leasing the ports.
+            ttl (int): Seconds after which the lease expires if not released.
+
+        Returns:
+            dict: The first port of the leased block, and the number of servers reused and started.
+        """
+        taken = self.leased_by_others(owner)
+        port = startport
+        while any(p in taken for p in range(port, port + numservers)):
+            port += numservers
+        if port + numservers - 1 > MAX_PORT:
+            raise RuntimeError(f"No block of {numservers} free ports from {startport}")
+        ports = list(range(port, port + numservers))
+
+        reused, started = 0, []
+        for iface, ip in interfaces:
+            for p in ports:
+                server = self.state["servers"].get(f"{ip}:{p}")
+                if server is not None and process_alive(server["pid"]):
+                    server["last_used"] = time.time()
+                    reused += 1
+                    continue
+                started.append(self.start(iface, ip, p))
+        self.wait_listening(started)
+        self.state["leases"][owner] = {"ports": ports, "expires": time.time() + ttl}
+        return {"startport": port, "reused": reused, "started": len(started)}
+
+    def start(self, iface, ip, port):
+        log.info(
+            f"Starting iperf3 server {ip}:{port} using {iface} in {CURR_POD_NAME} on {CURR_WORKER_NODE_NAME}..."
+        )
+        # a new session makes the server the leader of its own process group
+        process = subprocess.Popen(
+            ["iperf3", "-s", "-B", ip, "-p", str(port)],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        server = {
+            "ip": ip,
+            "port": port,
+            "iface": iface,
+            "pid": process.pid,
+            "started": time.time(),
+            "last_used": time.time(),
+        }
+        self.state["servers"][f"{ip}:{port}"] = server
+        return server
+
+    def wait_listening(self, servers):
+        deadline = time.time() + STARTUP_TIMEOUT
+        pending = list(servers)
+        while pending:
+            ports = listening_ports()
+            for server in list(pending):
+                if not process_alive(server["pid"]):
+                    del self.state["servers"][f"{server['ip']}:{server['port']}"]
+                    raise RuntimeError(
+                        f"Server failed to start on {server['ip']}:{server['port']} using {server['iface']} in {CURR_POD_NAME} on {CURR_WORKER_NODE_NAME}"
+                    )
+                if server["port"] in ports:
+                    pending.remove(server)
+            if pending and time.time() > deadline:
+                raise RuntimeError(
+                    f"Servers not listening after {STARTUP_TIMEOUT}s: {[s['ip'] + ':' + str(s['port']) for s in pending]}"
+                )
+            if pending:
+                time.sleep(0.05)
+
+    def release(self, owner):
+        """Ends the lease of owner. Its servers stay up for the next workload."""
+        if self.state["leases"].pop(owner, None) is not None:
+            log.info(f"Released the ports of {owner}, servers kept warm")
+
+    def stop(self, server):
+        if not process_alive(server["pid"]):
+            return
+        try:
+            os.killpg(server["pid"], signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        except PermissionError:
+            log.error(f"Permission denied: could not stop the iperf3 server with PID {server['pid']}")
+
+    def stop_all(self):
+        for server in self.state["servers"].values():
+            self.stop(server)
+        log.info(f"Stopped {len(self.state['servers'])} iperf3 servers in {CURR_POD_NAME} on {CURR_WORKER_NODE_NAME}")
+        self.state = {"servers": {}, "leases": {}}
@@ -1,15 +1,53 @@
 import argparse
 import asyncio
 import json
-from decimal import Decimal
+import math
+import re
+import statistics
+import time
 from iperf3_utils import *
 
 parser = argparse.ArgumentParser()
 parser.add_argument("--dstip", type=str, default="", help="IP for iperf3 server")
 parser.add_argument("--dstport", type=int, default=5200, help="Port for iperf3 server")
 parser.add_argument("--numclients", type=int, default=1, help="Number of clients")
+parser.add_argument("--duration", type=int, default=5, help="Duration of the test in seconds. Default is 5")
+parser.add_argument(
+    "--adaptive",
+    action="store_true",
+    help=(
+        "Stop each client as soon as the 95%% confidence interval of its throughput is within --tolerance of the mean, "
+        "or let it run up to --maxduration seconds when the link is unstable."
+    ),
+)
+parser.add_argument("--maxduration", type=int, default=10, help="Maximum duration in seconds of an adaptive test. Default is 10")
+parser.add_argument("--tolerance", type=float, default=0.05, help="Relative half-width of the confidence interval that stops an adaptive test. Default is 0.05")
+parser.add_argument(
+    "--startat",
+    type=float,
+    default=0.0,
+    help="Wall clock time, in seconds since the epoch, at which the clients start, so that the clients of all the nodes start together. Default is now",
+)
 args = parser.parse_args()
 
+# Everything is reported in bytes and bits per second, as in the iperf3 JSON output (-J).
+# The per-second interval samples of the clients are summed second by second, so that dips of the
+# aggregate throughput inside the test window show up in the percentiles.
+# The start time of each client is reported, so the start skew against --startat shows how well
+# the clients of a step overlapped.
+
+
+def empty_result(dstip, dstport, started=None):
+    return {
+        "interface": {"ip": dstip, "port": dstport},
+        "started": started,
+        "results": {
+            "sender": {"transfer": 0.0, "bitrate": 0.0, "retransmits": 0},
+            "receiver": {"transfer": 0.0, "bitrate": 0.0},
+            "intervals": [],
+        },
+    }
+
 
 async def run_iperf_client(dstip, dstport, iteration, duration_seconds):
     dstport += iteration
@@ -24,127 +62,258 @@ async def run_iperf_client(dstip, dstport, iteration, duration_seconds):
         "-i",
         "1.0",
         "-Z",
+        "-J",
     ]
 
-    default_res = {
+    try:
+        process = await asyncio.wait_for(
+            asyncio.create_subprocess_exec(
+                *command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+            ),
+            timeout=60,
+        )
+        started = time.time()
+        stdout, stderr = await process.communicate()
+    except Exception as e:
+        log.error(f"iperf3 client to {dstip}:{dstport} failed: {e}")
+        return empty_result(dstip, dstport)
+
+    try:
+        report = json.loads(stdout)
+    except json.JSONDecodeError:
+        log.error(f"iperf3 client to {dstip}:{dstport} exited with {process.returncode}: {stderr.decode().strip()}")
+        return empty_result(dstip, dstport, started)
+    # iperf3 -J reports its own failures in the "error" field, also with a zero exit code
+    if process.returncode != 0 or "error" in report:
+        log.error(f"iperf3 client to {dstip}:{dstport} failed: {report.get('error', stderr.decode().strip())}")
+        return empty_result(dstip, dstport, started)
+
+    sent = report["end"]["sum_sent"]
+    received = report["end"]["sum_received"]
+    return {
         "interface": {"ip": dstip, "port": dstport},
+        "started": started,
         "results": {
             "sender": {
-                "transfer": {"rate": 0.0, "units": "n/a"},
-                "bitrate": {"rate": 0.0, "units": "n/a"},
+                "transfer": float(sent["bytes"]),
+                "bitrate": float(sent["bits_per_second"]),
+                "retransmits": int(sent.get("retransmits", 0)),
             },
             "receiver": {
-                "transfer": {"rate": 0.0, "units": "n/a"},
-                "bitrate": {"rate": 0.0, "units": "n/a"},
+                "transfer": float(received["bytes"]),
+                "bitrate": float(received["bits_per_second"]),
             },
+            # omitted intervals (-O) are warm-up and not part of the measure
+            "intervals": [
+                float(interval["sum"]["bits_per_second"])
+                for interval in report.get("intervals", [])
+                if not interval["sum"].get("omitted", False)
+            ],
         },
     }
 
+
+# Adaptive mode: iperf3 prints one line per second in text mode (-f m --forceflush), the client is
+# stopped with SIGINT once the samples have converged. An interrupted client has no receiver summary,
+# so the result is computed from the interval samples, unless the test ran to --maxduration.
+INTERVAL_LINE = re.compile(
+    r"\[\s*\d+\]\s+[\d.]+-[\d.]+\s+sec\s+([\d.]+)\s+([KMGT]?)Bytes\s+([\d.]+)\s+([KMGT]?)bits/sec\s*(\d+)?"
+)
+# iperf3 prints the transfer in 1024-based units whatever -f says, the bitrate in 1000-based ones
+BYTE_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+BIT_UNITS = {"": 1, "K": 1e3, "M": 1e6, "G": 1e9, "T": 1e12}
+MIN_SAMPLES = 3
+# two-sided 95% Student t, by degrees of freedom
+T_95 = {2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306, 9: 2.262}
+
+
+def converged(samples, tolerance):
+    if len(samples) < MIN_SAMPLES:
+        return False
+    mean = statistics.mean(samples)
+    if mean <= 0:
+        return False
+    half_width = T_95.get(len(samples) - 1, 2.0) * statistics.stdev(samples) / math.sqrt(len(samples))
+    return half_width <= tolerance * mean
+
+
+async def run_iperf_client_adaptive(dstip, dstport, iteration, max_seconds, tolerance):
+    dstport += iteration
+    command = [
+        "iperf3",
+        "-c",
+        dstip,
+        "-p",
+        str(dstport),
+        "-t",
+        str(max_seconds),
+        "-i",
+        "1.0",
+        "-Z",
+        # the first second is slow start
+        "-O",
+        "1",
+        "-f",
+        "m",
+        "--forceflush",
+    ]
+    samples, transfer, retransmits = [], 0.0, 0
+    receiver = None
+    process = None
+    started = None
     try:
-        process = await asyncio.wait_for(
-            asyncio.create_subprocess_exec(
-                *command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
-            ),
-            timeout=60,
+        process = await asyncio.create_subprocess_exec(
+            *command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
         )
-        stdout, stderr = await process.communicate()
-        output_filename = f"{dstip}_{dstport}_client.log"
-        with open(output_filename, "w") as f:
-            f.write(stdout.decode())
+        started = time.time()
+        stopped = False
+        while True:
+            line = await asyncio.wait_for(process.stdout.readline(), timeout=max_seconds + 30)
+            if not line:
+                break
+            line = line.decode()
+            match = INTERVAL_LINE.search(line)
+            if not match or "omitted" in line or "sender" in line:
+                continue
+            # a test that ran to the end has the summary of the server side
+            if "receiver" in line:
+                if not stopped:
+                    receiver = {
+                        "transfer": float(match.group(1)) * BYTE_UNITS[match.group(2)],
+                        "bitrate": float(match.group(3)) * BIT_UNITS[match.group(4)],
+                    }
+                continue
+            # the interval cut short by SIGINT is partial, it is not a sample
+            if stopped:
+                continue
+            transfer += float(match.group(1)) * BYTE_UNITS[match.group(2)]
+            samples.append(float(match.group(3)) * BIT_UNITS[match.group(4)])
+            retransmits += int(match.group(5) or 0)
+            if converged(samples, tolerance):
+                process.send_signal(signal.SIGINT)
+                stopped = True
+        await process.wait()
     except Exception as e:
-        return {"interface": {"ip": dstip, "port": dstport}, "results": default_res}
+        log.error(f"iperf3 client to {dstip}:{dstport} failed: {e}")
+        if process is not None and process.returncode is None:
+            process.kill()
+        return empty_result(dstip, dstport, started)
 
-    # In theory this should not occur since we catch this above...but just to be safe let's ensure
-    # the return code is zero...
-    if process.returncode != 0:
-        return {"interface": {"ip": dstip, "port": dstport}, "results": default_res}
-
-    result = {
-        "sender": {
-            "transfer": {"rate": 0.0, "units": "n/a"},
-            "bitrate": {"rate": 0.0, "units": "n/a"},
-        },
-        "receiver": {
-            "transfer": {"rate": 0.0, "units": "n/a"},
-            "bitrate": {"rate": 0.0, "units": "n/a"},
+    if not samples:
+        stderr = await process.stderr.read()
+        log.error(f"iperf3 client to {dstip}:{dstport} exited with {process.returncode}: {stderr.decode().strip()}")
+        return empty_result(dstip, dstport, started)
+    bitrate = statistics.mean(samples)
+    return {
+        "interface": {"ip": dstip, "port": dstport},
+        "started": started,
+        "results": {
+            "sender": {"transfer": transfer, "bitrate": bitrate, "retransmits": retransmits},
+            "receiver": receiver or {"transfer": transfer, "bitrate": bitrate},
+            "intervals": samples,
         },
     }
-    iperf3_stdout = stdout.decode().strip().splitlines()
-    for line in iperf3_stdout:
-        line = line.lower()
-        if "sender" in line:
-            parts = line.split()
-            result["sender"]["transfer"] = {"rate": parts[4], "units": parts[5]}
-            result["sender"]["bitrate"] = {"rate": parts[6], "units": parts[7]}
-        elif "receiver" in line:
-            parts = line.split()
-            result["receiver"]["transfer"] = {"rate": parts[4], "units": parts[5]}
-            result["receiver"]["bitrate"] = {"rate": parts[6], "units": parts[7]}
-    return {"interface": {"ip": dstip, "port": dstport}, "results": result}
+
+
+def percentile(values, p):
+    """Linear interpolation between the closest ranks, p in [0, 100]."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    rank = (len(values) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
 
 
 def calculate_stats(values, num_clients):
     return {
         "aggregate": {
-            "transfer": str(round(Decimal(sum(values["transfer"])), 2)),
-            "bitrate": str(round(Decimal(sum(values["bitrate"])), 2)),
+            "transfer": sum(values["transfer"]),
+            "bitrate": sum(values["bitrate"]),
         },
         "mean": {
-            "transfer": str(round(Decimal(sum(values["transfer"]) / num_clients), 2)),
-            "bitrate": str(round(Decimal(sum(values["bitrate"]) / num_clients), 2)),
+            "transfer": sum(values["transfer"]) / num_clients,
+            "bitrate": sum(values["bitrate"]) / num_clients,
         },
         "min": {
-            "transfer": str(round(Decimal(min(values["transfer"])), 2)),
-            "bitrate": str(round(Decimal(min(values["bitrate"])), 2)),
+            "transfer": min(values["transfer"]),
+            "bitrate": min(values["bitrate"]),
         },
         "max": {
-            "transfer": str(round(Decimal(max(values["transfer"])), 2)),
-            "bitrate": str(round(Decimal(max(values["bitrate"])), 2)),
+            "transfer": max(values["transfer"]),
+            "bitrate": max(values["bitrate"]),
         },
     }
 
 
+def calculate_interval_stats(results):
+    # aggregate bitrate of all the clients, second by second
+    seconds = max((len(r["results"]["intervals"]) for r in results), default=0)
+    aggregate = [
+        sum(r["results"]["intervals"][i] for r in results if i < len(r["results"]["intervals"]))
+        for i in range(seconds)
+    ]
+    return {
+        "samples": aggregate,
+        "p5": percentile(aggregate, 5),
+        "p50": percentile(aggregate, 50),
+        "p95": percentile(aggregate, 95),
+        "min": min(aggregate, default=0.0),
+    }
+
+
+def calculate_start_stats(results, startat):
+    # seconds between the requested start and the actual start of each client
+    skews = [r["started"] - startat for r in results if r["started"] is not None]
+    return {
+        "startat": startat,
+        "skew": skews,
+        "max_skew": max(skews, key=abs, default=0.0),
+    }
+
+
 async def main():
     dstip, dstport, numclients = args.dstip, args.dstport, args.numclients
-    duration_seconds = "5"
 
-    tasks = [
-        asyncio.create_task(run_iperf_client(dstip, dstport, i, duration_seconds))
-        for i in range(numclients)
-    ]
+    startat = args.startat or time.time()
+    delay = startat - time.time()
+    if delay > 0:
+        await asyncio.sleep(delay)
+    elif args.startat:
+        log.warning(f"Clients to {dstip} started {-delay:.3f}s after the requested start time")
+
+    if args.adaptive:
+        tasks = [
+            asyncio.create_task(
+                run_iperf_client_adaptive(dstip, dstport, i, args.maxduration, args.tolerance)
+            )
+            for i in range(numclients)
+        ]
+    else:
+        tasks = [
+            asyncio.create_task(run_iperf_client(dstip, dstport, i, str(args.duration)))
+            for i in range(numclients)
+        ]
     results = await asyncio.gather(*tasks)
 
     sender_values = {"transfer": [], "bitrate": []}
     receiver_values = {"transfer": [], "bitrate": []}
-
-    total_results = {}
-    for idx, result in enumerate(results):
-        total_results[str(idx)] = result
-        sender_values["transfer"].append(
-            float(result["results"]["sender"]["transfer"]["rate"])
-        )
-        sender_values["bitrate"].append(
-            float(result["results"]["sender"]["bitrate"]["rate"])
-        )
-        receiver_values["transfer"].append(
-            float(result["results"]["receiver"]["transfer"]["rate"])
-        )
-        receiver_values["bitrate"].append(
-            float(result["results"]["receiver"]["bitrate"]["rate"])
-        )
+    for result in results:
+        for key in ("transfer", "bitrate"):
+            sender_values[key].append(result["results"]["sender"][key])
+            receiver_values[key].append(result["results"]["receiver"][key])
 
     stats = {
+        "units": {"transfer": "bytes", "bitrate": "bits/s"},
         "sender": calculate_stats(sender_values, numclients),
         "receiver": calculate_stats(receiver_values, numclients),
+        "retransmits": sum(r["results"]["sender"]["retransmits"] for r in results),
+        "intervals": calculate_interval_stats(results),
+        "start": calculate_start_stats(results, startat),
     }
-
-    total_results["stats"] = stats
-    summary_file = f"{dstip}_summary.json"
-    with open(summary_file, "w") as f:
-        json.dump(total_results, f, indent=4)
     print(json.dumps(stats, indent=4))
 
 
 if __name__ == "__main__":
     asyncio.run(main())
-
@@ -1,4 +1,5 @@
 from iperf3_utils import *
+from iperf3_server_manager import ServerManager
 
 parser = argparse.ArgumentParser()
 parser.add_argument(
@@ -20,10 +21,24 @@ parser.add_argument(
         "to generate servers will automatically increase to accomdate the clients running in parallel."
     ),
 )
+
+parser.add_argument(
+    "--owner",
+    type=str,
+    default="default",
+    help=(
+        "The workload leasing the servers. If the ports from startport are leased by another workload, "
+        "the next free block of ports is used. The first port used is printed as JSON."
+    ),
+)
 args = vars(parser.parse_args())
 
 
 def main():
+    import netifaces
+    from kubernetes import client, config
+    from kubernetes.client.rest import ApiException
+
     num_server = args["numservers"]
     port = args["startport"]
     interfaces = []
@@ -73,28 +88,27 @@ def main():
         )
         sys.exit(1)
 
+    bindings = []
     for iface in interfaces:
-        for i in range(num_server):
-            try:
-                address = netifaces.ifaddresses(iface)
-                ip = address[netifaces.AF_INET][0]["addr"]
-                command = ["iperf3", "-s", "-B", ip, "-p", str(port + i), "-D"]
-                log.info(
-                    f"Starting iperf3 server {ip}:{port + i} using {iface} in {CURR_POD_NAME} on {CURR_WORKER_NODE_NAME}..."
-                )
-                subprocess.run(command, text=True, capture_output=True, check=True)
-            except subprocess.CalledProcessError as e:
-                log.error(
-                    f"Server failed to start on {ip}:{port + i} using {iface} in {CURR_POD_NAME} on {CURR_WORKER_NODE_NAME}.\n "
-                    f"Exited with error: {e.stderr}"
-                )
-                sys.exit(1)
-            except KeyError:
-                log.error(
-                    f"No AF_INET (IPv4) address found for interface {iface} in {CURR_POD_NAME} on {CURR_WORKER_NODE_NAME}."
-                )
-                sys.exit(1)
+        try:
+            address = netifaces.ifaddresses(iface)
+            bindings.append((iface, address[netifaces.AF_INET][0]["addr"]))
+        except KeyError:
+            log.error(
+                f"No AF_INET (IPv4) address found for interface {iface} in {CURR_POD_NAME} on {CURR_WORKER_NODE_NAME}."
+            )
+            sys.exit(1)
 
+    try:
+        with ServerManager() as manager:
+            leased = manager.acquire(bindings, num_server, port, args["owner"])
+    except RuntimeError as e:
+        log.error(str(e))
+        sys.exit(1)
+    log.info(
+        f"{leased['reused']} iperf3 servers reused, {leased['started']} started, ports from {leased['startport']}"
+    )
+    print(json.dumps(leased))
 
 if __name__ == "__main__":
     main()
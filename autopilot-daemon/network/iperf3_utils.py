@@ -1,19 +1,15 @@
 from enum import Enum
 from decimal import Decimal
 import argparse
-import asyncio
 import logging
-import aiohttp
 import os
 import json
-import requests
-import netifaces
 import subprocess
 import sys
 import signal
 
-from kubernetes import client, config
-from kubernetes.client.rest import ApiException
+# Every iperf script star-imports this file, so only light standard library modules belong here.
+# asyncio, kubernetes, aiohttp and netifaces are imported by the scripts that use them.
 
 log = logging.getLogger(__name__)
 logging.basicConfig(
@@ -22,13 +18,6 @@ logging.basicConfig(
 )
 
 
-#
-# TODO: Add this to network_workload.py
-#
-class SupportedWorkload(Enum):
-    RING = "RING"
-
-
 CURR_POD_NAME = os.getenv("POD_NAME")
 CURR_WORKER_NODE_NAME = os.getenv("NODE_NAME")
 AUTOPILOT_NAMESPACE = os.getenv("NAMESPACE")
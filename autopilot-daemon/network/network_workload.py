@@ -1,10 +1,151 @@
 from iperf3_utils import *
+from abc import ABC, abstractmethod
+from enum import Enum
+import random
+from kubernetes import client, config
+from kubernetes.client.rest import ApiException
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+from inventory import get_inventory, list_all
+
+
+class SupportedWorkload(Enum):
+    RING = "RING"
+    BISECTION = "BISECTION"
+    RANDOM = "RANDOM"
+    HIERARCHICAL = "HIERARCHICAL"
+
+
+class WorkloadGenerator(ABC):
+    """
+    Generates the steps of a network workload. Each step is a list of {source: target} pairs
+    where every node sends at most once and receives at most once, and steps are numbered from 1.
+    With max_steps, only the first max_steps steps are run, to fit a check into a time budget.
+    """
+
+    def __init__(self, nodes, max_steps=0):
+        self.nodes = list(nodes)
+        self.max_steps = max_steps
+
+    @abstractmethod
+    def all_steps(self):
+        """Returns the list of all the steps of the workload, each a list of (source, target)."""
+
+    def generate(self):
+        steps = self.all_steps()
+        if self.max_steps > 0:
+            steps = steps[: self.max_steps]
+        return {
+            t + 1: [{source: target} for source, target in step]
+            for t, step in enumerate(steps)
+        }
+
+    def expected_steps(self):
+        return len(self.generate())
+
+    def expected_pairs(self):
+        return sum(len(step) for step in self.generate().values())
+
+    def describe(self):
+        return (
+            f"{type(self).__name__}: {len(self.nodes)} nodes, "
+            f"{self.expected_steps()} steps, {self.expected_pairs()} pairs per interface"
+        )
+
+
+class RingWorkload(WorkloadGenerator):
+    """Step t: every node sends to the node t positions ahead. N-1 steps cover all the N(N-1) pairs."""
+
+    def all_steps(self):
+        n = len(self.nodes)
+        if n < 2:
+            return []
+        return [
+            [(self.nodes[i], self.nodes[(i + t) % n]) for i in range(n)]
+            for t in range(1, n)
+        ]
+
+
+class BisectionWorkload(WorkloadGenerator):
+    """
+    The nodes are split in two halves that exchange traffic in both directions at every step,
+    measuring the bisection bandwidth. |larger half| steps cover all the pairs across the halves.
+    """
+
+    def all_steps(self):
+        half = len(self.nodes) // 2
+        left, right = self.nodes[:half], self.nodes[half:]
+        steps = []
+        for t in range(len(right) if half > 0 else 0):
+            step = []
+            for i, source in enumerate(left):
+                target = right[(i + t) % len(right)]
+                step.append((source, target))
+                step.append((target, source))
+            steps.append(step)
+        return steps
+
+
+class RandomPermutationWorkload(WorkloadGenerator):
+    """
+    Every step is a random cyclic permutation of the nodes, so each node sends to and receives
+    from one random peer. Samples the all-to-all pairs within the steps budget (default 8 steps).
+    """
+
+    DEFAULT_STEPS = 8
+
+    def __init__(self, nodes, max_steps=0, seed=None):
+        super().__init__(nodes, max_steps or self.DEFAULT_STEPS)
+        self.seed = seed
+        self._steps = None
+
+    def all_steps(self):
+        # generated once, so that the reported steps and pairs are the ones that run
+        if self._steps is None:
+            rng = random.Random(self.seed)
+            self._steps = []
+            if len(self.nodes) > 1:
+                for _ in range(min(self.max_steps, len(self.nodes) - 1)):
+                    order = rng.sample(self.nodes, len(self.nodes))
+                    self._steps.append(
+                        [(order[i], order[(i + 1) % len(order)]) for i in range(len(order))]
+                    )
+        return self._steps
+
+
+class HierarchicalRailWorkload(WorkloadGenerator):
+    """
+    Rail/leaf aware workload. The nodes are grouped by leaf (the value of a node label): first a ring
+    inside every leaf, all the leaves at the same time, then a ring across the leaves where node k of
+    a leaf sends to node k of the other leaf, i.e. on the same rail.
+    """
+
+    def __init__(self, nodes, leaves, max_steps=0):
+        super().__init__(nodes, max_steps)
+        self.leaves = {}
+        for node in self.nodes:
+            self.leaves.setdefault(leaves.get(node, ""), []).append(node)
+
+    def all_steps(self):
+        groups = [self.leaves[leaf] for leaf in sorted(self.leaves)]
+        steps = []
+        for t in range(1, max(len(group) for group in groups) if groups else 0):
+            step = []
+            for group in groups:
+                if t < len(group):
+                    step.extend(
+                        (group[i], group[(i + t) % len(group)]) for i in range(len(group))
+                    )
+            steps.append(step)
+        for t in range(1, len(groups)):
+            step = []
+            for i, group in enumerate(groups):
+                peer = groups[(i + t) % len(groups)]
+                for k in range(min(len(group), len(peer))):
+                    step.append((group[k], peer[k]))
+            steps.append(step)
+        return steps
 
-#
-# TODO: Make this an abstract class...
-#
-#
 
 
 class NetworkWorkload:
@@ -20,6 +161,7 @@ class NetworkWorkload:
         try:
             config.load_incluster_config()
             self.v1 = client.CoreV1Api()
+            self.inventory = get_inventory(self.namespace)
         except:
             self.log.error("Failed to load Kubernetes CoreV1API.")
             exit(1)
@@ -28,43 +170,17 @@ class NetworkWorkload:
         address_map = {}
 
         try:
-            autopilot_pods = self.v1.list_namespaced_pod(
-                namespace=self.namespace, label_selector="app=autopilot"
-            )
+            pods = self.inventory.ensure_synced(('pods',)).pods()
         except ApiException as e:
             self.log.error(
                 "Exception when calling CoreV1Api->list_namespaced_pod: %s\n" % e
             )
             exit(1)
-        entrylist = json.loads('{}')
-        for pod in autopilot_pods.items:
-            try:
-                entrylist = json.loads(
-                    pod.metadata.annotations["k8s.v1.cni.cncf.io/network-status"]
-                )
-            except KeyError:
-                log.info(
-                    f'Key k8s.v1.cni.cncf.io/network-status not found on pod "{CURR_POD_NAME}" on "{CURR_WORKER_NODE_NAME}"')
-            if len(entrylist) > 0:
-                for entry in entrylist:
-                    try:
-                        iface = entry["interface"]
-                    except KeyError:
-                        self.log.info("Interface key name not found, assigning 'k8s-pod-network'.")
-                        iface = "k8s-pod-network"
-                    if address_map.get(iface) == None:
-                        address_map[iface] = []
-                    address_map.get(iface).append((pod.spec.node_name, entry["ips"]))
-            else:
-                pod_ips = pod.status.pod_i_ps
-                if pod_ips != None:
-                    iface = "default"
-                    if address_map.get(iface) == None:
-                        address_map[iface] = []
-                    ips = []
-                    for pod_ip in pod_ips:
-                        ips.append(pod_ip.ip)
-                    address_map.get(iface).append((pod.spec.node_name, ips))
+        for pod in pods:
+            for iface, entry in pod.interfaces.items():
+                if address_map.get(iface) == None:
+                    address_map[iface] = []
+                address_map.get(iface).append((pod.node, entry["ips"]))
 
         if len(address_map) == 0:
             self.log.error("No interfaces found. FAIL.")
@@ -80,29 +196,20 @@ class NetworkWorkload:
         # Proposal, warn the user at least that NOT ALL work nodes will be tested...
         #
         try:
-            endpoints = self.v1.list_namespaced_endpoints(
-                self.namespace,
-                field_selector="metadata.name=autopilot-healthchecks",
-            )
+            endpoints = self.inventory.ensure_synced(('endpointslices',)).endpoints()
         except ApiException as e:
             self.log.error(
-                "Exception when calling Kubernetes CoreV1Api->list_namespaced_endpoints: %s\n"
+                "Exception when calling Kubernetes DiscoveryV1Api->list_namespaced_endpoint_slice: %s\n"
                 % e
             )
             exit(1)
 
         autopilot_node_map = {}
-        for endpointslice in endpoints.items:
-            addresses = endpointslice.subsets[0].addresses
-            for item in addresses:
-                node_name = item.node_name
-                if node_name not in autopilot_node_map:
-                    pod_name = item.target_ref.name
-                    ip_address = item.ip
-                    autopilot_node_map[node_name] = {
-                        "pod": pod_name,
-                        "endpoint": ip_address,
-                    }
+        for item in endpoints:
+            autopilot_node_map[item.node_name] = {
+                "pod": item.pod,
+                "endpoint": item.ip,
+            }
 
         addresses = self.get_all_ifaces()
         for add in addresses:
@@ -118,18 +225,81 @@ class NetworkWorkload:
                 return autopilot_node_map
 
     def generate_ring_topology_json(self, worker_nodes_map):
-        pair_links = {}
-        node_count = len(worker_nodes_map)
-        if node_count > 1:
-            worker_nodes = list(worker_nodes_map.keys())
-            for t in range(1, node_count):
-                step_pairs = []
-                for i in range(node_count):
-                    source = worker_nodes[i]
-                    target = worker_nodes[(i + t) % node_count]
-                    step_pairs.append({source: target})
-                pair_links[t] = step_pairs
-        return pair_links
+        return RingWorkload(worker_nodes_map.keys()).generate()
+
+    def get_leaves(self, leaf_label):
+        """
+        Returns the value of the leaf_label node label for every node that has it.
+        """
+        try:
+            nodes, _ = list_all(self.v1.list_node, label_selector=leaf_label)
+        except ApiException as e:
+            self.log.error("Exception when calling CoreV1Api->list_node: %s\n" % e)
+            exit(1)
+        return {node.metadata.name: node.metadata.labels[leaf_label] for node in nodes}
+
+    def workload_generator(self, workload_type, worker_nodes_map, max_steps=0, leaf_label=""):
+        """
+        Returns the generator of the given workload type over the nodes of worker_nodes_map.
+
+        Args:
+            workload_type (str): One of the SupportedWorkload values.
+            worker_nodes_map (dict): A dictionary mapping node names to their endpoints, pods, and network interfaces.
+            max_steps (int): The maximum number of steps to run, 0 for all of them.
+            leaf_label (str): The node label holding the leaf of each node, for the hierarchical workload.
+        """
+        nodes = sorted(worker_nodes_map.keys())
+        if workload_type == SupportedWorkload.RING.value:
+            return RingWorkload(list(worker_nodes_map.keys()), max_steps)
+        if workload_type == SupportedWorkload.BISECTION.value:
+            return BisectionWorkload(nodes, max_steps)
+        if workload_type == SupportedWorkload.RANDOM.value:
+            return RandomPermutationWorkload(nodes, max_steps)
+        if workload_type == SupportedWorkload.HIERARCHICAL.value:
+            if leaf_label == "":
+                self.log.error("The hierarchical workload needs a leaf label.")
+                exit(1)
+            return HierarchicalRailWorkload(nodes, self.get_leaves(leaf_label), max_steps)
+        self.log.error("Unsupported Workload Attempted")
+        exit(1)
+
+    def schedule_link_disjoint(self, workload, netifaces_count, parallel_ifaces=False):
+        """
+        Packs the src -> dst pairs of all the steps of a workload, on every interface, into time slots
+        where each link sends at most one stream and receives at most one stream, so that every pair
+        is measured without contention. Pairs are placed greedily in the first slot where both of its
+        ends are free, in the order of the steps.
+        When parallel_ifaces is set the interfaces are on independent NICs, and each (node, interface)
+        is a separate link. Otherwise the whole node is one link and the interfaces take turns.
+
+        Args:
+            workload (dict): The steps of the workload, each a list of {source: target} pairs.
+            netifaces_count (int): The number of interfaces of each node.
+            parallel_ifaces (bool): Whether the interfaces of a node can be measured at the same time.
+
+        Returns:
+            list: The time slots, each a list of (iface, source, target) tuples.
+        """
+        slots = []
+        busy = {}  # link -> set of slots where it is used
+        first_free = {}  # link -> no free slot before this one
+        for iface in range(netifaces_count):
+            for step in workload:
+                for pair in workload[step]:
+                    for source, target in pair.items():
+                        link = iface if parallel_ifaces else None
+                        tx, rx = ("tx", source, link), ("rx", target, link)
+                        slot = max(first_free.get(tx, 0), first_free.get(rx, 0))
+                        while slot in busy.get(tx, ()) or slot in busy.get(rx, ()):
+                            slot += 1
+                        if slot == len(slots):
+                            slots.append([])
+                        slots[slot].append((iface, source, target))
+                        for end in (tx, rx):
+                            busy.setdefault(end, set()).add(slot)
+                            while first_free.get(end, 0) in busy[end]:
+                                first_free[end] = first_free.get(end, 0) + 1
+        return slots
 
     def print_autopilot_node_map_json(self, worker_node_map):
         self.log.info(f"\n{json.dumps(worker_node_map, indent=4)}")
@@ -1,27 +1,41 @@
 from kubernetes import client, config
 from kubernetes.client.rest import ApiException
 import os
-import json
 import argparse
 import asyncio
-import subprocess
-import time
 import netifaces
+import sys
+import random
+import time
+import re
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+from checkresult import CheckResult, SUCCESS, FAIL, ABORT
+from inventory import get_inventory, list_all
 
 parser = argparse.ArgumentParser()
 parser.add_argument('--job', type=str, default='None', help='Workload node discovery w/ given namespace and label. Ex: \"--job=namespace:label-key=label-value\". Default is set to None.')
 parser.add_argument('--nodelabel', type=str, default='None', help='Node label to select nodes. Ex: \"label-key=label-value\". Default is set to None.')
 parser.add_argument('--nodes', type=str, default='all', help='Node(s) running autopilot that will be reached out by ping. Can be a comma separated list. Default is \"all\". Servers are reached out sequentially')
+parser.add_argument('--concurrency', type=int, default=256, help='Maximum number of ping processes running at the same time. Default is 256.')
+parser.add_argument('--timeout', type=int, default=50, help='Seconds after which a ping still running is killed and its target reported unreachable. Default is 50.')
+parser.add_argument('--peers', type=int, default=int(os.getenv('PING_PEERS') or 0), help='Sharded mode: number of peers probed by this node when pinging all nodes. Default is the PING_PEERS env variable, or 0 to probe every node.')
+parser.add_argument('--period', type=int, default=int(os.getenv('PING_PEERS_PERIOD') or 3600), help='Seconds after which the sharded mode rotates to the next subset of peers. Default is the PING_PEERS_PERIOD env variable, or 3600.')
+parser.add_argument('--json', action='store_true', help='Print a single JSON result record instead of free text.')
 args = vars(parser.parse_args())
 
 job = args['job']
 nodemap = {}
 namespace_self = os.getenv("NAMESPACE")
 nodename_self  = os.getenv("NODE_NAME")
-config.load_incluster_config()
-kubeapi = client.CoreV1Api()
+kubeapi = None
+PODS_TIMEOUT = 500 # seconds to wait for all the autopilot pods to be running
+result = CheckResult('ping')
 
 async def main():
+    global kubeapi
+    config.load_incluster_config()
+    kubeapi = client.CoreV1Api()
     nodelist = args['nodes'].replace(' ', '').split(',') # list of nodes
     job = args['job']
     nodelabel = args['nodelabel']
@@ -38,71 +52,40 @@ async def main():
     print("[PING] Pod running ping: ", os.getenv("POD_NAME"))
     print("[PING] Starting: collecting node list")
     try:
-        retries = 0
+        inventory = get_inventory(namespace_self).ensure_synced(('pods',))
         daemonset_size = expectedPods()
-        autopilot_pods = kubeapi.list_namespaced_pod(namespace=namespace_self, label_selector="app=autopilot")
-        while len(autopilot_pods.items) < daemonset_size or retries > 100:
+        if len(inventory.pods()) < daemonset_size:
             print("[PING] Waiting for all Autopilot pods to run")
-            time.sleep(5)
-            autopilot_pods = kubeapi.list_namespaced_pod(namespace=namespace_self, label_selector="app=autopilot")
-            retries +=1
-        if retries > 100 and len(autopilot_pods.items) < daemonset_size:
-            print("[PING] Reached max retries of 100. ABORT")
-            exit()
-
+            if not inventory.wait_for_pods(daemonset_size, PODS_TIMEOUT):
+                print("[PING] Not all Autopilot pods running after", PODS_TIMEOUT, "seconds. ABORT")
+                result.set_status(ABORT, "Not all autopilot pods are running")
+                exit()
     except ApiException as e:
         print("Exception when calling CoreV1Api->list_namespaced_pod: %s\n" % e)
+        result.set_status(ABORT, "Cannot list autopilot pods")
         exit()
 
-    # run through all pods and create a map of all interfaces
-    print("Creating a list of interfaces and IPs")
-    entrylist = json.loads('{}')
-    for pod in autopilot_pods.items:
-        if pod.spec.node_name != nodename_self and (allnodes or (pod.spec.node_name in nodemap.keys())):
-            try:
-                entrylist = json.loads(pod.metadata.annotations['k8s.v1.cni.cncf.io/network-status'])
-            except KeyError:
-                print("Key k8s.v1.cni.cncf.io/network-status not found on pod", pod.metadata.name, "- node", pod.spec.node_name)
-            if len(entrylist) > 0 :
-                node={}
-                nodes[pod.spec.node_name] = node
-                for entry in entrylist:
-                    try:
-                        iface=entry['interface']
-                    except KeyError:
-                        print("Interface key name not found, assigning 'k8s-pod-network'.")
-                        iface = "k8s-pod-network"
-                    ifaces = ifaces | {iface}
-                    node[iface] = {
-                        'ips': entry['ips'],
-                        'pod': pod.metadata.name
-                    }
-            else:
-                node={}
-                nodes[pod.spec.node_name] = node
-                pod_ips = pod.status.pod_i_ps
-                if pod_ips != None:
-                    iface = "default"
-                    ifaces = ifaces | {iface}
-                    iplist = []
-                    for pod_ip in pod_ips:
-                        iplist.append(pod_ip.ip)
-                    node[iface] = {
-                        'ips': iplist,
-                        'pod': pod.metadata.name
-                    }
-
+    peers = None
+    if allnodes and args['peers'] > 0:
+        peers = select_peers(inventory.nodes(), nodename_self, args['peers'], int(time.time() // args['period']))
 
+    # interfaces and IPs of the pods, from the annotations parsed by the inventory
+    print("Creating a list of interfaces and IPs")
+    for nodename in inventory.nodes():
+        if peers is not None and nodename not in peers:
+            continue
+        if nodename != nodename_self and (allnodes or (nodename in nodemap.keys())):
+            nodes[nodename] = inventory.interfaces(nodename)
+            ifaces = ifaces | set(nodes[nodename].keys())
 
     if len(nodes.keys()) == 0:
         print("[PING] No nodes found. ABORT")
+        result.set_status(ABORT, "No nodes found")
         exit(0)
-    # run ping tests to each pod on each interface
+    # run ping tests to each pod on each interface, at most --concurrency at a time
     print("[PING] Running ping tests for every interface")
-    conn_dict = dict()
-    clients = []
+    probes = []
     for nodename in nodes.keys():
-        conn_dict[nodename] = {}
         for iface in ifaces:
             try:
                 ips = nodes[nodename][iface]['ips']
@@ -110,44 +93,99 @@ async def main():
                 print("Interface", iface, "not found, skipping.")
                 continue
             for index, ip in enumerate(ips):
-                command = ['ping',ip,'-t','45','-c','10']
                 indexed_iface = iface+("-"+str(index) if len(ips)>1 else "")
-                clients.append((subprocess.Popen(command, start_new_session=True, text=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE), nodename, ip, indexed_iface))
-    for c in clients:
-        try:
-            c[0].wait(50)
-        except:
-            print("Timeout while waiting for", c[2], "on node", c[1])
-            continue
+                probes.append((nodename, ip, indexed_iface))
+    semaphore = asyncio.Semaphore(args['concurrency'])
     fail = False
-    for c in clients:
-        stdout, stderr = c[0].communicate()
-        if stderr:
-            print("[PING] output parse exited with error: " + stderr)
+    # results are reported as soon as each probe completes
+    for probe in asyncio.as_completed([ping(semaphore, *p) for p in probes]):
+        nodename, ip, iface, unreachable, stats = await probe
+        if unreachable is None:
             fail = True
-        else:
-            if "Unreachable" in stdout or "100% packet loss" in stdout:
-                print("Node", c[1], c[2], c[3], "1")
-                fail = True
-            else:
-                print("Node", c[1], c[2], c[3], "0")
+            continue
+        print("Node", nodename, ip, iface, unreachable)
+        if 'rtt_avg' in stats:
+            print("    rtt min/avg/max/mdev = {rtt_min}/{rtt_avg}/{rtt_max}/{rtt_mdev} ms, {loss}% packet loss".format(**stats))
+        result.add_value(nodename, unreachable, stats=stats, ip=ip, iface=iface)
+        fail = fail or unreachable == 1
     if fail:
         print("[PING] At least one node unreachable. FAIL")
+        result.set_status(FAIL, "At least one node unreachable")
     else:
         print("[PING] all nodes reachable. success")
-            
+        result.set_status(SUCCESS)
+
+# summary lines of iputils ping (busybox prints "round-trip min/avg/max = ..." without mdev)
+PACKET_LOSS = re.compile(r'([\d.]+)% packet loss')
+RTT = re.compile(r'(?:rtt|round-trip) min/avg/max(?:/mdev)? = ([\d.]+)/([\d.]+)/([\d.]+)(?:/([\d.]+))? ms')
+
+# loss in percent and rtt in milliseconds
+def parse_ping_stats(stdout):
+    stats = {}
+    loss = PACKET_LOSS.search(stdout)
+    if loss:
+        stats['loss'] = float(loss.group(1))
+    rtt = RTT.search(stdout)
+    if rtt:
+        stats['rtt_min'] = float(rtt.group(1))
+        stats['rtt_avg'] = float(rtt.group(2))
+        stats['rtt_max'] = float(rtt.group(3))
+        stats['rtt_mdev'] = float(rtt.group(4) or 0)
+    return stats
+
+# returns 1 if ip is unreachable, 0 if reachable, None if ping itself failed, and the stats of the probe
+async def ping(semaphore, nodename, ip, iface):
+    async with semaphore:
+        proc = await asyncio.create_subprocess_exec('ping', ip, '-t', '45', '-c', '10', start_new_session=True, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        try:
+            stdout, stderr = await asyncio.wait_for(proc.communicate(), args['timeout'])
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            print("Timeout while waiting for", ip, "on node", nodename)
+            return nodename, ip, iface, 1, {'loss': 100.0}
+    stdout = stdout.decode(errors='replace')
+    stderr = stderr.decode(errors='replace')
+    if stderr:
+        print("[PING] output parse exited with error: " + stderr)
+        return nodename, ip, iface, None, {}
+    stats = parse_ping_stats(stdout)
+    if "Unreachable" in stdout or "100% packet loss" in stdout:
+        return nodename, ip, iface, 1, stats
+    return nodename, ip, iface, 0, stats
+
+# Deterministic subset of the peers for a period: half of them on a ring over the sorted node list,
+# whose offsets move forward every period so that all pairs are covered after (N-1)/ring periods,
+# the other half random expander neighbors seeded by the node name and the period.
+# The same inputs give the same subset on every node, so results can be merged across the cluster.
+def select_peers(nodenames, node_self, count, period_index):
+    nodenames = sorted(set(nodenames) | {node_self})
+    others = len(nodenames) - 1
+    if count >= others:
+        return set(nodenames) - {node_self}
+    position = nodenames.index(node_self)
+    ring = count - count // 2
+    start = (period_index * ring) % others
+    peers = set()
+    for j in range(ring):
+        offset = (start + j) % others + 1
+        peers.add(nodenames[(position + offset) % len(nodenames)])
+    candidates = [n for n in nodenames if n != node_self and n not in peers]
+    peers.update(random.Random(node_self + '-' + str(period_index)).sample(candidates, count - ring))
+    print("[PING] Sharded mode: probing", len(peers), "of", others, "peers, period", period_index)
+    return peers
+
 def check_local_ifaces():
     podname = os.getenv("POD_NAME")
-    pod_list = kubeapi.list_namespaced_pod(namespace=namespace_self, field_selector="metadata.name="+podname)
     ips = []
     iface_count = 0
-    pod_self = pod_list.items[0]
-    entrylist = json.loads('{}')
+    pod_self = get_inventory(namespace_self).ensure_synced(('pods',)).pod(podname)
+    if pod_self is None:
+        print("[PING] Pod", podname, "not found. ABORT")
+        result.set_status(ABORT, "Pod " + str(podname) + " not found")
+        exit()
     ip_addresses = [netifaces.ifaddresses(iface)[netifaces.AF_INET][0]['addr'] for iface in netifaces.interfaces() if netifaces.AF_INET in netifaces.ifaddresses(iface)]
-    try:
-        entrylist = json.loads(pod_self.metadata.annotations['k8s.v1.cni.cncf.io/network-status'])
-    except KeyError:
-        print("Key k8s.v1.cni.cncf.io/network-status not found on pod", pod_self.metadata.name, "-  node", pod_self.spec.node_name)
+    entrylist = pod_self.networks
     if len(entrylist) > 0:
         for entry in entrylist:
             try:
@@ -157,18 +195,18 @@ def check_local_ifaces():
             for ip in entry['ips']:
                 if ip not in ip_addresses:
                     print("[PING] IFACES count inconsistent. Pod annotation reports", entry['ips'], ", not found in the pod among", ip_addresses, "ABORT")
+                    result.set_status(ABORT, "Interfaces inconsistent with the pod annotation")
                     exit()
             ips.append(entry['ips'])
             iface_count += len(entry['ips'])
     else:
-        pod_ips = pod_self.status.pod_i_ps
-        if pod_ips != None:
-            for pod_ip in pod_ips:
-                if pod_ip.ip not in ip_addresses:
-                    print("[PING] IFACES count inconsistent. Pod annotation reports", pod_ip.ip, ", not found in the pod among", ip_addresses, "ABORT")
-                    exit()
-                ips.append(pod_ip.ip)
-        iface_count += len(pod_ips)
+        for pod_ip in pod_self.ips:
+            if pod_ip not in ip_addresses:
+                print("[PING] IFACES count inconsistent. Pod annotation reports", pod_ip, ", not found in the pod among", ip_addresses, "ABORT")
+                result.set_status(ABORT, "Interfaces inconsistent with the pod annotation")
+                exit()
+            ips.append(pod_ip)
+        iface_count += len(pod_self.ips)
 
 
 
@@ -182,29 +220,31 @@ def get_job_nodes(nodelist):
         job = args['job'].split(':') 
         job_ns = job[0] # ex: "default"
         job_label = job[1] # ex: "job-name=my-job" or "app=my-app"]
+        job_pods = []
         try:
-            job_pods = v1.list_namespaced_pod(namespace=job_ns, label_selector=job_label)
+            # the API server drops the pods on this node and the ones not scheduled yet
+            job_pods, _ = list_all(v1.list_namespaced_pod, namespace=job_ns, label_selector=job_label, field_selector='spec.nodeName!=' + node_name_self + ',spec.nodeName!=')
         except ApiException as e:
             print("[PING] Exception when calling CoreV1Api->list_namespaced_pod: %s\n" % e)
 
         print('[PING] Workload:', ': '.join(job))
-        for pod in job_pods.items:
-            if pod.spec.node_name != node_name_self:
-                nodemap[pod.spec.node_name] = True
+        for pod in job_pods:
+            nodemap[pod.spec.node_name] = True
 
     nodelabel = args['nodelabel']
     if nodelabel != 'None':
         try:
-            labeled_nodes = v1.list_node(label_selector=nodelabel)
+            labeled_nodes, _ = list_all(v1.list_node, label_selector=nodelabel, field_selector='metadata.name!=' + node_name_self)
         except ApiException as e:
             print("Exception when calling CoreV1Api->list_node: %s\n" % e)
+            result.set_status(ABORT, "Cannot list nodes")
             exit()
-        if len(labeled_nodes.items) == 0:
+        if len(labeled_nodes) == 0:
             print ("No node is labeled with", nodelabel, " - ABORT.")
+            result.set_status(ABORT, "No node is labeled with " + nodelabel)
             exit()
-        for labeled_node in labeled_nodes.items:
-            if labeled_node.metadata.name != node_name_self:
-                nodemap[labeled_node.metadata.name] = True
+        for labeled_node in labeled_nodes:
+            nodemap[labeled_node.metadata.name] = True
     # get nodes from input list, if any
     if 'all' not in nodelist:
         for i in nodelist:
@@ -223,4 +263,5 @@ def expectedPods():
     return autopilot.items[0].status.desired_number_scheduled
 
 if __name__ == '__main__':
-    asyncio.run(main())
\ No newline at end of file
+    with result.capture(args['json']):
+        asyncio.run(main())
\ No newline at end of file
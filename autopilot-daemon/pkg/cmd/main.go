@@ -6,6 +6,7 @@ import (
 	"fmt"
 	"net/http"
 	"os"
+	"strconv"
 	"time"
 
 	"github.com/IBM/autopilot/pkg/handler"
@@ -23,6 +24,8 @@ func main() {
 	v := flag.String("loglevel", "2", "Log level")
 	repeat := flag.Int("w", 24, "Run all tests periodically on each node. Time set in hours. Defaults to 24h")
 	invasive := flag.Int("invasive-check-timer", 4, "Run invasive checks (e.g., dcgmi level 3) on each node when GPUs are free. Time set in hours. Defaults to 4h. Set to 0 to avoid invasive checks")
+	pythonWorker := flag.Bool("python-worker", true, "Run the python health checks from a long-lived worker process instead of starting a new interpreter for each check")
+	gpuSampler := flag.Int("gpu-sampler-interval", 30, "Sample the throttle reasons, power and ECC counters of the GPUs every N seconds, reported by the power and remapped rows checks. Set to 0 to disable the sampler")
 
 	flag.Parse()
 
@@ -49,6 +52,19 @@ func main() {
 	// Init the node status map
 	healthcheck.InitNodeStatusMap()
 
+	// Sharded ping rotates its peers at the pace of the periodic checks, unless set otherwise
+	if os.Getenv("PING_PEERS_PERIOD") == "" {
+		os.Setenv("PING_PEERS_PERIOD", strconv.Itoa(*repeat*3600))
+	}
+
+	if *pythonWorker {
+		go healthcheck.StartWorker()
+	}
+
+	if *gpuSampler > 0 {
+		go healthcheck.StartGPUSampler(*gpuSampler)
+	}
+
 	pMux := http.NewServeMux()
 	promHandler := promhttp.HandlerFor(reg, promhttp.HandlerOpts{})
 	pMux.Handle("/metrics", promHandler)
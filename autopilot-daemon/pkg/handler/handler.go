@@ -29,6 +29,10 @@ func SystemStatusHandler() http.Handler {
 		if batch == "" {
 			batch = "0"
 		}
+		order := r.URL.Query().Get("order")
+		if order == "" {
+			order = "none"
+		}
 		jobName := r.URL.Query().Get("job")
 		if jobName == "" {
 			jobName = "None"
@@ -57,7 +61,23 @@ func SystemStatusHandler() http.Handler {
 			if r.URL.Query().Has("cleanup") {
 				cleanup = "--cleanup"
 			}
-			out, err := healthcheck.RunIperf(workload, pclients, startport, cleanup)
+			parallelifaces := ""
+			if r.URL.Query().Has("parallelifaces") {
+				parallelifaces = "--parallelifaces"
+			}
+			steps := ""
+			if r.URL.Query().Get("steps") != "" {
+				steps = "--steps=" + r.URL.Query().Get("steps")
+			}
+			leaflabel := ""
+			if r.URL.Query().Get("leaflabel") != "" {
+				leaflabel = "--leaflabel=" + r.URL.Query().Get("leaflabel")
+			}
+			adaptive := ""
+			if r.URL.Query().Has("adaptive") {
+				adaptive = "--adaptive"
+			}
+			out, err := healthcheck.RunIperf(workload, pclients, startport, cleanup, parallelifaces, steps, leaflabel, adaptive)
 			if err != nil {
 				klog.Error(err.Error())
 			}
@@ -73,7 +93,9 @@ func SystemStatusHandler() http.Handler {
 				if err != nil {
 					klog.Error(err.Error())
 				}
-				w.Write(*out)
+				if out != nil {
+					w.Write(*out)
+				}
 				hasFailures := healthcheck.GetNodeStatus()
 				klog.Info("Errors after running local, on demand health checks: ", hasFailures)
 				if hasFailures {
@@ -82,14 +104,23 @@ func SystemStatusHandler() http.Handler {
 					utils.PatchNode(utils.GPUHealthPassLabel, utils.NodeName, false)
 				}
 
+			} else if r.URL.Query().Get("output") == "ndjson" {
+				klog.Info("Streaming results from remote node(s) ", hosts, " or with node label ", nodelabel)
+				w.Header().Set("Content-Type", "application/x-ndjson")
+				err := healthcheck.StreamHealthRemoteNodes(w, hosts, checks, batch, order, jobName, dcgmR, nodelabel)
+				if err != nil {
+					klog.Error(err.Error())
+				}
 			} else {
 				klog.Info("Asking to run on remote node(s) ", hosts, " or with node label ", nodelabel)
 				w.Write([]byte("Asking to run on remote node(s) " + hosts + " or with node label " + nodelabel + "\n\n"))
-				out, err := healthcheck.RunHealthRemoteNodes(hosts, checks, batch, jobName, dcgmR, nodelabel)
+				out, err := healthcheck.RunHealthRemoteNodes(hosts, checks, batch, order, jobName, dcgmR, nodelabel)
 				if err != nil {
 					klog.Error(err.Error())
 				}
-				w.Write(*out)
+				if out != nil {
+					w.Write(*out)
+				}
 			}
 		}
 
@@ -115,7 +146,7 @@ func PCIeBWHandler() http.Handler {
 func RemappedRowsHandler() http.Handler {
 	fn := func(w http.ResponseWriter, r *http.Request) {
 		w.Write([]byte("Requesting Remapped Rows check on all GPUs\n"))
-		out, err := healthcheck.RunRemappedRows()
+		out, err := healthcheck.RunRemappedRows(false)
 		if err != nil {
 			klog.Error(err.Error())
 		}
@@ -180,7 +211,23 @@ func IperfHandler() http.Handler {
 		if r.URL.Query().Has("cleanup") {
 			cleanup = "--cleanup"
 		}
-		out, err := healthcheck.RunIperf(workload, pclients, startport, cleanup)
+		parallelifaces := ""
+		if r.URL.Query().Has("parallelifaces") {
+			parallelifaces = "--parallelifaces"
+		}
+		steps := ""
+		if r.URL.Query().Get("steps") != "" {
+			steps = "--steps=" + r.URL.Query().Get("steps")
+		}
+		leaflabel := ""
+		if r.URL.Query().Get("leaflabel") != "" {
+			leaflabel = "--leaflabel=" + r.URL.Query().Get("leaflabel")
+		}
+		adaptive := ""
+		if r.URL.Query().Has("adaptive") {
+			adaptive = "--adaptive"
+		}
+		out, err := healthcheck.RunIperf(workload, pclients, startport, cleanup, parallelifaces, steps, leaflabel, adaptive)
 		if err != nil {
 			klog.Error(err.Error())
 		}
@@ -201,7 +248,7 @@ func StartIperfServersHandler() http.Handler {
 		if startport == "" {
 			startport = "5200"
 		}
-		out, err := healthcheck.StartIperfServers(numservers, startport)
+		out, err := healthcheck.StartIperfServers(numservers, startport, r.URL.Query().Get("owner"))
 
 		if err != nil {
 			klog.Error(err.Error())
@@ -215,7 +262,7 @@ func StartIperfServersHandler() http.Handler {
 
 func StopAllIperfServersHandler() http.Handler {
 	fn := func(w http.ResponseWriter, r *http.Request) {
-		out, err := healthcheck.StopAllIperfServers()
+		out, err := healthcheck.StopAllIperfServers(r.URL.Query().Get("owner"))
 		if err != nil {
 			klog.Error(err.Error())
 		}
@@ -231,7 +278,15 @@ func StartIperfClientsHandler() http.Handler {
 		dstip := r.URL.Query().Get("dstip")
 		dstport := r.URL.Query().Get("dstport")
 		numclients := r.URL.Query().Get("numclients")
-		out, err := healthcheck.StartIperfClients(dstip, dstport, numclients)
+		adaptive := ""
+		if r.URL.Query().Has("adaptive") {
+			adaptive = "--adaptive"
+		}
+		startat := ""
+		if r.URL.Query().Get("startat") != "" {
+			startat = "--startat=" + r.URL.Query().Get("startat")
+		}
+		out, err := healthcheck.StartIperfClients(dstip, dstport, numclients, adaptive, startat)
 		if err != nil {
 			klog.Error(err.Error())
 		}
@@ -263,7 +318,7 @@ func DCGMHandler() http.Handler {
 func GpuPowerHandler() http.Handler {
 	fn := func(w http.ResponseWriter, r *http.Request) {
 		w.Write([]byte("GPU Power Measurement test"))
-		out, err := healthcheck.RunGPUPower()
+		out, err := healthcheck.RunGPUPower(false)
 		if err != nil {
 			klog.Error(err.Error())
 		}
@@ -277,7 +332,7 @@ func GpuPowerHandler() http.Handler {
 func GpuMemHandler() http.Handler {
 	fn := func(w http.ResponseWriter, r *http.Request) {
 		w.Write([]byte("GPU Memory DGEMM+DAXPY test"))
-		out, err := healthcheck.RunGPUPower()
+		out, err := healthcheck.RunGPUPower(false)
 		if err != nil {
 			klog.Error(err.Error())
 		}
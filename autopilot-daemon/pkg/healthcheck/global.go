@@ -13,6 +13,9 @@ type HealthCheck string
 var HealthCheckStatus map[HealthCheck]bool
 var defaultPeriodicChecks string = "pciebw,remapped,dcgm,ping,gpupower"
 
+// Largest NDJSON record accepted from runHealthchecks.py (one node's full response)
+const maxRecordSize = 16 * 1024 * 1024
+
 const (
 	Undefined HealthCheck = ""
 	DCGM      HealthCheck = "dcgm"
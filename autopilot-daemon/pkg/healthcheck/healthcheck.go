@@ -1,7 +1,10 @@
 package healthcheck
 
 import (
+	"bufio"
 	"errors"
+	"io"
+	"math"
 	"net/http"
 	"os"
 	"os/exec"
@@ -48,6 +51,8 @@ func RunHealthLocalNode(checks string, dcgmR string, jobName string, nodelabel s
 	var tmp *[]byte
 	var err error
 	start := time.Now()
+	// the periodic runs have no request
+	periodic := r == nil
 	if strings.Contains(checks, "all") {
 		checks = GetPeriodicChecks()
 	}
@@ -90,7 +95,7 @@ func RunHealthLocalNode(checks string, dcgmR string, jobName string, nodelabel s
 
 		case string(RowRemap):
 			klog.Info("Running health check: ", check)
-			tmp, err = RunRemappedRows()
+			tmp, err = RunRemappedRows(periodic)
 			if err != nil {
 				klog.Error(err.Error())
 				return tmp, err
@@ -99,7 +104,7 @@ func RunHealthLocalNode(checks string, dcgmR string, jobName string, nodelabel s
 
 		case string(GPUPower):
 			klog.Info("Running health check: ", check)
-			tmp, err = RunGPUPower()
+			tmp, err = RunGPUPower(periodic)
 			if err != nil {
 				klog.Error(err.Error())
 				return tmp, err
@@ -136,10 +141,15 @@ func RunHealthLocalNode(checks string, dcgmR string, jobName string, nodelabel s
 	return &out, nil
 }
 
-func RunHealthRemoteNodes(host string, check string, batch string, jobName string, dcgmR string, nodelabel string) (*[]byte, error) {
-	klog.Info("About to run command:\n", "./utils/runHealthchecks.py", " --nodes="+host, " --check="+check, " --batchSize="+batch, " --wkload="+jobName, " --dcgmR="+dcgmR, " --nodelabel="+nodelabel)
+func remoteNodesArgs(host string, check string, batch string, order string, jobName string, dcgmR string, nodelabel string) []string {
+	return []string{"./utils/runHealthchecks.py", "--service=autopilot-healthchecks", "--namespace=" + utils.Namespace, "--nodes=" + host, "--check=" + check, "--batchSize=" + batch, "--order=" + order, "--wkload=" + jobName, "--dcgmR=" + dcgmR, "--nodelabel=" + nodelabel}
+}
+
+func RunHealthRemoteNodes(host string, check string, batch string, order string, jobName string, dcgmR string, nodelabel string) (*[]byte, error) {
+	args := remoteNodesArgs(host, check, batch, order, jobName, dcgmR, nodelabel)
+	klog.Info("About to run command:\n", strings.Join(args, " "))
 
-	out, err := exec.Command("python3", "./utils/runHealthchecks.py", "--service=autopilot-healthchecks", "--namespace="+utils.Namespace, "--nodes="+host, "--check="+check, "--batchSize="+batch, "--wkload="+jobName, "--dcgmR="+dcgmR, "--nodelabel="+nodelabel).Output()
+	out, err := exec.Command("python3", args...).Output()
 	if err != nil {
 		klog.Info(string(out))
 		klog.Error(err.Error())
@@ -149,177 +159,290 @@ func RunHealthRemoteNodes(host string, check string, batch string, jobName strin
 	return &out, nil
 }
 
-func RunRemappedRows() (*[]byte, error) {
-	HealthCheckStatus[RowRemap] = false
-	out, err := exec.Command("python3", "./gpu-remapped/entrypoint.py").CombinedOutput()
+// Runs the health checks on remote nodes and copies each NDJSON record to w as soon as the node completes
+func StreamHealthRemoteNodes(w io.Writer, host string, check string, batch string, order string, jobName string, dcgmR string, nodelabel string) error {
+	args := append(remoteNodesArgs(host, check, batch, order, jobName, dcgmR, nodelabel), "--output=ndjson")
+	klog.Info("About to run command:\n", strings.Join(args, " "))
+
+	cmd := exec.Command("python3", args...)
+	cmd.Stderr = os.Stderr
+	stdout, err := cmd.StdoutPipe()
 	if err != nil {
-		klog.Info("Out:", string(out))
 		klog.Error(err.Error())
-		return nil, err
-	} else {
-		klog.Info("Remapped Rows check test completed:")
-
-		if strings.Contains(string(out[:]), "FAIL") {
-			klog.Info("Remapped Rows test failed.", string(out[:]))
-			HealthCheckStatus[RowRemap] = true
+		return err
+	}
+	if err := cmd.Start(); err != nil {
+		klog.Error(err.Error())
+		return err
+	}
+	flusher, canFlush := w.(http.Flusher)
+	scanner := bufio.NewScanner(stdout)
+	scanner.Buffer(make([]byte, 64*1024), maxRecordSize)
+	for scanner.Scan() {
+		w.Write(append(scanner.Bytes(), '\n'))
+		if canFlush {
+			flusher.Flush()
 		}
+	}
+	if err := scanner.Err(); err != nil {
+		// e.g. a line longer than maxRecordSize: drain the pipe, or the child blocks on it and Wait never returns
+		klog.Error(err.Error())
+		io.Copy(io.Discard, stdout)
+	}
+	return cmd.Wait()
+}
 
-		if strings.Contains(string(out[:]), "ABORT") {
-			klog.Info("Remapped Rows cannot be run. ", string(out[:]))
-			return &out, nil
-		}
+// The checks reading the GPU sampler report what it saw since their previous periodic run.
+// Only the periodic runs move the start of that window, an on-demand run does not take it away
+func samplerWindowArgs(script string, periodic bool) []string {
+	if periodic {
+		return []string{script, "--periodic"}
+	}
+	return []string{script}
+}
 
-		output := strings.TrimSuffix(string(out[:]), "\n")
-		split := strings.Split(output, "\n")
-		rmr := split[len(split)-1]
-		final := strings.Split(rmr, " ")
+func RunRemappedRows(periodic bool) (*[]byte, error) {
+	HealthCheckStatus[RowRemap] = false
+	result, err := runCheck(samplerWindowArgs("./gpu-remapped/entrypoint.py", periodic)...)
+	if err != nil {
+		return nil, err
+	}
+	out := result.Report()
+	klog.Info("Remapped Rows check test completed:")
 
-		for gpuid, v := range final {
-			rm, err := strconv.ParseFloat(v, 64)
-			if err != nil {
-				klog.Error(err.Error())
-				return nil, err
-			} else {
-				klog.Info("Observation: ", utils.NodeName, " ", strconv.Itoa(gpuid), " ", rm)
-				utils.HchecksGauge.WithLabelValues(string(RowRemap), utils.NodeName, utils.CPUModel, utils.GPUModel, strconv.Itoa(gpuid)).Set(rm)
-			}
-		}
+	if result.Failed() {
+		klog.Info("Remapped Rows test failed.", string(out[:]))
+		HealthCheckStatus[RowRemap] = true
+	}
+
+	if result.Aborted() {
+		klog.Info("Remapped Rows cannot be run. ", string(out[:]))
+		return &out, nil
+	}
+
+	for _, v := range result.Values {
+		klog.Info("Observation: ", utils.NodeName, " ", v.Device, " ", v.Value)
+		utils.HchecksGauge.WithLabelValues(string(RowRemap), utils.NodeName, utils.CPUModel, utils.GPUModel, v.Device).Set(v.Value)
 	}
 	return &out, nil
 }
 
 func RunGPUMem() (*[]byte, error) {
 	HealthCheckStatus[GPUMem] = false
-	out, err := exec.Command("python3", "./gpu-mem/entrypoint.py").CombinedOutput()
+	result, err := runCheck("./gpu-mem/entrypoint.py")
 	if err != nil {
-		klog.Info("Out:", string(out))
-		klog.Error(err.Error())
 		return nil, err
-	} else {
-		klog.Info("GPU Memory check completed:")
-
-		if strings.Contains(string(out[:]), "FAIL") {
-			klog.Info("GPU Memory check failed.", string(out[:]))
-			klog.Info("Observation: ", utils.NodeName, " 1")
-			utils.HchecksGauge.WithLabelValues(string(GPUMem), utils.NodeName, utils.CPUModel, utils.GPUModel, "0").Set(1)
-			HealthCheckStatus[GPUMem] = true
-		}
-
-		if strings.Contains(string(out[:]), "ABORT") {
-			klog.Info("GPU Memory check cannot be run. ", string(out[:]))
-			return &out, nil
-		}
+	}
+	out := result.Report()
+	klog.Info("GPU Memory check completed:")
+
+	if result.Failed() {
+		klog.Info("GPU Memory check failed.", string(out[:]))
+		klog.Info("Observation: ", utils.NodeName, " 1")
+		utils.HchecksGauge.WithLabelValues(string(GPUMem), utils.NodeName, utils.CPUModel, utils.GPUModel, "0").Set(1)
+		HealthCheckStatus[GPUMem] = true
+		return &out, nil
+	}
 
-		klog.Info("Observation: ", utils.NodeName, " 0")
-		utils.HchecksGauge.WithLabelValues(string(GPUMem), utils.NodeName, utils.CPUModel, utils.GPUModel, "0").Set(0)
+	if result.Aborted() {
+		klog.Info("GPU Memory check cannot be run. ", string(out[:]))
+		return &out, nil
 	}
+
+	klog.Info("Observation: ", utils.NodeName, " 0")
+	utils.HchecksGauge.WithLabelValues(string(GPUMem), utils.NodeName, utils.CPUModel, utils.GPUModel, "0").Set(0)
 	return &out, nil
 }
 
 func RunPCIeBW() (*[]byte, error) {
 	HealthCheckStatus[PCIeBW] = false
-	out, err := exec.Command("python3", "./gpu-bw/entrypoint.py", "-t", strconv.Itoa(utils.UserConfig.BWThreshold)).CombinedOutput()
+	result, err := runCheck("./gpu-bw/entrypoint.py", "-t", strconv.Itoa(utils.UserConfig.BWThreshold))
 	if err != nil {
-		klog.Info("Out:", string(out))
-		klog.Error(err.Error())
 		return nil, err
-	} else {
-		klog.Info("GPU PCIe BW test completed:")
+	}
+	out := result.Report()
+	klog.Info("GPU PCIe BW test completed:")
 
-		if strings.Contains(string(out[:]), "FAIL") {
-			klog.Info("PCIe BW test failed.", string(out[:]))
+	if result.Failed() {
+		klog.Info("PCIe BW test failed.", string(out[:]))
+		HealthCheckStatus[PCIeBW] = true
+	}
+
+	if result.Aborted() {
+		klog.Info("PCIe BW cannot be run. ", string(out[:]))
+		return &out, nil
+	}
+
+	for _, v := range result.Values {
+		logline := "Observation: " + utils.NodeName + " " + v.Device + " " + strconv.FormatFloat(v.Value, 'f', -1, 64)
+		if v.Value < float64(utils.UserConfig.BWThreshold) {
+			logline += "  [[ LOW PCIE -- Below expected threshold of " + strconv.Itoa(utils.UserConfig.BWThreshold) + " Gb/s ]]"
 			HealthCheckStatus[PCIeBW] = true
 		}
+		klog.Info(logline)
+		utils.HchecksGauge.WithLabelValues(string(PCIeBW), utils.NodeName, utils.CPUModel, utils.GPUModel, v.Device).Set(v.Value)
+	}
+	return &out, nil
+}
 
-		if strings.Contains(string(out[:]), "ABORT") {
-			klog.Info("PCIe BW cannot be run. ", string(out[:]))
-			return &out, nil
-		}
+func RunPing(nodelist string, jobName string, nodelabel string) (*[]byte, error) {
+	HealthCheckStatus[Ping] = false
+	result, err := runCheck("./network/ping-entrypoint.py", "--nodes", nodelist, "--job", jobName, "--nodelabel", nodelabel)
+	if err != nil {
+		return nil, err
+	}
+	out := result.Report()
+	klog.Info("Ping test completed:")
 
-		output := strings.TrimSuffix(string(out[:]), "\n")
-		split := strings.Split(output, "\n")
+	if result.Failed() {
+		klog.Info("Ping test failed.", string(out[:]))
+		HealthCheckStatus[Ping] = true
+	}
 
-		bws := split[len(split)-1]
-		final := strings.Split(bws, " ")
+	if result.Aborted() {
+		klog.Info("Ping cannot be run. ", string(out[:]))
+		return &out, nil
+	}
 
-		for gpuid, v := range final {
-			bw, err := strconv.ParseFloat(v, 64)
-			if err != nil {
-				klog.Error(err.Error())
-				return nil, err
+	exportPingStats(result.Values)
+	unreach_nodes := make(map[string][]string)
+	for _, v := range result.Values {
+		if _, exists := unreach_nodes[v.Device]; !exists {
+			if v.Value == 1 {
+				utils.HchecksGauge.WithLabelValues(string(Ping), utils.NodeName, utils.CPUModel, utils.GPUModel, v.Device).Set(float64(1))
+				klog.Info("Observation: ", v.Device, " ", v.Labels["ip"], " ", v.Labels["iface"], " Unreachable")
+				unreach_nodes[v.Device] = append(unreach_nodes[v.Device], v.Labels["ip"])
 			} else {
-				logline := "Observation: " + utils.NodeName + " " + strconv.Itoa(gpuid) + " " + v
-				if bw < float64(utils.UserConfig.BWThreshold) {
-					logline += "  [[ LOW PCIE -- Below expected threshold of " + strconv.Itoa(utils.UserConfig.BWThreshold) + " Gb/s ]]"
-					HealthCheckStatus[PCIeBW] = true
-				}
-				klog.Info(logline)
-				utils.HchecksGauge.WithLabelValues(string(PCIeBW), utils.NodeName, utils.CPUModel, utils.GPUModel, strconv.Itoa(gpuid)).Set(bw)
+				utils.HchecksGauge.WithLabelValues(string(Ping), utils.NodeName, utils.CPUModel, utils.GPUModel, v.Device).Set(float64(0))
 			}
 		}
 	}
+	klog.Info("Unreachable nodes count: ", len(unreach_nodes))
 	return &out, nil
 }
 
-func RunPing(nodelist string, jobName string, nodelabel string) (*[]byte, error) {
-	HealthCheckStatus[Ping] = false
-	out, err := exec.Command("python3", "./network/ping-entrypoint.py", "--nodes", nodelist, "--job", jobName, "--nodelabel", nodelabel).CombinedOutput()
-	if err != nil {
-		klog.Info(string(out))
-		klog.Error(err.Error())
-		return nil, err
-	} else {
-		klog.Info("Ping test completed:")
+// Latency and loss of the peers pinged in this run, aggregated by interface
+type pingAggregate struct {
+	rttPeers  int
+	rttMin    float64
+	rttAvgSum float64
+	rttMax    float64
+	lossPeers int
+	lossSum   float64
+	lossMax   float64
+	worstPeer string
+	worstAvg  float64
+}
 
-		if strings.Contains(string(out[:]), "FAIL") {
-			klog.Info("Ping test failed.", string(out[:]))
-			HealthCheckStatus[PCIeBW] = true
+// One series per node and interface whatever the number of peers, the slowest peer is logged
+func exportPingStats(values []CheckValue) {
+	// the peers and interfaces change between runs (sharded ping), the previous series are dropped
+	utils.PingRTTGauge.Reset()
+	utils.PingLossGauge.Reset()
+	ifaces := make(map[string]*pingAggregate)
+	for _, v := range values {
+		iface := v.Labels["iface"]
+		agg, exists := ifaces[iface]
+		if !exists {
+			agg = &pingAggregate{rttMin: math.Inf(1), rttMax: math.Inf(-1)}
+			ifaces[iface] = agg
 		}
-
-		if strings.Contains(string(out[:]), "ABORT") {
-			klog.Info("Ping cannot be run. ", string(out[:]))
-			return &out, nil
+		if loss, ok := v.Stats["loss"]; ok {
+			agg.lossPeers++
+			agg.lossSum += loss
+			agg.lossMax = math.Max(agg.lossMax, loss)
 		}
-
-		output := strings.TrimSuffix(string(out[:]), "\n")
-		lines := strings.Split(output, "\n")
-		unreach_nodes := make(map[string][]string)
-		for _, line := range lines {
-			if strings.HasPrefix(line, "Node") {
-				entry := strings.Split(line, " ")
-				if _, exists := unreach_nodes[entry[1]]; !exists {
-					if entry[len(entry)-1] == "1" {
-						utils.HchecksGauge.WithLabelValues(string(Ping), utils.NodeName, utils.CPUModel, utils.GPUModel, entry[1]).Set(float64(1))
-						klog.Info("Observation: ", entry[1], " ", entry[2], " ", entry[3], " Unreachable")
-						unreach_nodes[entry[1]] = append(unreach_nodes[entry[1]], entry[2])
-					} else {
-						utils.HchecksGauge.WithLabelValues(string(Ping), utils.NodeName, utils.CPUModel, utils.GPUModel, entry[1]).Set(float64(0))
-					}
-				}
+		if avg, ok := v.Stats["rtt_avg"]; ok {
+			agg.rttPeers++
+			agg.rttAvgSum += avg
+			if rtt, ok := v.Stats["rtt_min"]; ok {
+				agg.rttMin = math.Min(agg.rttMin, rtt)
+			}
+			if rtt, ok := v.Stats["rtt_max"]; ok {
+				agg.rttMax = math.Max(agg.rttMax, rtt)
 			}
+			if avg > agg.worstAvg {
+				agg.worstAvg = avg
+				agg.worstPeer = v.Device
+			}
+			utils.PingRTTHistogram.WithLabelValues(utils.NodeName, iface).Observe(avg)
+		}
+	}
+	for iface, agg := range ifaces {
+		if agg.lossPeers > 0 {
+			utils.PingLossGauge.WithLabelValues(utils.NodeName, iface, "mean").Set(agg.lossSum / float64(agg.lossPeers))
+			utils.PingLossGauge.WithLabelValues(utils.NodeName, iface, "max").Set(agg.lossMax)
+		}
+		if agg.rttPeers > 0 {
+			utils.PingRTTGauge.WithLabelValues(utils.NodeName, iface, "mean").Set(agg.rttAvgSum / float64(agg.rttPeers))
+			if !math.IsInf(agg.rttMin, 1) {
+				utils.PingRTTGauge.WithLabelValues(utils.NodeName, iface, "min").Set(agg.rttMin)
+			}
+			if !math.IsInf(agg.rttMax, -1) {
+				utils.PingRTTGauge.WithLabelValues(utils.NodeName, iface, "max").Set(agg.rttMax)
+			}
+			klog.Info("Ping ", iface, ": ", agg.rttPeers, " peers, slowest ", agg.worstPeer, " avg ", agg.worstAvg, " ms")
 		}
-		klog.Info("Unreachable nodes count: ", len(unreach_nodes))
 	}
-	return &out, nil
 }
 
-func RunIperf(workload string, pclients string, startport string, cleanup string) (*[]byte, error) {
+func RunIperf(workload string, pclients string, startport string, flags ...string) (*[]byte, error) {
 
 	args := []string{"./network/iperf3_entrypoint.py", "--workload", workload, "--pclients", pclients, "--startport", startport}
 
-	if cleanup != "" {
-		args = append(args, cleanup)
+	for _, flag := range flags {
+		if flag != "" {
+			args = append(args, flag)
+		}
 	}
-	out, err := exec.Command("python3", args...).CombinedOutput()
+	result, err := runCheck(args...)
 	if err != nil {
 		return nil, err
 	}
+	out := result.Report()
 	klog.Info("iperf3 test completed:\n", string(out))
+
+	if result.Aborted() {
+		klog.Info("iperf3 cannot be run. ", result.Message)
+		return &out, nil
+	}
+
+	// every run covers all the nodes, the verdicts of the previous run are dropped
+	utils.IperfBandwidthGauge.Reset()
+	utils.IperfZScoreGauge.Reset()
+	utils.IperfDegradedGauge.Reset()
+	for _, v := range result.Values {
+		exportIperfVerdict(v)
+	}
 	return &out, nil
 }
 
-func StartIperfServers(numservers string, startport string) (*[]byte, error) {
-	out, err := exec.Command("python3", "./network/iperf3_start_servers.py", "--numservers", numservers, "--startport", startport).CombinedOutput()
+func exportIperfVerdict(v CheckValue) {
+	iface := v.Labels["iface"]
+	for _, direction := range []string{"sender", "receiver"} {
+		if bw, ok := v.Stats[direction]; ok {
+			utils.IperfBandwidthGauge.WithLabelValues(v.Device, iface, direction).Set(bw)
+		}
+		if z, ok := v.Stats[direction+"_z"]; ok {
+			utils.IperfZScoreGauge.WithLabelValues(v.Device, iface, direction).Set(z)
+		}
+	}
+	utils.IperfDegradedGauge.WithLabelValues(v.Device, iface, v.Labels["verdict"]).Set(v.Value)
+	if v.Value == 1 {
+		klog.Info("Observation: ", v.Device, " ", iface, " ", v.Labels["verdict"])
+	}
+}
+
+func StartIperfServers(numservers string, startport string, owner string) (*[]byte, error) {
+	args := []string{"./network/iperf3_start_servers.py", "--numservers", numservers, "--startport", startport}
+	if owner != "" {
+		args = append(args, "--owner", owner)
+	}
+	// only the JSON with the leased ports goes back to the caller
+	out, stderr, err := runPython(args...)
+	if len(stderr) > 0 {
+		klog.Info(string(stderr))
+	}
 	if err != nil {
 		klog.Info(string(out))
 		klog.Error(err.Error())
@@ -330,8 +453,12 @@ func StartIperfServers(numservers string, startport string) (*[]byte, error) {
 	return &out, nil
 }
 
-func StopAllIperfServers() (*[]byte, error) {
-	out, err := exec.Command("python3", "./network/iperf3_stop_servers.py").CombinedOutput()
+func StopAllIperfServers(owner string) (*[]byte, error) {
+	args := []string{"./network/iperf3_stop_servers.py"}
+	if owner != "" {
+		args = append(args, "--owner", owner)
+	}
+	out, err := runPythonCombined(args...)
 	if err != nil {
 		klog.Info(string(out))
 		klog.Error(err.Error())
@@ -342,13 +469,23 @@ func StopAllIperfServers() (*[]byte, error) {
 	return &out, nil
 }
 
-func StartIperfClients(dstip string, dstport string, numclients string) (*[]byte, error) {
+func StartIperfClients(dstip string, dstport string, numclients string, flags ...string) (*[]byte, error) {
 	if dstip == "" || dstport == "" || numclients == "" {
 		klog.Error("Must provide arguments \"dstip\", \"dstport\", and \"startport\".")
 		return nil, nil
 	}
 
-	out, err := exec.Command("python3", "./network/iperf3_start_clients.py", "--dstip", dstip, "--dstport", dstport, "--numclients", numclients).CombinedOutput()
+	// only the JSON summary goes back to the caller, the log of the clients stays here
+	args := []string{"./network/iperf3_start_clients.py", "--dstip", dstip, "--dstport", dstport, "--numclients", numclients}
+	for _, flag := range flags {
+		if flag != "" {
+			args = append(args, flag)
+		}
+	}
+	out, stderr, err := runPython(args...)
+	if len(stderr) > 0 {
+		klog.Info(string(stderr))
+	}
 	if err != nil {
 		klog.Info(string(out))
 		klog.Error(err.Error())
@@ -361,70 +498,56 @@ func StartIperfClients(dstip string, dstport string, numclients string) (*[]byte
 
 func RunDCGM(dcgmR string) (*[]byte, error) {
 	HealthCheckStatus[DCGM] = false
-	out, err := exec.Command("python3", "./gpu-dcgm/entrypoint.py", "-r", dcgmR, "-l").Output()
+	result, err := runCheck("./gpu-dcgm/entrypoint.py", "-r", dcgmR, "-l")
 	if err != nil {
-		klog.Error(err.Error())
 		return nil, err
-	} else {
-		klog.Info("DCGM test completed:")
+	}
+	out := result.Report()
+	klog.Info("DCGM test completed:")
 
-		if strings.Contains(string(out[:]), "ERR") {
-			klog.Info("DCGM test exited with errors.", string(out[:]))
-		}
+	if result.Status == StatusErr {
+		klog.Info("DCGM test exited with errors.", string(out[:]))
+	}
 
-		if strings.Contains(string(out[:]), "ABORT") {
-			klog.Info("DCGM cannot be run. ", string(out[:]))
-			return &out, nil
-		}
-		output := strings.TrimSuffix(string(out[:]), "\n")
-		split := strings.Split(output, "\n")
-		var res float64
-		res = 0
-		if strings.Contains(split[len(split)-1], "SUCCESS") {
-			klog.Info("Observation: ", utils.NodeName, " Pass ", res)
-		} else {
-			res = 1
-			klog.Info("Observation: ", utils.NodeName, " Fail ", res)
-			HealthCheckStatus[DCGM] = true
-		}
-		utils.HchecksGauge.WithLabelValues(string(DCGM), utils.NodeName, utils.CPUModel, utils.GPUModel, "").Set(res)
+	if result.Aborted() {
+		klog.Info("DCGM cannot be run. ", string(out[:]))
+		return &out, nil
 	}
+	var res float64
+	res = 0
+	if result.Status == StatusSuccess {
+		klog.Info("Observation: ", utils.NodeName, " Pass ", res)
+	} else {
+		res = 1
+		klog.Info("Observation: ", utils.NodeName, " Fail ", res)
+		HealthCheckStatus[DCGM] = true
+	}
+	utils.HchecksGauge.WithLabelValues(string(DCGM), utils.NodeName, utils.CPUModel, utils.GPUModel, "").Set(res)
 	return &out, nil
 }
 
-func RunGPUPower() (*[]byte, error) {
+func RunGPUPower(periodic bool) (*[]byte, error) {
 	HealthCheckStatus[GPUPower] = false
-	out, err := exec.Command("bash", "./gpu-power/power-throttle.sh").Output()
+	result, err := runCheck(samplerWindowArgs("./gpu-power/entrypoint.py", periodic)...)
 	if err != nil {
-		klog.Error(err.Error())
 		return nil, err
 	}
+	out := result.Report()
 	klog.Info("Power Throttle check test completed:")
 
-	if strings.Contains(string(out[:]), "FAIL") {
+	if result.Failed() {
 		klog.Info("Power Throttle test failed.", string(out[:]))
 		HealthCheckStatus[GPUPower] = true
 	}
 
-	if strings.Contains(string(out[:]), "ABORT") {
+	if result.Aborted() {
 		klog.Info("Power Throttle cannot be run. ", string(out[:]))
 		return &out, nil
 	}
 
-	output := strings.TrimSuffix(string(out[:]), "\n")
-	split := strings.Split(output, "\n")
-	pwrs := split[len(split)-1]
-	final := strings.Split(pwrs, " ")
-
-	for gpuid, v := range final {
-		pw, err := strconv.ParseFloat(v, 64)
-		if err != nil {
-			klog.Error(err.Error())
-			return nil, err
-		}
-		klog.Info("Observation: ", utils.NodeName, " ", strconv.Itoa(gpuid), " ", pw)
-		utils.HchecksGauge.WithLabelValues("power-slowdown", utils.NodeName, utils.CPUModel, utils.GPUModel, strconv.Itoa(gpuid)).Set(pw)
-
+	for _, v := range result.Values {
+		klog.Info("Observation: ", utils.NodeName, " ", v.Device, " ", v.Value)
+		utils.HchecksGauge.WithLabelValues("power-slowdown", utils.NodeName, utils.CPUModel, utils.GPUModel, v.Device).Set(v.Value)
 	}
 	return &out, nil
 }
@@ -0,0 +1,116 @@
+package healthcheck
+
+import (
+	"encoding/json"
+	"errors"
+	"path/filepath"
+	"strings"
+	"time"
+
+	"github.com/IBM/autopilot/pkg/utils"
+	"k8s.io/klog/v2"
+)
+
+// Result record printed by the python entrypoints when run with --json (see utils/checkresult.py)
+type CheckResult struct {
+	Check    string       `json:"check"`
+	Node     string       `json:"node"`
+	Status   string       `json:"status"`
+	Values   []CheckValue `json:"values"`
+	Unit     string       `json:"unit,omitempty"`
+	Message  string       `json:"message,omitempty"`
+	Started  float64      `json:"started"`
+	Duration float64      `json:"duration"`
+	Log      []string     `json:"log,omitempty"`
+}
+
+type CheckValue struct {
+	Device string             `json:"device"`
+	Value  float64            `json:"value"`
+	Labels map[string]string  `json:"labels,omitempty"`
+	Stats  map[string]float64 `json:"stats,omitempty"`
+}
+
+const (
+	StatusSuccess = "SUCCESS"
+	StatusFail    = "FAIL"
+	StatusAbort   = "ABORT"
+	StatusSkip    = "SKIP"
+	StatusErr     = "ERR"
+
+	// Prefix of the line carrying the record in the responses of the daemon
+	resultPrefix = "[[ RESULT ]] "
+)
+
+func (r *CheckResult) Failed() bool {
+	return r.Status == StatusFail || r.Status == StatusErr
+}
+
+func (r *CheckResult) Aborted() bool {
+	return r.Status == StatusAbort || r.Status == StatusSkip
+}
+
+// Text returned to the callers: the log of the check followed by the record, without the log, on a single line
+func (r *CheckResult) Report() []byte {
+	out := strings.Join(r.Log, "\n") + "\n"
+	record := *r
+	record.Log = nil
+	line, err := json.Marshal(record)
+	if err != nil {
+		klog.Error(err.Error())
+		return []byte(out)
+	}
+	return []byte(out + resultPrefix + string(line) + "\n")
+}
+
+// Runs a python entrypoint with --json and decodes its result record.
+// Never returns a nil result: without a record, the check is reported as ERR with its output as log
+func runCheck(args ...string) (*CheckResult, error) {
+	out, stderr, err := runPython(append(args, "--json")...)
+	if len(stderr) > 0 {
+		klog.Info(string(stderr))
+	}
+	if err != nil {
+		klog.Error(args[0], ": ", err.Error())
+	}
+	result, decodeErr := decodeResult(out)
+	if decodeErr != nil {
+		klog.Error("Cannot decode result of ", args[0], ": ", decodeErr.Error(), " ", string(out))
+		message := "no result record: " + decodeErr.Error()
+		if err != nil {
+			message = err.Error() + ", " + message
+		}
+		return errorResult(args[0], message, append(out, stderr...)), nil
+	}
+	return result, nil
+}
+
+// The record is the last line of the output that decodes as one. Lines written around it,
+// e.g. by a subprocess of the check writing to fd 1 directly, are appended to its log
+func decodeResult(out []byte) (*CheckResult, error) {
+	lines := strings.Split(strings.TrimSpace(string(out)), "\n")
+	err := errors.New("empty output")
+	for i := len(lines) - 1; i >= 0; i-- {
+		result := &CheckResult{}
+		if err = json.Unmarshal([]byte(lines[i]), result); err == nil && result.Status != "" {
+			result.Log = append(result.Log, lines[:i]...)
+			result.Log = append(result.Log, lines[i+1:]...)
+			return result, nil
+		}
+		if err == nil {
+			err = errors.New("no status in the record")
+		}
+	}
+	return nil, err
+}
+
+func errorResult(script string, message string, out []byte) *CheckResult {
+	return &CheckResult{
+		Check:   filepath.Base(filepath.Dir(script)),
+		Node:    utils.NodeName,
+		Status:  StatusErr,
+		Message: message,
+		Started: float64(time.Now().UnixNano()) / 1e9,
+		Log:     strings.Split(strings.TrimSpace(string(out)), "\n"),
+	}
+}
@@ -0,0 +1,26 @@
+package healthcheck
+
+import (
+	"os"
+	"os/exec"
+	"strconv"
+	"time"
+
+	"k8s.io/klog/v2"
+)
+
+// Starts the GPU telemetry sampler (utils/gpusampler.py) and restarts it if it exits.
+// The power and remapped rows checks report what it sampled between two of their runs.
+func StartGPUSampler(interval int) {
+	for {
+		klog.Info("Starting GPU sampler, interval ", interval, "s")
+		cmd := exec.Command("python3", "./utils/gpusampler.py", "--interval", strconv.Itoa(interval))
+		cmd.Stdout = os.Stdout
+		cmd.Stderr = os.Stderr
+		err := cmd.Run()
+		if err != nil {
+			klog.Error("GPU sampler exited: ", err.Error())
+		}
+		time.Sleep(10 * time.Second)
+	}
+}
@@ -0,0 +1,90 @@
+package healthcheck
+
+import (
+	"bytes"
+	"encoding/json"
+	"fmt"
+	"net"
+	"os"
+	"os/exec"
+	"time"
+
+	"k8s.io/klog/v2"
+)
+
+// Unix socket of the python worker (utils/checkworker.py), which runs the entrypoints from a warm process
+var workerSocket string = "/tmp/autopilot-checks.sock"
+var workerEnabled bool = false
+
+type workerRequest struct {
+	Script string   `json:"script"`
+	Args   []string `json:"args"`
+}
+
+type workerResponse struct {
+	Returncode int     `json:"returncode"`
+	Stdout     string  `json:"stdout"`
+	Stderr     string  `json:"stderr"`
+	Duration   float64 `json:"duration"`
+}
+
+// Starts the python worker and restarts it if it exits
+func StartWorker() {
+	if path, exists := os.LookupEnv("AUTOPILOT_WORKER_SOCKET"); exists && path != "" {
+		workerSocket = path
+	}
+	workerEnabled = true
+	for {
+		klog.Info("Starting python worker on ", workerSocket)
+		cmd := exec.Command("python3", "./utils/checkworker.py", "--socket", workerSocket)
+		cmd.Stdout = os.Stdout
+		cmd.Stderr = os.Stderr
+		err := cmd.Run()
+		if err != nil {
+			klog.Error("Python worker exited: ", err.Error())
+		}
+		time.Sleep(10 * time.Second)
+	}
+}
+
+func dispatchToWorker(conn net.Conn, args []string) ([]byte, []byte, error) {
+	defer conn.Close()
+	req, err := json.Marshal(workerRequest{Script: args[0], Args: args[1:]})
+	if err != nil {
+		return nil, nil, err
+	}
+	if _, err := conn.Write(append(req, '\n')); err != nil {
+		return nil, nil, err
+	}
+	resp := workerResponse{}
+	if err := json.NewDecoder(conn).Decode(&resp); err != nil {
+		return nil, nil, err
+	}
+	if resp.Returncode != 0 {
+		return []byte(resp.Stdout), []byte(resp.Stderr), fmt.Errorf("exit status %d", resp.Returncode)
+	}
+	return []byte(resp.Stdout), []byte(resp.Stderr), nil
+}
+
+// Runs "python3 args...", through the worker when it is running, otherwise as a new process
+func runPython(args ...string) ([]byte, []byte, error) {
+	if workerEnabled {
+		conn, err := net.DialTimeout("unix", workerSocket, time.Second)
+		if err == nil {
+			return dispatchToWorker(conn, args)
+		}
+		klog.Info("Python worker not available, running ", args[0], " as a new process: ", err.Error())
+	}
+	var stdout, stderr bytes.Buffer
+	cmd := exec.Command("python3", args...)
+	cmd.Stdout = &stdout
+	cmd.Stderr = &stderr
+	err := cmd.Run()
+	return stdout.Bytes(), stderr.Bytes(), err
+}
+
+// Same as runPython, with stdout and stderr together
+func runPythonCombined(args ...string) ([]byte, error) {
+	stdout, stderr, err := runPython(args...)
+	return append(stdout, stderr...), err
+}
@@ -25,11 +25,72 @@ var (
 		},
 		[]string{"health", "node", "cpumodel", "gpumodel", "deviceid"},
 	)
+
+	PingRTTGauge = prometheus.NewGaugeVec(
+		prometheus.GaugeOpts{
+			Namespace: "autopilot",
+			Name:      "ping_rtt_milliseconds",
+			Help:      "Round trip time from node to the peers pinged in the last run on each interface: lowest min, mean of the averages and highest max over the peers (stat min, mean, max)",
+		},
+		[]string{"node", "iface", "stat"},
+	)
+
+	PingLossGauge = prometheus.NewGaugeVec(
+		prometheus.GaugeOpts{
+			Namespace: "autopilot",
+			Name:      "ping_packet_loss_percent",
+			Help:      "Packet loss from node to the peers pinged in the last run on each interface, mean and max over the peers (stat mean, max)",
+		},
+		[]string{"node", "iface", "stat"},
+	)
+
+	PingRTTHistogram = prometheus.NewHistogramVec(
+		prometheus.HistogramOpts{
+			Namespace: "autopilot",
+			Name:      "ping_rtt_avg_milliseconds",
+			Help:      "Distribution of the average round trip time to the peers of the node on each interface",
+			Buckets:   prometheus.ExponentialBuckets(0.025, 2, 14),
+		},
+		[]string{"node", "iface"},
+	)
+
+	IperfBandwidthGauge = prometheus.NewGaugeVec(
+		prometheus.GaugeOpts{
+			Namespace: "autopilot",
+			Name:      "iperf_bandwidth_gbps",
+			Help:      "Median bandwidth sent or received by each node on each interface in the last iperf3 workload",
+		},
+		[]string{"node", "iface", "direction"},
+	)
+
+	IperfZScoreGauge = prometheus.NewGaugeVec(
+		prometheus.GaugeOpts{
+			Namespace: "autopilot",
+			Name:      "iperf_bandwidth_robust_zscore",
+			Help:      "Robust z-score of the median bandwidth of each node on each interface against the other nodes, in the last iperf3 workload",
+		},
+		[]string{"node", "iface", "direction"},
+	)
+
+	IperfDegradedGauge = prometheus.NewGaugeVec(
+		prometheus.GaugeOpts{
+			Namespace: "autopilot",
+			Name:      "iperf_degraded",
+			Help:      "1 when the interface of the node is a bandwidth outlier as a sender or a receiver in the last iperf3 workload",
+		},
+		[]string{"node", "iface", "verdict"},
+	)
 )
 
 func InitMetrics(reg prometheus.Registerer) {
 	// Register custom metrics with the global prometheus registry
 	reg.MustRegister(HchecksGauge)
+	reg.MustRegister(PingRTTGauge)
+	reg.MustRegister(PingLossGauge)
+	reg.MustRegister(PingRTTHistogram)
+	reg.MustRegister(IperfBandwidthGauge)
+	reg.MustRegister(IperfZScoreGauge)
+	reg.MustRegister(IperfDegradedGauge)
 }
 
 func InitHardwareMetrics() {
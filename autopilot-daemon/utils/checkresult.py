@@ -0,0 +1,86 @@
+##################################################################################
+# Machine-readable result record shared by the health check entrypoints.
+# When an entrypoint runs with --json, everything it prints is collected in the
+# "log" field and a single JSON object is written to stdout at the end, e.g.
+#
+#   {"check": "pciebw", "node": "node1", "status": "SUCCESS",
+#    "values": [{"device": "0", "value": 12.3, "labels": {}}, ...],
+#    "unit": "GB/s", "message": "", "started": 1718000000.0, "duration": 31.2,
+#    "log": ["[[ PCIEBW ]] Briefings completed. ...", ...]}
+#
+# Values may also carry numeric "stats" next to the value, e.g. the RTT of a ping.
+# Without --json the entrypoints print their usual free text.
+##################################################################################
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+SUCCESS = 'SUCCESS'
+FAIL = 'FAIL'
+ABORT = 'ABORT'
+SKIP = 'SKIP'
+ERR = 'ERR'
+
+# prefix of the line carrying the record in the responses of the autopilot daemon
+RESULT_PREFIX = '[[ RESULT ]] '
+
+
+class CheckResult:
+    def __init__(self, check, unit=''):
+        self.check = check
+        self.node = os.getenv('NODE_NAME')
+        self.status = None
+        self.values = []
+        self.unit = unit
+        self.message = ''
+        self.started = time.time()
+        self.duration = 0.0
+        self.log = []
+
+    def add_value(self, device, value, stats=None, **labels):
+        entry = {'device': str(device), 'value': value, 'labels': labels}
+        if stats:
+            entry['stats'] = stats
+        self.values.append(entry)
+
+    def set_status(self, status, message=''):
+        self.status = status
+        if message:
+            self.message = message
+
+    def to_dict(self):
+        return {
+            'check': self.check,
+            'node': self.node,
+            # a check that never reported its outcome exited unexpectedly
+            'status': self.status or ERR,
+            'values': self.values,
+            'unit': self.unit,
+            'message': self.message,
+            'started': self.started,
+            'duration': self.duration,
+            'log': self.log,
+        }
+
+    @contextlib.contextmanager
+    def capture(self, json_output):
+        '''
+        Runs the body of the check. With json_output, the text printed by the body is
+        collected in the record, and the record is printed once the body completes,
+        also when it ends with exit().
+        '''
+        if not json_output:
+            yield self
+            return
+        buf = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(buf):
+                yield self
+        finally:
+            self.duration = time.time() - self.started
+            self.log = buf.getvalue().splitlines()
+            sys.stdout.write(json.dumps(self.to_dict()) + '\n')
+            sys.stdout.flush()
@@ -0,0 +1,143 @@
+##################################################################################
+# Long-lived worker running the python health check entrypoints.
+# Heavy modules (kubernetes, aiohttp, netifaces), the in-cluster configuration and
+# the watched pod/endpoint inventory (utils/inventory.py) are loaded once at startup. Each request received on the unix socket forks the
+# warm process and runs the requested entrypoint as __main__ in the child, so
+# checks keep their own state and exit() calls, without paying interpreter and
+# import startup every time.
+#
+# Protocol: one JSON line per connection
+#   request:  {"script": "./gpu-bw/entrypoint.py", "args": ["-t", "4", "--json"]}
+#   response: {"returncode": 0, "stdout": "...", "stderr": "...", "duration": 1.2}
+##################################################################################
+import argparse
+import importlib
+import json
+import os
+import runpy
+import socket
+import socketserver
+import sys
+import tempfile
+import time
+import traceback
+
+PRELOAD_MODULES = ['asyncio', 'aiohttp', 'netifaces', 'kubernetes.client', 'kubernetes.config']
+
+DEFAULT_SOCKET = '/tmp/autopilot-checks.sock'
+
+
+def preload():
+    for module in PRELOAD_MODULES:
+        try:
+            importlib.import_module(module)
+        except ImportError as e:
+            print("[WORKER] Cannot preload", module, ":", e, file=sys.stderr)
+    try:
+        from kubernetes import config
+        config.load_incluster_config()
+    except Exception as e:
+        print("[WORKER] In-cluster config not loaded:", e, file=sys.stderr)
+        return
+    # the default client configuration is now set for every forked check, later loads are no-ops
+    config.load_incluster_config = lambda *args, **kwargs: None
+    # autopilot pods and endpoints, kept up to date by a watch: the forked checks start from this snapshot
+    if os.getenv('NAMESPACE'):
+        try:
+            from inventory import get_inventory
+            get_inventory().watch()
+        except Exception as e:
+            print("[WORKER] Inventory not watched:", e, file=sys.stderr)
+
+
+# runs in the forked child: the entrypoint writes to temporary files in place of fds 1 and 2,
+# so the output of its own subprocesses is captured as well
+def run_script(script, script_args):
+    out = tempfile.TemporaryFile()
+    err = tempfile.TemporaryFile()
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os.dup2(out.fileno(), 1)
+    os.dup2(err.fileno(), 2)
+    sys.argv = [script] + list(script_args)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+    returncode = 0
+    start = time.time()
+    try:
+        runpy.run_path(script, run_name='__main__')
+    except SystemExit as e:
+        if e.code is None:
+            returncode = 0
+        elif isinstance(e.code, int):
+            returncode = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            returncode = 1
+    except BaseException:
+        traceback.print_exc()
+        returncode = 1
+    sys.stdout.flush()
+    sys.stderr.flush()
+    duration = time.time() - start
+    out.seek(0)
+    err.seek(0)
+    return {
+        'returncode': returncode,
+        'stdout': out.read().decode(errors='replace'),
+        'stderr': err.read().decode(errors='replace'),
+        'duration': duration,
+    }
+
+
+class CheckRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            script = request['script']
+            script_args = request.get('args', [])
+        except (ValueError, KeyError, TypeError) as e:
+            self.reply({'returncode': 2, 'stdout': '', 'stderr': 'Invalid request: ' + str(e), 'duration': 0.0})
+            return
+        if not os.path.isfile(script) or not script.endswith('.py'):
+            self.reply({'returncode': 2, 'stdout': '', 'stderr': 'Unknown entrypoint ' + script, 'duration': 0.0})
+            return
+        self.reply(run_script(script, script_args))
+
+    def reply(self, response):
+        self.wfile.write((json.dumps(response) + '\n').encode())
+        self.wfile.flush()
+
+
+class ForkingUnixServer(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    pass
+
+
+# client side, used by the benchmark and for manual runs. The daemon has its own client in Go.
+def dispatch(socket_path, script, script_args):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.connect(socket_path)
+        conn.sendall((json.dumps({'script': script, 'args': list(script_args)}) + '\n').encode())
+        with conn.makefile('rb') as f:
+            return json.loads(f.readline())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--socket', type=str, default=DEFAULT_SOCKET, help='Unix socket the worker listens on. Default is "' + DEFAULT_SOCKET + '".')
+    args = parser.parse_args()
+
+    preload()
+    if os.path.exists(args.socket):
+        os.unlink(args.socket)
+    server = ForkingUnixServer(args.socket, CheckRequestHandler)
+    os.chmod(args.socket, 0o600)
+    print("[WORKER] Ready on", args.socket, file=sys.stderr)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.unlink(args.socket)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+##################################################################################
+# HTTP fan-out of utils/runHealthchecks.py to the autopilot endpoints.
+# A single connection pool is shared by all the requests of a run, and a sliding
+# window keeps batch_size requests in flight: a new node is started as soon as one
+# completes. Shared with hack/bench_healthchecks_fanout.py, so that the benchmark
+# measures the settings actually used.
+##################################################################################
+import asyncio
+
+import aiohttp
+
+# connection pool settings for the requests sent to the autopilot endpoints
+CONNECTIONS_PER_HOST = 2
+KEEPALIVE_TIMEOUT = 60 # seconds
+DNS_CACHE_TTL = 300 # seconds
+TOTAL_TIMEOUT = 60*60*24 # seconds
+
+
+# TCP connections and resolved names are reused instead of being set up again for every node
+def create_session(batch_size):
+    connector = aiohttp.TCPConnector(limit=batch_size, limit_per_host=CONNECTIONS_PER_HOST, ttl_dns_cache=DNS_CACHE_TTL, keepalive_timeout=KEEPALIVE_TIMEOUT)
+    total_timeout = aiohttp.ClientTimeout(total=TOTAL_TIMEOUT)
+    return aiohttp.ClientSession(connector=connector, timeout=total_timeout)
+
+
+# batch_size workers pull the next item from a shared queue as soon as they are done with the
+# previous one, so a slow node only holds its own slot. request(session, item) is awaited for
+# each item and its result handed to on_result as soon as it completes
+async def sliding_window(items, batch_size, request, on_result):
+    queue = asyncio.Queue()
+    for item in items:
+        queue.put_nowait(item)
+
+    async def worker(session):
+        while True:
+            try:
+                item = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            on_result(await request(session, item))
+
+    async with create_session(batch_size) as session:
+        await asyncio.gather(*(worker(session) for _ in range(batch_size)))
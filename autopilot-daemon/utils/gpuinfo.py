@@ -0,0 +1,92 @@
+##################################################################################
+# State of all the GPUs of the node from a single nvidia-smi call:
+#   nvidia-smi --query-gpu=<FIELDS> --format=csv,noheader,nounits
+# one line per GPU, instead of one or more nvidia-smi runs per GPU and per check.
+# Used by the remapped rows and power throttle checks, and by the telemetry sampler.
+#
+# collect() returns a list of GPU dicts, in nvidia-smi index order:
+#   {'index': 0, 'bus_id': '00000000:3B:00.0',
+#    'remapped': {'pending': False, 'failure': False, 'correctable': 0, 'uncorrectable': 0},
+#    'throttle': {'hw_slowdown': False, 'hw_thermal_slowdown': False, ...},
+#    'power': {'draw': 71.3, 'limit': 400.0},
+#    'ecc': {'corrected': 0, 'uncorrected': 0}}
+# The ECC counts are the volatile ones, since the last driver reload.
+# Values the GPU does not support ([N/A], [Not Supported]) are None.
+##################################################################################
+import subprocess
+
+NVIDIA_SMI = 'nvidia-smi'
+
+REMAPPED = ['pending', 'failure', 'correctable', 'uncorrectable']
+THROTTLE = ['hw_slowdown', 'hw_thermal_slowdown', 'hw_power_brake_slowdown', 'sw_power_cap', 'sw_thermal_slowdown']
+POWER = ['draw', 'limit']
+ECC = ['corrected', 'uncorrected']
+
+# in the order of the fields
+GROUPS = [('remapped', REMAPPED), ('throttle', THROTTLE), ('power', POWER), ('ecc', ECC)]
+
+# the throttle reasons are called clocks_throttle_reasons by drivers older than 535
+THROTTLE_PREFIXES = ['clocks_event_reasons.', 'clocks_throttle_reasons.']
+
+
+def fields(throttle_prefix):
+    return (['index', 'pci.bus_id']
+            + ['remapped_rows.' + f for f in REMAPPED]
+            + [throttle_prefix + f for f in THROTTLE]
+            + ['power.' + f for f in POWER]
+            + ['ecc.errors.' + f + '.volatile.total' for f in ECC])
+
+
+def parse_value(value):
+    value = value.strip()
+    if value.startswith('[') or value in ('', 'N/A'):
+        return None
+    if value.lower() in ('yes', 'active', 'enabled'):
+        return True
+    if value.lower() in ('no', 'not active', 'disabled'):
+        return False
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def parse_line(line):
+    values = [parse_value(v) for v in line.split(',')]
+    if len(values) != 2 + sum(len(names) for _, names in GROUPS):
+        return None
+    gpu = {'index': values[0], 'bus_id': values[1]}
+    start = 2
+    for group, names in GROUPS:
+        gpu[group] = dict(zip(names, values[start:start + len(names)]))
+        start += len(names)
+    return gpu
+
+
+def collect(nvidia_smi=NVIDIA_SMI):
+    '''
+    Returns the state of every GPU, an empty list when there is no GPU. Raises
+    RuntimeError when nvidia-smi cannot be run or fails.
+    '''
+    error = ''
+    for prefix in THROTTLE_PREFIXES:
+        try:
+            proc = subprocess.run([nvidia_smi, '--query-gpu=' + ','.join(fields(prefix)), '--format=csv,noheader,nounits'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        except OSError as e:
+            raise RuntimeError('Cannot run ' + nvidia_smi + ': ' + str(e))
+        if proc.returncode == 0:
+            gpus = [parse_line(line) for line in proc.stdout.splitlines() if line.strip()]
+            if None in gpus:
+                raise RuntimeError('Cannot parse the output of ' + nvidia_smi + ': ' + proc.stdout.strip())
+            return gpus
+        error = proc.stdout.strip()
+        # only an unknown field is worth a second try with the old names
+        if 'Field' not in error:
+            break
+    if 'No devices were found' in error:
+        return []
+    raise RuntimeError(nvidia_smi + ' failed: ' + error)
@@ -0,0 +1,209 @@
+##################################################################################
+# GPU telemetry sampler, running next to the health checks.
+# The periodic checks see the GPUs only once per period, so a throttling episode
+# or ECC errors between two runs go unnoticed. The sampler reads the state of all
+# the GPUs (utils/gpuinfo.py, one nvidia-smi call) every --interval seconds and
+# stores it in a fixed-size ring buffer, memory-mapped from SAMPLES_FILE, so its
+# memory and disk use are bounded whatever the uptime.
+# The checks read the samples taken since their previous periodic run (window_since_last)
+# and report the aggregates: seconds in each throttle reason and the longest
+# episode, max and mean power draw, ECC and remapped rows deltas.
+#
+# File layout: HEADER, then CAPACITY rows of float64:
+#   timestamp, then len(FIELDS) values for each GPU (NaN when not supported)
+# The row count in the header is written after the row, readers only see complete rows.
+#
+# Usage: python3 utils/gpusampler.py --interval 30
+##################################################################################
+import argparse
+import math
+import mmap
+import os
+import struct
+import sys
+import time
+
+from gpuinfo import collect, THROTTLE
+
+SAMPLES_FILE = os.getenv('GPU_SAMPLER_FILE') or '/tmp/autopilot-gpu-samples.bin'
+DEFAULT_INTERVAL = float(os.getenv('GPU_SAMPLER_INTERVAL') or 30) # seconds
+DEFAULT_CAPACITY = 8640 # samples, 3 days at 30s
+IDLE_BACKOFF = 10 # intervals to wait when there is no GPU or nvidia-smi fails
+
+MAGIC = b'APGS'
+VERSION = 1
+# magic, version, capacity, gpus, fields, interval, count
+HEADER = struct.Struct('<4sIIIIdQ')
+FIELDS = THROTTLE + ['power_draw', 'ecc_corrected', 'ecc_uncorrected', 'remapped_pending', 'remapped_uncorrectable']
+
+
+def sample_values(gpu):
+    values = [gpu['throttle'][reason] for reason in THROTTLE]
+    values += [gpu['power']['draw'], gpu['ecc']['corrected'], gpu['ecc']['uncorrected'], gpu['remapped']['pending'], gpu['remapped']['uncorrectable']]
+    return [math.nan if v is None else float(v) for v in values]
+
+
+class RingBuffer:
+    def __init__(self, path, capacity, gpus, interval, create=True):
+        self.path = path
+        self.capacity = capacity
+        self.gpus = gpus
+        self.interval = interval
+        self.row = struct.Struct('<%dd' % (1 + gpus * len(FIELDS)))
+        size = HEADER.size + capacity * self.row.size
+        fd = os.open(path, os.O_RDWR | os.O_CREAT if create else os.O_RDONLY, 0o644)
+        try:
+            header = os.pread(fd, HEADER.size, 0)
+            if create:
+                # the history is kept across restarts of the sampler, unless the layout changed
+                if len(header) < HEADER.size or HEADER.unpack(header)[:5] != (MAGIC, VERSION, capacity, gpus, len(FIELDS)):
+                    os.ftruncate(fd, 0)
+                    os.ftruncate(fd, size)
+                    os.pwrite(fd, HEADER.pack(MAGIC, VERSION, capacity, gpus, len(FIELDS), interval, 0), 0)
+                self.mm = mmap.mmap(fd, size)
+            else:
+                self.mm = mmap.mmap(fd, size, prot=mmap.PROT_READ)
+        finally:
+            os.close(fd)
+
+    @classmethod
+    def open(cls, path=SAMPLES_FILE):
+        '''Opens the buffer of a running sampler for reading, None when there is none.'''
+        try:
+            with open(path, 'rb') as f:
+                header = f.read(HEADER.size)
+            magic, version, capacity, gpus, fields, interval, _ = HEADER.unpack(header)
+            if magic != MAGIC or version != VERSION or fields != len(FIELDS):
+                return None
+            return cls(path, capacity, gpus, interval, create=False)
+        except (OSError, struct.error, ValueError):
+            return None
+
+    def count(self):
+        return HEADER.unpack_from(self.mm, 0)[6]
+
+    def append(self, timestamp, values):
+        count = self.count()
+        self.row.pack_into(self.mm, HEADER.size + (count % self.capacity) * self.row.size, timestamp, *values)
+        HEADER.pack_into(self.mm, 0, MAGIC, VERSION, self.capacity, self.gpus, len(FIELDS), self.interval, count + 1)
+
+    def samples(self, since=0.0):
+        '''Returns the (timestamp, values) rows taken at or after since, oldest first.'''
+        count = self.count()
+        rows = []
+        for n in range(count - 1, max(count - self.capacity, 0) - 1, -1):
+            row = self.row.unpack_from(self.mm, HEADER.size + (n % self.capacity) * self.row.size)
+            if row[0] < since:
+                break
+            rows.append((row[0], row[1:]))
+        rows.reverse()
+        return rows
+
+
+def increase(values):
+    # sum of the increments, a counter reset (driver reload) starts again from 0
+    total = 0.0
+    for prev, cur in zip(values, values[1:]):
+        total += cur - prev if cur >= prev else cur
+    return total
+
+
+def aggregate(rows, gpus, interval):
+    '''
+    Returns, by GPU index, the aggregates of the samples in rows. A throttle episode is
+    a series of consecutive samples with the reason active, each one counting for an interval.
+    '''
+    stats = {}
+    for gpu in range(gpus):
+        series = {}
+        for i, field in enumerate(FIELDS):
+            series[field] = [(t, values[gpu * len(FIELDS) + i]) for t, values in rows if not math.isnan(values[gpu * len(FIELDS) + i])]
+        gpu_stats = {'samples': float(len(rows))}
+        for reason in THROTTLE:
+            active, longest, run, last = 0, 0, 0, None
+            for t, v in series[reason]:
+                # a gap in the samples ends the episode
+                if v and last is not None and t - last <= 1.5 * interval:
+                    run += 1
+                else:
+                    run = 1 if v else 0
+                active += 1 if v else 0
+                longest = max(longest, run)
+                last = t
+            gpu_stats[reason + '_seconds'] = active * interval
+            gpu_stats[reason + '_max_seconds'] = longest * interval
+        power = [v for _, v in series['power_draw']]
+        if power:
+            gpu_stats['power_max'] = max(power)
+            gpu_stats['power_mean'] = sum(power) / len(power)
+        for counter in ('ecc_corrected', 'ecc_uncorrected', 'remapped_uncorrectable'):
+            if series[counter]:
+                gpu_stats[counter + '_delta'] = increase([v for _, v in series[counter]])
+        if series['remapped_pending']:
+            gpu_stats['remapped_pending_seen'] = max(v for _, v in series['remapped_pending'])
+        stats[gpu] = gpu_stats
+    return stats
+
+
+def window_since_last(check, advance, path=SAMPLES_FILE):
+    '''
+    Aggregates of the samples taken since the last call with advance set for this check
+    (all the samples when there was none), by GPU index. Empty when the sampler is not
+    running. Only the periodic runs advance the window, so an on-demand run does not hide
+    what it reports from the next periodic run.
+    '''
+    # start of the window of the check, next to the samples
+    last_run = path + '.%s.last' % check
+    try:
+        with open(last_run) as f:
+            since = float(f.read())
+    except (OSError, ValueError):
+        since = 0.0
+    if advance:
+        try:
+            with open(last_run, 'w') as f:
+                f.write(str(time.time()))
+        except OSError:
+            pass
+    buffer = RingBuffer.open(path)
+    if buffer is None:
+        return {}
+    rows = buffer.samples(since)
+    if not rows:
+        return {}
+    return aggregate(rows, buffer.gpus, buffer.interval)
+
+
+def run(interval, capacity, path):
+    buffer = None
+    failing = False
+    while True:
+        start = time.time()
+        try:
+            gpus = collect()
+            error = '' if gpus else 'No NVIDIA GPU detected'
+        except RuntimeError as e:
+            gpus, error = [], str(e)
+        if error:
+            if not failing:
+                print('[[ GPU SAMPLER ]]', error, '- retrying every', interval * IDLE_BACKOFF, 's', file=sys.stderr)
+            failing = True
+            time.sleep(interval * IDLE_BACKOFF)
+            continue
+        if failing:
+            print('[[ GPU SAMPLER ]] Sampling', len(gpus), 'GPU(s) every', interval, 's', file=sys.stderr)
+        failing = False
+        if buffer is None or buffer.gpus != len(gpus):
+            buffer = RingBuffer(path, capacity, len(gpus), interval)
+        buffer.append(start, [v for gpu in gpus for v in sample_values(gpu)])
+        time.sleep(max(0.0, interval - (time.time() - start)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL, help='Seconds between two samples. Default is GPU_SAMPLER_INTERVAL or 30.')
+    parser.add_argument('--capacity', type=int, default=DEFAULT_CAPACITY, help='Number of samples kept. Default is 8640.')
+    parser.add_argument('--file', type=str, default=SAMPLES_FILE, help='File backing the ring buffer. Default is ' + SAMPLES_FILE + '.')
+    args = parser.parse_args()
+    print('[[ GPU SAMPLER ]] Sampling every', args.interval, 's, keeping', args.capacity, 'samples in', args.file, file=sys.stderr)
+    run(args.interval, args.capacity, args.file)
@@ -0,0 +1,306 @@
+##################################################################################
+# Cached inventory of the autopilot pods and of the healthchecks service endpoints.
+# The cache is filled with a single paginated LIST of each resource and, when watch()
+# is started, kept up to date by a WATCH from the resourceVersion of that LIST, so
+# lookups never go back to the API server.
+# Endpoints come from the EndpointSlices of the service (kubernetes.io/service-name
+# label), so the API server only returns the objects of that service.
+# The k8s.v1.cni.cncf.io/network-status annotation is parsed once per pod update.
+#
+# Lookups:
+#   node -> pod                 pod_on_node(node)
+#   node -> interfaces          interfaces(node)  {iface: {'ips': [...], 'pod': name}}
+#   node -> service endpoint    endpoint(node)
+# sync() and ensure_synced() take the kinds to LIST, a caller that only needs the
+# endpoints does not LIST the pods.
+#
+# The checkworker keeps one inventory watched for its whole life, and the checks it
+# forks start from that snapshot. The watch needs the watch verb on pods and
+# endpointslices (helm chart ClusterRole): when it is forbidden, the cache is only
+# refreshed by explicit syncs. Messages go to stderr, stdout carries the check output.
+##################################################################################
+import json
+import os
+import sys
+import threading
+import time
+
+from kubernetes import client, watch
+from kubernetes.client.rest import ApiException
+
+NETWORK_STATUS_ANNOTATION = 'k8s.v1.cni.cncf.io/network-status'
+
+WATCH_TIMEOUT = 300 # seconds, the watch is restarted from the last resourceVersion after that
+WATCH_RETRY = 5 # seconds to wait before relisting after a watch failure
+WATCH_RETRY_MAX = 300 # seconds, the wait doubles with each consecutive failure up to that
+LIST_PAGE_SIZE = 500 # objects per LIST request
+SERVICE_NAME_LABEL = 'kubernetes.io/service-name'
+KINDS = ('pods', 'endpointslices')
+
+
+# LIST in pages of LIST_PAGE_SIZE objects. Returns all the items and the resourceVersion of the list
+def list_all(list_func, **kwargs):
+    items = []
+    resource_version = None
+    _continue = None
+    while True:
+        if _continue:
+            page = list_func(limit=LIST_PAGE_SIZE, _continue=_continue, **kwargs)
+        else:
+            page = list_func(limit=LIST_PAGE_SIZE, **kwargs)
+        items.extend(page.items)
+        resource_version = resource_version or page.metadata.resource_version
+        _continue = page.metadata._continue
+        if not _continue:
+            return items, resource_version
+
+
+class EndpointEntry:
+    def __init__(self, ip, node_name, pod):
+        self.ip = ip
+        self.node_name = node_name
+        self.pod = pod
+
+
+class PodEntry:
+    def __init__(self, pod):
+        self.name = pod.metadata.name
+        self.node = pod.spec.node_name
+        self.ips = [pod_ip.ip for pod_ip in (pod.status.pod_i_ps or [])]
+        self.networks = []
+        annotations = pod.metadata.annotations or {}
+        if NETWORK_STATUS_ANNOTATION in annotations:
+            try:
+                self.networks = json.loads(annotations[NETWORK_STATUS_ANNOTATION])
+            except ValueError:
+                print("Cannot parse", NETWORK_STATUS_ANNOTATION, "on pod", self.name, file=sys.stderr)
+        else:
+            print("Key", NETWORK_STATUS_ANNOTATION, "not found on pod", self.name, "- node", self.node, file=sys.stderr)
+        self.interfaces = {}
+        if len(self.networks) > 0:
+            for entry in self.networks:
+                iface = entry.get('interface', 'k8s-pod-network')
+                self.interfaces[iface] = {'ips': entry.get('ips', []), 'pod': self.name}
+        elif len(self.ips) > 0:
+            self.interfaces['default'] = {'ips': self.ips, 'pod': self.name}
+
+
+class Inventory:
+    def __init__(self, namespace, label_selector='app=autopilot', service='autopilot-healthchecks'):
+        self.namespace = namespace
+        self.label_selector = label_selector
+        self.service = service
+        self.v1 = client.CoreV1Api()
+        self.discovery = client.DiscoveryV1Api()
+        self._cond = threading.Condition()
+        self._pods = {} # pod name -> PodEntry
+        self._node_pod = {} # node name -> pod name
+        self._slices = {} # endpointslice name -> [EndpointEntry]
+        self._endpoints = {} # node name -> EndpointEntry
+        self._versions = {}
+        self._synced = set() # kinds listed at least once
+        self._watching = False
+        self._forbidden = set() # kinds the service account cannot watch
+
+    # one LIST of the pods and/or one of the service endpointslices
+    def sync(self, kinds=KINDS):
+        if 'pods' in kinds:
+            pods, pods_version = list_all(self.v1.list_namespaced_pod, namespace=self.namespace, label_selector=self.label_selector)
+        if 'endpointslices' in kinds:
+            slices, slices_version = list_all(self.discovery.list_namespaced_endpoint_slice, namespace=self.namespace, label_selector=SERVICE_NAME_LABEL + '=' + self.service)
+        with self._cond:
+            if 'pods' in kinds:
+                self._pods = {}
+                self._node_pod = {}
+                for pod in pods:
+                    self._add_pod(pod)
+                self._versions['pods'] = pods_version
+            if 'endpointslices' in kinds:
+                self._slices = {}
+                for endpoint_slice in slices:
+                    self._add_slice(endpoint_slice)
+                self._set_endpoints()
+                self._versions['endpointslices'] = slices_version
+            self._synced.update(kinds)
+            self._cond.notify_all()
+        return self
+
+    def ensure_synced(self, kinds=KINDS):
+        missing = [kind for kind in kinds if kind not in self._synced]
+        if missing:
+            self.sync(missing)
+        return self
+
+    # keep the cache up to date in background threads
+    def watch(self):
+        with self._cond:
+            if self._watching:
+                return self
+            self._watching = True
+        self.ensure_synced()
+        threading.Thread(target=self._watch_loop, args=('pods', self.v1.list_namespaced_pod, {'label_selector': self.label_selector}), daemon=True).start()
+        threading.Thread(target=self._watch_loop, args=('endpointslices', self.discovery.list_namespaced_endpoint_slice, {'label_selector': SERVICE_NAME_LABEL + '=' + self.service}), daemon=True).start()
+        return self
+
+    def _watch_loop(self, kind, list_func, selector):
+        relist = False
+        failures = 0
+        while True:
+            if relist:
+                time.sleep(min(WATCH_RETRY * 2 ** failures, WATCH_RETRY_MAX))
+                try:
+                    self.sync((kind,))
+                except Exception as e:
+                    print("Exception when listing", kind, ":", e, file=sys.stderr)
+                    failures += 1
+                    continue
+                relist = False
+            try:
+                w = watch.Watch()
+                for event in w.stream(list_func, namespace=self.namespace, resource_version=self._versions[kind], timeout_seconds=WATCH_TIMEOUT, **selector):
+                    failures = 0
+                    obj = event['object']
+                    with self._cond:
+                        self._versions[kind] = obj.metadata.resource_version
+                        if kind == 'pods':
+                            if event['type'] == 'DELETED':
+                                self._remove_pod(obj.metadata.name)
+                            else:
+                                self._add_pod(obj)
+                        else:
+                            if event['type'] == 'DELETED':
+                                self._slices.pop(obj.metadata.name, None)
+                            else:
+                                self._add_slice(obj)
+                            self._set_endpoints()
+                        self._cond.notify_all()
+            except ApiException as e:
+                # relisting would not help, the lookups use the last sync
+                if e.status == 403:
+                    print("Not allowed to watch " + kind + ", the inventory is only refreshed by syncs:", e.reason, file=sys.stderr)
+                    with self._cond:
+                        self._forbidden.add(kind)
+                        self._cond.notify_all()
+                    return
+                # 410 Gone: the resourceVersion is too old, start again from a fresh LIST
+                if e.status != 410:
+                    print("Exception when watching", kind, ":", e, file=sys.stderr)
+                    failures += 1
+                relist = True
+            except Exception as e:
+                print("Exception when watching", kind, ":", e, file=sys.stderr)
+                failures += 1
+                relist = True
+
+    def _add_pod(self, pod):
+        self._remove_pod(pod.metadata.name)
+        entry = PodEntry(pod)
+        self._pods[entry.name] = entry
+        if entry.node:
+            self._node_pod[entry.node] = entry.name
+
+    def _remove_pod(self, name):
+        entry = self._pods.pop(name, None)
+        if entry is not None and self._node_pod.get(entry.node) == name:
+            del self._node_pod[entry.node]
+
+    def _add_slice(self, endpoint_slice):
+        entries = []
+        for endpoint in endpoint_slice.endpoints or []:
+            # same as the addresses of an Endpoints object: only the ready ones
+            if endpoint.conditions is not None and endpoint.conditions.ready is False:
+                continue
+            if not endpoint.addresses:
+                continue
+            pod = endpoint.target_ref.name if endpoint.target_ref else None
+            entries.append(EndpointEntry(endpoint.addresses[0], endpoint.node_name, pod))
+        self._slices[endpoint_slice.metadata.name] = entries
+
+    def _set_endpoints(self):
+        self._endpoints = {}
+        for name in sorted(self._slices):
+            for entry in self._slices[name]:
+                if entry.node_name not in self._endpoints:
+                    self._endpoints[entry.node_name] = entry
+
+    # wait until at least count pods are known, watching for new ones. Returns False on timeout
+    def wait_for_pods(self, count, timeout):
+        self.watch()
+        deadline = time.time() + timeout
+        while True:
+            with self._cond:
+                if len(self._pods) >= count:
+                    return True
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                if 'pods' not in self._forbidden:
+                    self._cond.wait(remaining)
+                    continue
+            # no watch events: relist the pods
+            time.sleep(min(WATCH_RETRY, remaining))
+            self.sync(('pods',))
+
+    def pod(self, name):
+        with self._cond:
+            return self._pods.get(name)
+
+    def pods(self):
+        with self._cond:
+            return list(self._pods.values())
+
+    def nodes(self):
+        with self._cond:
+            return list(self._node_pod.keys())
+
+    def pod_on_node(self, node):
+        with self._cond:
+            name = self._node_pod.get(node)
+            return self._pods.get(name) if name else None
+
+    def interfaces(self, node):
+        entry = self.pod_on_node(node)
+        return entry.interfaces if entry else {}
+
+    def endpoint(self, node):
+        with self._cond:
+            return self._endpoints.get(node)
+
+    def endpoints(self):
+        with self._cond:
+            return list(self._endpoints.values())
+
+    def _after_fork_in_child(self):
+        # the watch threads do not survive a fork: the child starts from the parent's snapshot
+        self._cond = threading.Condition()
+        self._watching = False
+
+
+_inventories = {}
+
+
+def get_inventory(namespace=None, label_selector='app=autopilot', service='autopilot-healthchecks'):
+    namespace = namespace or os.getenv('NAMESPACE')
+    key = (namespace, label_selector, service)
+    if key not in _inventories:
+        _inventories[key] = Inventory(namespace, label_selector, service)
+    return _inventories[key]
+
+
+# a fork never happens in the middle of a cache update
+def _lock_before_fork():
+    for inv in _inventories.values():
+        inv._cond.acquire()
+
+
+def _unlock_after_fork():
+    for inv in _inventories.values():
+        inv._cond.release()
+
+
+def _reset_after_fork():
+    for inv in _inventories.values():
+        inv._after_fork_in_child()
+
+
+os.register_at_fork(before=_lock_before_fork, after_in_parent=_unlock_after_fork, after_in_child=_reset_after_fork)
@@ -0,0 +1,96 @@
+##################################################################################
+# Cache of the briefings.sh preflight, shared by the GPU health checks.
+# The checks of a cycle (pciebw, remapped, gpumem, dcgm, gpupower) all run the
+# same briefings, which call nvidia-smi twice and dcgmi once. The first check
+# runs the script and stores its output in a file; the others reuse it for
+# PREFLIGHT_TTL seconds, as long as the node did not reboot and the driver did
+# not change (boot_id and driver version are the cache key).
+# An flock serializes the checks, so concurrent checks run the script only once.
+#
+# Hits, misses and the seconds saved by the hits are kept in the same file:
+#   python3 utils/preflight.py           prints the briefings output, as briefings.sh
+#   python3 utils/preflight.py --stats   prints the counters as JSON
+##################################################################################
+import argparse
+import fcntl
+import json
+import os
+import subprocess
+import sys
+import time
+
+BRIEFINGS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'briefings.sh')
+CACHE_FILE = '/tmp/autopilot-preflight.json'
+LOCK_FILE = CACHE_FILE + '.lock'
+BOOT_ID = '/proc/sys/kernel/random/boot_id'
+DRIVER_VERSION = '/sys/module/nvidia/version'
+PREFLIGHT_TTL = float(os.getenv('PREFLIGHT_TTL') or 300) # seconds
+
+
+def read_first_line(path):
+    try:
+        with open(path) as f:
+            return f.readline().strip()
+    except OSError:
+        return ''
+
+
+def cache_key():
+    return read_first_line(BOOT_ID) + '/' + read_first_line(DRIVER_VERSION)
+
+
+def load(cache_file):
+    try:
+        with open(cache_file) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'hits': 0, 'misses': 0, 'saved': 0.0}
+
+
+def save(cache_file, cache):
+    tmp = cache_file + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(cache, f)
+    os.replace(tmp, cache_file)
+
+
+def briefings(ttl=PREFLIGHT_TTL, cache_file=CACHE_FILE, lock_file=LOCK_FILE):
+    '''
+    Returns the output of briefings.sh, from the cache when it is fresh.
+    A ttl of 0 always runs the script.
+    '''
+    with open(lock_file, 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        cache = load(cache_file)
+        key = cache_key()
+        age = time.time() - cache.get('time', 0)
+        if cache.get('key') == key and 0 <= age < ttl:
+            cache['hits'] += 1
+            cache['saved'] += cache['duration']
+            save(cache_file, cache)
+            print('[[ PREFLIGHT ]] Cache hit (%.0fs old). Hits: %d, misses: %d, saved: %.1fs' % (age, cache['hits'], cache['misses'], cache['saved']), file=sys.stderr)
+            return cache['output']
+
+        start = time.time()
+        output = subprocess.run(['bash', BRIEFINGS], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True).stdout
+        cache.update({'key': key, 'time': time.time(), 'duration': time.time() - start, 'output': output})
+        cache['misses'] += 1
+        save(cache_file, cache)
+        print('[[ PREFLIGHT ]] Cache miss, briefings took %.1fs. Hits: %d, misses: %d, saved: %.1fs' % (cache['duration'], cache['hits'], cache['misses'], cache['saved']), file=sys.stderr)
+        return output
+
+
+def stats(cache_file=CACHE_FILE):
+    cache = load(cache_file)
+    return {'hits': cache['hits'], 'misses': cache['misses'], 'saved': cache['saved']}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--stats', action='store_true', help='Print the hit and miss counters of the cache as JSON.')
+    parser.add_argument('--ttl', type=float, default=PREFLIGHT_TTL, help='Seconds a cached result is used for. Default is PREFLIGHT_TTL or 300.')
+    args = parser.parse_args()
+    if args.stats:
+        print(json.dumps(stats()))
+    else:
+        print(briefings(args.ttl), end='')
@@ -5,15 +5,19 @@
 # Image: us.icr.io/cil15-shared-registry/gracek/run-healthchecks:3.0.1
 ##################################################################################
 import argparse
+import json
 import os
 import time
 import asyncio
 import aiohttp
-from itertools import islice
 import pprint
+import sys
 from kubernetes import client, config
 from kubernetes.client.rest import ApiException
 from multiprocessing import Pool
+from checkresult import RESULT_PREFIX, FAIL, ABORT, ERR
+from inventory import get_inventory, list_all
+from fanout import sliding_window
 
 # load in cluster kubernetes config for access to cluster
 config.load_incluster_config()
@@ -29,7 +33,11 @@ parser.add_argument('--nodes', type=str, default='all', help='Node(s) that will
 
 parser.add_argument('--check', type=str, default='all', help='The specific test(s) that will run: \"all\", \"pciebw\", \"dcgm\", \"remapped\", \"ping\", \"gpumem\", \"pvc\" or \"gpupower\". Default is \"all\". Can be a comma separated list.')
 
-parser.add_argument('--batchSize', default='0', type=str, help='Number of nodes to check in parallel. Default is set to the number of the worker nodes.')
+parser.add_argument('--batchSize', default='0', type=str, help='Number of nodes to check in parallel. A new node is started as soon as one completes, so that this many requests are always in flight. Default is set to the number of the worker nodes.')
+
+parser.add_argument('--order', type=str, default='none', choices=['none', 'longest'], help='Order in which nodes are dispatched. "longest" starts first the nodes expected to take longer, based on previous runs or on the checks requested. Default is "none".')
+
+parser.add_argument('--durations', type=str, default='/tmp/autopilot-healthchecks-durations.json', help='File where the duration of each node check is recorded and read back by --order=longest. Default is "/tmp/autopilot-healthchecks-durations.json".')
 
 parser.add_argument('--wkload', type=str, default='None', help='Workload node discovery w/ given namespace and label. Ex: \"--wkload=namespace:label-key=label-value\". Default is set to None.')
 
@@ -37,38 +45,65 @@ parser.add_argument('--dcgmR', type=str, default='1', help='Run a diagnostic in
 
 parser.add_argument('--nodelabel', type=str, default='None', help='Node label to select nodes. Ex: \"label-key=label-value\". Default is set to None.')
 
+parser.add_argument('--output', type=str, default='text', choices=['text', 'ndjson'], help='Output format. \"ndjson\" prints one JSON record per node as soon as it completes, followed by a summary record. Default is \"text\".')
+
 args = vars(parser.parse_args())
 service = args['service']
 namespace = args['namespace']
 node = args['nodes'].replace(' ', '').split(',') # list of nodes
 checks = args['check'].replace(' ', '').split(',') # list of checks
 batch_size = int(args['batchSize'])
+order = args['order']
+durations_file = args['durations']
 nodelabel = args['nodelabel']
+output_format = args['output']
+
+# in ndjson mode stdout only carries the records: messages go to stderr
+def log(*values):
+    print(*values, file=sys.stdout if output_format == 'text' else sys.stderr)
+
+# stop before checking any node. In ndjson mode the reason is streamed as an error record
+def abort(*values):
+    log(*values)
+    if output_format == 'ndjson':
+        print(json.dumps({'type': 'error', 'message': ' '.join(str(v) for v in values).strip()}), flush=True)
+    exit()
+
 wkload = args['wkload']
 if wkload != 'None':
     wkload = args['wkload'].split(':') 
     if '' in wkload:
-        print("Invalid job definition, must be namespace:label=value. Got",wkload)
-        exit()
+        abort("Invalid job definition, must be namespace:label=value. Got",wkload)
 
 if ((wkload != "None") or (nodelabel != "None")) and (args['nodes'] == 'all'):
     node = []
 
+# rough duration (seconds) of each check, used to order the nodes when there is no history for them
+EXPECTED_CHECK_DURATION = {
+    'pciebw': 60,
+    'remapped': 10,
+    'ping': 60,
+    'gpumem': 60,
+    'gpupower': 10,
+    'pvc': 90,
+    'dcgm': {'1': 60, '2': 150, '3': 900, '4': 3600},
+}
+
 # debug: runtime
 start_time = time.time()
 
 def find_labeled_nodes():
     try:
-        labeled_nodes = v1.list_node(label_selector=nodelabel)
+        labeled_nodes, _ = list_all(v1.list_node, label_selector=nodelabel)
     except ApiException as e:
-        print("Exception when calling CoreV1Api->list_node: %s\n" % e)
-        exit()
-    if len(labeled_nodes.items) == 0:
-        print ("No node is labeled with", nodelabel, " - ABORT.")
-        exit()
-    for labeled_node in labeled_nodes.items:
+        abort("Exception when calling CoreV1Api->list_node: %s\n" % e)
+    if len(labeled_nodes) == 0:
+        abort("No node is labeled with", nodelabel, " - ABORT.")
+    selected = set(node)
+    for labeled_node in labeled_nodes:
         node_name = labeled_node.metadata.name
-        if node_name not in node:
+        if node_name not in selected:
+            selected.add(node_name)
             node.append(node_name)
 
 # find workload addresses
@@ -78,23 +113,23 @@ def find_wkload():
     wkload_ns = wkload[0] # ex: "default"
     wkload_label = wkload[1] # ex: "job-name=my-job" or "app=my-app"
     try:
-        wkload_pods = v1.list_namespaced_pod(namespace=wkload_ns, label_selector=wkload_label)
+        # pods not scheduled yet have no node to check
+        wkload_pods, _ = list_all(v1.list_namespaced_pod, namespace=wkload_ns, label_selector=wkload_label, field_selector='spec.nodeName!=')
     except ApiException as e:
-        print("Exception when calling CoreV1Api->list_namespaced_pod: %s\n" % e)
-        exit()
-    print('Workload:', ': '.join(wkload))
-    if len(wkload_pods.items) == 0: 
-        print("No workload labeled with", wkload_label, "- ABORT.")
-        exit()
-    for pod in wkload_pods.items:
+        abort("Exception when calling CoreV1Api->list_namespaced_pod: %s\n" % e)
+    log('Workload:', ': '.join(wkload))
+    if len(wkload_pods) == 0: 
+        abort("No workload labeled with", wkload_label, "- ABORT.")
+    selected = set(node)
+    for pod in wkload_pods:
         node_name = pod.spec.node_name
-        if node_name not in node:
+        if node_name not in selected:
+            selected.add(node_name)
             node.append(node_name)
         else:
             copy = True
     if (len(node) == node_len) and not copy:
-        print('Error: Issue with --wkload parameter.\nMake sure your workload is spelled correctly and exists in the cluster. ABORT')
-        exit()
+        abort('Error: Issue with --wkload parameter.\nMake sure your workload is spelled correctly and exists in the cluster. ABORT')
 
 
 # get addresses in desired endpointslice (autopilot-healthchecks) based on which node(s) the user chooses
@@ -102,28 +137,20 @@ def get_addresses():
     global server_address
     server_address = ''
     try:
-        endpoints = v1.list_namespaced_endpoints(namespace=namespace)
+        addresses = get_inventory(namespace, service=service).ensure_synced(('endpointslices',)).endpoints()
     except ApiException as e:
-        print("Exception when calling CoreV1Api->list_namespaced_endpoints: %s\n" % e)
-        exit()
-    for endpointslice in endpoints.items:
-        if endpointslice.metadata.name == service:
-            # print("EndpointSlice: " + str(endpointslice.metadata.name)) 
-            addresses = endpointslice.subsets[0].addresses
-            if node[0] == 'all':
-                # server_address = [addresses[0], addresses[len(addresses)-1]]
-                return addresses
-            else:
-                address_list = []
-                for address in addresses:
-                    if address.node_name in node:
-                        address_list.append(address)
-                    else:
-                        server_address = address
-                if len(address_list) > 0:
-                    return address_list
-                # if server_address == '': # when all nodes are being tested / there's only one node
-                #     print('Iperf test cannot be completed')
+        abort("Exception when calling DiscoveryV1Api->list_namespaced_endpoint_slice: %s\n" % e)
+    if node[0] == 'all':
+        return addresses
+    selected = set(node)
+    address_list = []
+    for address in addresses:
+        if address.node_name in selected:
+            address_list.append(address)
+        else:
+            server_address = address
+    if len(address_list) > 0:
+        return address_list
 
 # create url for test
 def create_url(address, daemon_node):
@@ -145,67 +172,149 @@ def create_url(address, daemon_node):
     urls.append('http://' + str(address.ip) + ':3333/status?host=' + daemon_node + '&check=' + args['check'] + extra_params)
     return urls
 
-# check and print status of each node
+# node status reported for each failing check
+CHECK_FAILURE = {
+    'pciebw': 'PCIE Failed',
+    'remapped': 'REMAPPED ROWS Failed',
+    'dcgm': 'DCGM Failed',
+    'gpupower': 'GPU POWER Failed',
+    'ping': 'PING Failed',
+    'gpumem': 'GPU MEM Test Failed',
+    'pvc': 'PVC Create-Delete Test Failed',
+}
+
+# check and print status of each node.
+# Checks reporting a result record are classified from its status. The text of the checks
+# that do not (or of daemons older than the record protocol) is scanned for FAIL/ABORT lines.
 def get_node_status(responses):
     node_status_list = []
+    text_status_list = []
+    recorded = set()
     for response in responses:
         response_list = response.split('\n')
         for line in response_list:
-            if (('FAIL' in line) or ('ABORT' in line)):
+            if line.startswith(RESULT_PREFIX):
+                try:
+                    record = json.loads(line[len(RESULT_PREFIX):])
+                except ValueError:
+                    continue
+                recorded.add(CHECK_FAILURE.get(record['check']))
+                if record['status'] in (FAIL, ABORT, ERR):
+                    node_status_list.append(CHECK_FAILURE.get(record['check'], record['check'] + ' Failed'))
+            elif (('FAIL' in line) or ('ABORT' in line)):
                 if ('PCIE' in line):
-                    node_status_list.append('PCIE Failed')
+                    text_status_list.append('PCIE Failed')
                 elif('REMAPPED ROWS' in line):
-                    node_status_list.append('REMAPPED ROWS Failed')
+                    text_status_list.append('REMAPPED ROWS Failed')
                 elif('DCGM' in line):
-                    node_status_list.append('DCGM Failed')
+                    text_status_list.append('DCGM Failed')
                 elif('GPU POWER' in line):
-                    node_status_list.append('GPU POWER Failed')
+                    text_status_list.append('GPU POWER Failed')
                 elif('PING' in line):
-                    node_status_list.append('PING Failed')
+                    text_status_list.append('PING Failed')
                 elif('GPU-MEM' in line):
-                    node_status_list.append("GPU MEM Test Failed")
+                    text_status_list.append("GPU MEM Test Failed")
                 elif('PVC' in line):
-                    node_status_list.append("PVC Create-Delete Test Failed")
+                    text_status_list.append("PVC Create-Delete Test Failed")
                 elif('Disconnected' in line):
-                    node_status_list.append('Connection to Server Failed')
+                    text_status_list.append('Connection to Server Failed')
+    node_status_list.extend(status for status in text_status_list if status not in recorded)
 
     if len(node_status_list) < 1:
         node_status_list.append('OK')
     return node_status_list
 
-async def makeconnection(address):
+# history of previous runs, as {check string: {node: seconds}}
+def load_durations():
+    try:
+        with open(durations_file) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_durations(history, node_durations):
+    history.setdefault(durations_key(), {}).update(node_durations)
+    try:
+        with open(durations_file, 'w') as f:
+            json.dump(history, f)
+    except OSError as e:
+        print("Cannot record check durations in", durations_file, ":", e, file=sys.stderr)
+
+def durations_key():
+    return args['check'] + ';r=' + args['dcgmR']
+
+def expected_duration(history, daemon_node):
+    previous = history.get(durations_key(), {}).get(daemon_node)
+    if previous is not None:
+        return previous
+    requested = checks
+    if 'all' in checks:
+        requested = os.getenv('PERIODIC_CHECKS', 'pciebw,remapped,dcgm,ping,gpupower').split(',')
+    total = 0
+    for check in requested:
+        estimate = EXPECTED_CHECK_DURATION.get(check, 0)
+        if isinstance(estimate, dict):
+            estimate = estimate.get(args['dcgmR'], estimate['1'])
+        total += estimate
+    return total
+
+async def makeconnection(session, address):
     daemon_node = str(address.node_name)
+    start = time.time()
     pid = os.getpid()
     url = create_url(address, daemon_node)
     output = '\nAutopilot Endpoint: {ip}\nNode: {daemon_node}\nurl(s): {url}'.format(ip=address.ip, daemon_node=daemon_node, url='\n        '.join(url))
-    print(f"Initiated connection to {url}.")
-    total_timeout=aiohttp.ClientTimeout(total=60*60*24)
+    log(f"Initiated connection to {url}.")
     try:
-        async with aiohttp.ClientSession(timeout=total_timeout) as session:
-            async with session.get(url[0]) as resp:
-                reply = await resp.text()
+        async with session.get(url[0]) as resp:
+            reply = await resp.text()
     except aiohttp.client_exceptions.ServerDisconnectedError:
-        print("Server Disconnected")
+        log("Server Disconnected")
         reply = "Server Disconnected. ABORT"
 
     response=[reply]
     node_status_list = get_node_status(response)
     output += '\nResponse:\n{response}\nNode Status: {status}\n-------------------------------------\n'.format(response='~~\n'.join(response), status=', '.join(node_status_list))
     # output += "\n-------------------------------------\n" # separator
-    return output, pid, daemon_node, node_status_list
+    return output, pid, daemon_node, node_status_list, time.time() - start
+
+# sliding window over the nodes on a single connection pool (utils/fanout.py).
+# Each result is handed to on_result as soon as the node completes.
+async def main(addresses, batch_size, on_result):
+    await sliding_window(addresses, batch_size, makeconnection, on_result)
 
+# print one record per node while the sweep is running. Only the names of the failing nodes
+# are kept, so memory does not grow with the size of the responses
+class NodeRecordStream:
+    def __init__(self):
+        self.completed = 0
+        self.failed_nodes = []
+        self.node_durations = {}
 
-async def main(addresses):
-    res = await asyncio.gather(*(makeconnection(addr) for addr in addresses))
-    return res
+    def __call__(self, res):
+        result, pid, daemon_node, node_status_list, duration = res
+        self.completed += 1
+        self.node_durations[daemon_node] = duration
+        if node_status_list != ['OK']:
+            self.failed_nodes.append(daemon_node)
+        record = {
+            'type': 'node',
+            'node': daemon_node,
+            'status': node_status_list,
+            'duration': round(duration, 3),
+            'output': result,
+        }
+        print(json.dumps(record), flush=True)
 
-def batch_of_nodes(nodelist, batch_size):
-    it = iter(nodelist)
-    while True:
-        batch = list(islice(it, batch_size))
-        if not batch:
-            break
-        yield batch
+    def summary(self, total_nodes):
+        return {
+            'type': 'summary',
+            'nodes': total_nodes,
+            'completed': self.completed,
+            'failed': len(self.failed_nodes),
+            'failed_nodes': self.failed_nodes,
+            'runtime': round(time.time() - start_time, 3),
+        }
 
 # start program
 if __name__ == "__main__":
@@ -215,6 +324,8 @@ if __name__ == "__main__":
     if nodelabel != 'None':
         find_labeled_nodes()
     addresses = get_addresses()
+    if addresses is None:
+        abort("No autopilot endpoint found on the selected node(s) - ABORT.")
     total_nodes = len(addresses)
     node_status = {} # updates after each node is tested
     pids_tups = [] # debug: process list
@@ -222,15 +333,27 @@ if __name__ == "__main__":
 
     if batch_size == 0 or batch_size > total_nodes:
         batch_size = total_nodes
-    asyncres = []
+    history = load_durations()
+    if order == 'longest':
+        addresses = sorted(addresses, key=lambda address: expected_duration(history, str(address.node_name)), reverse=True)
 
-    for b in batch_of_nodes(addresses, batch_size):
-        asyncres.extend(asyncio.run(main(b)))
+    if output_format == 'ndjson':
+        stream = NodeRecordStream()
+        asyncio.run(main(addresses, batch_size, stream))
+        save_durations(history, stream.node_durations)
+        print(json.dumps(stream.summary(total_nodes)), flush=True)
+        exit()
+
+    asyncres = []
+    asyncio.run(main(addresses, batch_size, asyncres.append))
 
-    for result, pid, daemon_node, node_status_list in asyncres:
+    node_durations = {}
+    for result, pid, daemon_node, node_status_list, duration in asyncres:
         pids_tups.append((pid, daemon_node))
         node_status[daemon_node] = node_status_list
+        node_durations[daemon_node] = duration
         print(result)
+    save_durations(history, node_durations)
     
     print("Node Summary:\n")
     pprint.pprint(node_status)